@@ -0,0 +1,227 @@
+"""Automatic technician assignment.
+
+Field teams have a ``base_location`` (GeoJSON point with a 2dsphere index),
+``skills`` (the package types they service) and ``max_jobs_per_day``.
+``auto_assign`` takes a batch of confirmed, unassigned bookings and gives each
+the cheapest eligible technician. Cost is the distance from the technician's
+base plus ``ASSIGN_LOAD_PENALTY_KM`` for every job they already have that day.
+A technician is never given two jobs in the same service_date/service_time
+slot, nor more than ``max_jobs_per_day``, nor one further than
+``ASSIGN_MAX_DISTANCE_KM`` away.
+
+A batch costs the same handful of round trips whatever its size; scoring is
+vectorised over all candidate technicians with NumPy.
+
+    python assignment.py [--date 2025-01-31] [--limit 500] [--dry-run]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from pymongo import UpdateOne
+
+from booking_queries import fetch_by_ids
+from booking_state import OPEN_STATUSES
+from etags import stamp
+from geo import EARTH_RADIUS_KM, haversine_km, point_lat_lng
+
+ASSIGN_MAX_DISTANCE_KM = float(os.environ.get('ASSIGN_MAX_DISTANCE_KM', '25'))
+ASSIGN_LOAD_PENALTY_KM = float(os.environ.get('ASSIGN_LOAD_PENALTY_KM', '5'))
+DEFAULT_MAX_JOBS_PER_DAY = 6
+PACKAGE_TYPES = ("manual", "automated")
+
+BOOKING_PROJECTION = {"_id": 0, "id": 1, "address_id": 1, "service_date": 1, "service_time": 1, "package_type": 1}
+TECHNICIAN_PROJECTION = {"_id": 0, "id": 1, "base_location": 1, "skills": 1, "max_jobs_per_day": 1}
+
+
+def plan_assignments(
+    bookings: List[dict],
+    technicians: List[dict],
+    load: Dict[Tuple[str, str, str], int],
+    max_distance_km: float = ASSIGN_MAX_DISTANCE_KM,
+    load_penalty_km: float = ASSIGN_LOAD_PENALTY_KM
+) -> Tuple[List[dict], List[dict]]:
+    """Greedily assign ``bookings`` (with ``lat``/``lng``) to ``technicians``.
+
+    ``load`` counts existing jobs per (technician id, service_date,
+    service_time). Returns (assignments, unassigned), each a list of dicts.
+    """
+    located = [t for t in technicians if point_lat_lng(t.get("base_location"))]
+    tech_ids = [t["id"] for t in located]
+    index = {tech_id: i for i, tech_id in enumerate(tech_ids)}
+    coords = np.array([point_lat_lng(t["base_location"]) for t in located], dtype=float).reshape(-1, 2)
+    capacity = np.array([t.get("max_jobs_per_day") or DEFAULT_MAX_JOBS_PER_DAY for t in located])
+    # Technicians without a skills list predate skills and take any package
+    skilled = {
+        package: np.array([package in (t.get("skills") or PACKAGE_TYPES) for t in located], dtype=bool)
+        for package in PACKAGE_TYPES
+    }
+    anyone = np.ones(len(located), dtype=bool)
+
+    day_load: Dict[str, np.ndarray] = {}
+    slot_busy: Dict[Tuple[str, str], np.ndarray] = {}
+    for (tech_id, day, slot), count in load.items():
+        i = index.get(tech_id)
+        if i is None or not count:
+            continue
+        day_load.setdefault(day, np.zeros(len(located), dtype=int))[i] += count
+        slot_busy.setdefault((day, slot), np.zeros(len(located), dtype=bool))[i] = True
+
+    assignments, unassigned = [], []
+    ordered = []
+    for booking in sorted(bookings, key=lambda b: (b.get("service_date") or "", b.get("service_time") or "", b["id"])):
+        if booking.get("lat") is None or booking.get("lng") is None:
+            unassigned.append({"booking_id": booking["id"], "reason": "no_location"})
+        elif not located:
+            unassigned.append({"booking_id": booking["id"], "reason": "no_technician"})
+        else:
+            ordered.append(booking)
+    if not ordered:
+        return assignments, unassigned
+
+    # Every booking-to-technician distance in one vectorised call
+    booking_coords = np.array([(b["lat"], b["lng"]) for b in ordered], dtype=float)
+    distances = haversine_km(booking_coords[:, :1], booking_coords[:, 1:], coords[:, 0], coords[:, 1])
+
+    for row, booking in enumerate(ordered):
+
+        day, slot = booking.get("service_date"), booking.get("service_time")
+        todays = day_load.setdefault(day, np.zeros(len(located), dtype=int))
+        busy = slot_busy.setdefault((day, slot), np.zeros(len(located), dtype=bool))
+
+        distance = distances[row]
+        eligible = skilled.get(booking.get("package_type"), anyone) & ~busy & (todays < capacity) & (distance <= max_distance_km)
+        if not eligible.any():
+            unassigned.append({"booking_id": booking["id"], "reason": "no_technician"})
+            continue
+
+        cost = np.where(eligible, distance + load_penalty_km * todays, np.inf)
+        best = int(np.argmin(cost))
+        todays[best] += 1
+        busy[best] = True
+        assignments.append({
+            "booking_id": booking["id"],
+            "technician_id": tech_ids[best],
+            "distance_km": round(float(distance[best]), 2),
+            "service_date": day,
+            "service_time": slot,
+        })
+    return assignments, unassigned
+
+
+async def _nearby_technicians(db, bookings: List[dict], max_distance_km: float) -> List[dict]:
+    """Active technicians that can reach any booking in the batch, via the 2dsphere index"""
+    located = np.array([(b["lat"], b["lng"]) for b in bookings if b.get("lat") is not None and b.get("lng") is not None])
+    if not len(located):
+        return []
+    center_lat, center_lng = located.mean(axis=0)
+    spread = float(haversine_km(center_lat, center_lng, located[:, 0], located[:, 1]).max())
+    radius = min(spread + max_distance_km, np.pi * EARTH_RADIUS_KM)
+    return await db.field_teams.find({
+        "active": {"$ne": False},
+        "base_location": {"$geoWithin": {"$centerSphere": [[float(center_lng), float(center_lat)], radius / EARTH_RADIUS_KM]}}
+    }, TECHNICIAN_PROJECTION).to_list(None)
+
+
+async def _current_load(db, tech_ids: List[str], days: List[str]) -> Dict[Tuple[str, str, str], int]:
+    if not tech_ids or not days:
+        return {}
+    rows = await db.bookings.aggregate([
+        {"$match": {
+            "assigned_technician_id": {"$in": tech_ids},
+            "status": {"$in": list(OPEN_STATUSES)},
+            "service_date": {"$in": days}
+        }},
+        {"$group": {
+            "_id": {"t": "$assigned_technician_id", "d": "$service_date", "s": "$service_time"},
+            "count": {"$sum": 1}
+        }}
+    ]).to_list(None)
+    return {(row["_id"]["t"], row["_id"]["d"], row["_id"]["s"]): row["count"] for row in rows}
+
+
+async def auto_assign(db, service_date: Optional[str] = None, limit: int = 500, dry_run: bool = False) -> dict:
+    """Assign up to ``limit`` confirmed, unassigned bookings (optionally for one day).
+
+    With ``dry_run`` the plan is returned without writing. Otherwise each
+    booking is assigned only if it is still confirmed and unassigned, and
+    ``applied`` lists the bookings actually updated.
+    """
+    started = time.perf_counter()
+    query = {"status": "confirmed", "assigned_technician_id": None}
+    if service_date:
+        query["service_date"] = service_date
+    bookings = await db.bookings.find(query, BOOKING_PROJECTION).sort(
+        [("service_date", 1), ("service_time", 1)]
+    ).limit(limit).to_list(limit)
+
+    addresses = await fetch_by_ids(db.addresses, (b["address_id"] for b in bookings), {"_id": 0, "id": 1, "lat": 1, "lng": 1})
+    for booking in bookings:
+        address = addresses.get(booking["address_id"]) or {}
+        booking["lat"], booking["lng"] = address.get("lat"), address.get("lng")
+
+    technicians = await _nearby_technicians(db, bookings, ASSIGN_MAX_DISTANCE_KM)
+    load = await _current_load(db, [t["id"] for t in technicians], sorted({b["service_date"] for b in bookings}))
+    assignments, unassigned = plan_assignments(bookings, technicians, load)
+
+    applied = []
+    if assignments and not dry_run:
+        await db.bookings.bulk_write([
+            UpdateOne(
+                {"id": a["booking_id"], "status": "confirmed", "assigned_technician_id": None},
+                stamp({"$set": {"assigned_technician_id": a["technician_id"]}})
+            )
+            for a in assignments
+        ], ordered=False)
+        # Read back which writes won (a booking may have been changed meanwhile)
+        planned = {a["booking_id"]: a["technician_id"] for a in assignments}
+        applied = [
+            b for b in await db.bookings.find(
+                {"id": {"$in": list(planned)}},
+                {"_id": 0, "id": 1, "user_id": 1, "assigned_technician_id": 1, "status": 1, "version": 1}
+            ).to_list(len(planned))
+            if b.get("assigned_technician_id") == planned[b["id"]]
+        ]
+
+    return {
+        "dry_run": dry_run,
+        "considered": len(bookings),
+        "assignments": assignments,
+        "unassigned": unassigned,
+        "applied": applied,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+async def _main(args) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True, tzinfo=timezone.utc)
+    db = client[os.environ['DB_NAME']]
+    try:
+        result = await auto_assign(db, args.date, args.limit, args.dry_run)
+        verb = "Would assign" if args.dry_run else "Assigned"
+        count = len(result["assignments"]) if args.dry_run else len(result["applied"])
+        print(f"{verb} {count} of {result['considered']} booking(s), "
+              f"{len(result['unassigned'])} left unassigned, in {result['elapsed_ms']} ms")
+        for a in result["assignments"]:
+            print(f"  {a['booking_id']} -> {a['technician_id']} ({a['distance_km']} km, {a['service_date']} {a['service_time']})")
+        return 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Assign confirmed bookings to nearby technicians")
+    parser.add_argument("--date", help="only bookings for this service_date (YYYY-MM-DD)")
+    parser.add_argument("--limit", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    sys.exit(asyncio.run(_main(parser.parse_args())))
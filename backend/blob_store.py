@@ -0,0 +1,211 @@
+"""Content-addressed media storage.
+
+Blobs are keyed by the SHA-256 of their bytes, so uploading the same photo
+twice stores it once. Two backends: GridFS (default, keeps media next to the
+data) and the local filesystem (``MEDIA_BACKEND=local``, ``MEDIA_ROOT``).
+Blobs are served by ``GET /api/media/{hash}``; a blob stored with a
+thumbnail also has ``GET /api/media/{hash}/thumbnail``.
+"""
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import AsyncIterator, Optional, Tuple
+
+from bson import ObjectId
+from gridfs.errors import FileExists
+
+CHUNK_SIZE = 256 * 1024
+
+HASH_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+DATA_URL_PATTERN = re.compile(r"^data:(?P<mime>[\w.+-]+/[\w.+-]+)?(;[\w-]+=[\w.-]+)*;base64,(?P<data>.*)$", re.DOTALL)
+
+
+class BlobNotFound(Exception):
+    pass
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def decode_data_url(url: str) -> Optional[Tuple[bytes, str]]:
+    """Return (bytes, content type) for a base64 ``data:`` URL, else None"""
+    match = DATA_URL_PATTERN.match(url)
+    if not match:
+        return None
+    try:
+        return base64.b64decode(match.group("data")), match.group("mime") or "application/octet-stream"
+    except (binascii.Error, ValueError):
+        return None
+
+
+def media_url(blob_hash: str) -> str:
+    return f"{os.environ.get('MEDIA_BASE_URL', '')}/api/media/{blob_hash}"
+
+
+class BlobInfo:
+    def __init__(self, blob_hash: str, size: int, content_type: str, thumbnail: Optional[str] = None):
+        self.hash = blob_hash
+        self.size = size
+        self.content_type = content_type
+        self.thumbnail = thumbnail
+
+
+class GridFSBlobStore:
+    """Dedup relies on the unique ``filename`` index on ``media.files`` (see db_indexes.py)"""
+
+    def __init__(self, db, bucket_name: str = "media"):
+        from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+
+        self.files = db[f"{bucket_name}.files"]
+        self.chunks = db[f"{bucket_name}.chunks"]
+        self.bucket = AsyncIOMotorGridFSBucket(db, bucket_name=bucket_name)
+
+    async def put(self, data: bytes, content_type: str, thumbnail: Optional[str] = None) -> str:
+        """Store ``data`` unless already present. ``thumbnail`` is the hash of its thumbnail blob."""
+        blob_hash = content_hash(data)
+        if await self.files.find_one({"filename": blob_hash}, {"_id": 1}) is None:
+            metadata = {"content_type": content_type}
+            if thumbnail:
+                metadata["thumbnail"] = thumbnail
+            file_id = ObjectId()
+            try:
+                await self.bucket.upload_from_stream_with_id(file_id, blob_hash, data, metadata=metadata)
+                return blob_hash
+            except FileExists:
+                # A concurrent upload of the same bytes stored it first (the
+                # driver's name for the duplicate key). The files document is
+                # written last, so only our chunks are left.
+                await self.chunks.delete_many({"files_id": file_id})
+        if thumbnail:
+            await self.files.update_one({"filename": blob_hash}, {"$set": {"metadata.thumbnail": thumbnail}})
+        return blob_hash
+
+    async def info(self, blob_hash: str) -> BlobInfo:
+        doc = await self.files.find_one({"filename": blob_hash}, {"length": 1, "metadata": 1})
+        if doc is None:
+            raise BlobNotFound(blob_hash)
+        metadata = doc.get("metadata") or {}
+        return BlobInfo(blob_hash, doc["length"], metadata.get("content_type", "application/octet-stream"), metadata.get("thumbnail"))
+
+    async def stream(self, blob_hash: str, start: int, end: int) -> AsyncIterator[bytes]:
+        """Yield bytes ``start``..``end`` inclusive"""
+        grid_out = await self.bucket.open_download_stream_by_name(blob_hash)
+        grid_out.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await grid_out.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+class LocalBlobStore:
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def _path(self, blob_hash: str) -> Path:
+        return self.root / blob_hash[:2] / blob_hash[2:4] / blob_hash
+
+    @staticmethod
+    def _write_file(path: Path, data: bytes):
+        """Write to a unique temp file, then rename over ``path``, so readers never
+        see a partial file and concurrent writers of the same blob do not collide"""
+        with tempfile.NamedTemporaryFile(dir=path.parent, prefix=path.name, suffix=".tmp", delete=False) as f:
+            tmp = f.name
+            try:
+                f.write(data)
+            except BaseException:
+                f.close()
+                os.unlink(tmp)
+                raise
+        os.replace(tmp, path)
+
+    def _write_metadata(self, path: Path, metadata: dict):
+        self._write_file(path.with_suffix(".json"), json.dumps(metadata).encode())
+
+    def _write(self, path: Path, data: bytes, metadata: dict):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Metadata first: info() finds a blob by its data file
+        self._write_metadata(path, metadata)
+        self._write_file(path, data)
+
+    def _put(self, path: Path, data: bytes, metadata: dict):
+        if not path.exists():
+            self._write(path, data, metadata)
+        elif "thumbnail" in metadata:
+            self._write_metadata(path, metadata)
+
+    async def put(self, data: bytes, content_type: str, thumbnail: Optional[str] = None) -> str:
+        """Store ``data`` unless already present. ``thumbnail`` is the hash of its thumbnail blob."""
+        blob_hash = content_hash(data)
+        metadata = {"content_type": content_type}
+        if thumbnail:
+            metadata["thumbnail"] = thumbnail
+        await asyncio.to_thread(self._put, self._path(blob_hash), data, metadata)
+        return blob_hash
+
+    def _info(self, blob_hash: str) -> BlobInfo:
+        path = self._path(blob_hash)
+        try:
+            size = path.stat().st_size
+            meta = json.loads(path.with_suffix(".json").read_text())
+        except FileNotFoundError:
+            raise BlobNotFound(blob_hash)
+        return BlobInfo(blob_hash, size, meta.get("content_type", "application/octet-stream"), meta.get("thumbnail"))
+
+    async def info(self, blob_hash: str) -> BlobInfo:
+        return await asyncio.to_thread(self._info, blob_hash)
+
+    async def stream(self, blob_hash: str, start: int, end: int) -> AsyncIterator[bytes]:
+        """Yield bytes ``start``..``end`` inclusive"""
+        def read_chunk(f, size):
+            return f.read(size)
+
+        f = await asyncio.to_thread(open, self._path(blob_hash), "rb")
+        with f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await asyncio.to_thread(read_chunk, f, min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+
+def blob_store_from_env(db):
+    if os.environ.get('MEDIA_BACKEND', 'gridfs') == 'local':
+        return LocalBlobStore(os.environ.get('MEDIA_ROOT', str(Path(__file__).parent / 'media')))
+    return GridFSBlobStore(db)
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single ``bytes=`` range. Returns (start, end) inclusive, or None
+    for no/unsupported range. Raises ValueError if unsatisfiable."""
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        start = int(first) if first else None
+        end = int(last) if last else None
+    except ValueError:
+        return None
+    if start is None:
+        if end is None:
+            return None
+        # Suffix range: the last `end` bytes
+        if end == 0:
+            raise ValueError(header)
+        return max(size - end, 0), size - 1
+    end = size - 1 if end is None else min(end, size - 1)
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, end
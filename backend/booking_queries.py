@@ -0,0 +1,51 @@
+"""Read-side helpers for booking list endpoints."""
+import asyncio
+from typing import Dict, Iterable, List
+
+
+async def fetch_by_ids(collection, ids: Iterable[str], projection: dict) -> dict:
+    """Load documents whose ``id`` is in ``ids`` with one ``$in`` query, keyed by id."""
+    ids = list({i for i in ids if i})
+    if not ids:
+        return {}
+    docs = await collection.find({"id": {"$in": ids}}, projection).to_list(len(ids))
+    return {doc['id']: doc for doc in docs}
+
+
+async def count_bookings(db, field: str, ids: Iterable[str], statuses: Iterable[str] = ()) -> Dict[str, dict]:
+    """Booking counts per value of ``field`` for ``ids``, with one ``$group``.
+
+    Each value maps to ``{"total": n}`` plus a count per status in
+    ``statuses``; ids without bookings are missing from the result.
+    """
+    ids = list({i for i in ids if i})
+    if not ids:
+        return {}
+    group = {"_id": f"${field}", "total": {"$sum": 1}}
+    for status in statuses:
+        group[status] = {"$sum": {"$cond": [{"$eq": ["$status", status]}, 1, 0]}}
+    rows = await db.bookings.aggregate([
+        {"$match": {field: {"$in": ids}}},
+        {"$group": group}
+    ]).to_list(None)
+    return {row.pop("_id"): row for row in rows}
+
+
+async def enrich_bookings(db, bookings: List[dict]) -> List[dict]:
+    """Attach customer, technician and address documents to each booking.
+
+    Uses three batched queries in total instead of three per booking.
+    """
+    customers, technicians, addresses = await asyncio.gather(
+        fetch_by_ids(db.users, (b['user_id'] for b in bookings), {"_id": 0, "password": 0}),
+        fetch_by_ids(db.field_teams, (b.get('assigned_technician_id') for b in bookings), {"_id": 0, "password": 0}),
+        fetch_by_ids(db.addresses, (b['address_id'] for b in bookings), {"_id": 0}),
+    )
+
+    for booking in bookings:
+        booking['customer'] = customers.get(booking['user_id'])
+        if booking.get('assigned_technician_id'):
+            booking['technician'] = technicians.get(booking['assigned_technician_id'])
+        booking['address'] = addresses.get(booking['address_id'])
+
+    return bookings
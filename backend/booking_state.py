@@ -0,0 +1,83 @@
+"""Booking state machine.
+
+Each transition is a single ``find_one_and_update`` whose filter includes the
+statuses it may start from, so checking and updating cannot race. Only when
+nothing matches is a second read made, to tell a missing booking (404)
+from one in the wrong state (409).
+"""
+from typing import NamedTuple, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+import rollups
+from etags import stamp
+
+STATUSES = ("pending", "confirmed", "in-progress", "escalated", "completed", "cancelled")
+OPEN_STATUSES = ("pending", "confirmed", "in-progress", "escalated")
+
+
+class Transition(NamedTuple):
+    sources: Tuple[str, ...]
+    target: Optional[str]  # None keeps the current status
+
+
+TRANSITIONS = {
+    "reschedule": Transition(OPEN_STATUSES, None),
+    "cancel": Transition(OPEN_STATUSES, "cancelled"),
+    "assign": Transition(OPEN_STATUSES, None),
+    "start": Transition(("confirmed",), "in-progress"),
+    "escalate": Transition(("confirmed", "in-progress", "escalated"), "escalated"),
+    "complete": Transition(("in-progress",), "completed"),
+    # Admin override: any status to any status, target given in set_fields
+    "set_status": Transition(STATUSES, None),
+}
+
+
+class BookingNotFound(Exception):
+    pass
+
+
+class InvalidTransition(Exception):
+    def __init__(self, name: str, status: str):
+        super().__init__(f"Cannot {name.replace('_', ' ')} a booking that is {status}")
+        self.name = name
+        self.status = status
+
+
+async def transition(db, name: str, query: dict, set_fields: Optional[dict] = None, push: Optional[dict] = None) -> dict:
+    """Apply transition ``name`` to the booking matching ``query`` and return the updated booking"""
+    return (await apply(db, name, query, set_fields, push))[1]
+
+
+async def apply(db, name: str, query: dict, set_fields: Optional[dict] = None,
+                push: Optional[dict] = None) -> Tuple[dict, dict]:
+    """``transition``, returning the booking both before and after the update"""
+    spec = TRANSITIONS[name]
+    set_fields = dict(set_fields or {})
+    if spec.target is not None:
+        set_fields["status"] = spec.target
+
+    update = {"$set": set_fields}
+    if push:
+        update["$push"] = push
+    update = stamp(update)
+
+    before = await db.bookings.find_one_and_update(
+        {**query, "status": {"$in": list(spec.sources)}},
+        update,
+        projection={"_id": 0},
+        return_document=ReturnDocument.BEFORE
+    )
+
+    if before is None:
+        current = await db.bookings.find_one(query, {"_id": 0, "status": 1})
+        if current is None:
+            raise BookingNotFound()
+        raise InvalidTransition(name, current.get('status'))
+
+    after = {**before, **update["$set"], "version": (before.get("version") or 0) + 1}
+    for field, value in (push or {}).items():
+        after[field] = (before.get(field) or []) + [value]
+
+    await rollups.record_transition(db, before, after)
+    return before, after
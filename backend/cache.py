@@ -0,0 +1,56 @@
+"""Short-lived in-process cache with single-flight computation.
+
+Concurrent callers asking for the same key while it is being computed await
+the one in-flight computation instead of starting their own.
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+
+class SingleFlightCache:
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._values: Dict[str, Tuple[float, Any]] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        cached = self._values.get(key)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+
+        inflight = self._inflight.get(key)
+        while inflight is not None:
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                # Only our own cancellation propagates; if the computing caller
+                # was cancelled, take over (or join whoever already has)
+                if not inflight.cancelled():
+                    raise
+            inflight = self._inflight.get(key)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await compute()
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so an error with no waiters is not logged as unhandled
+            future.exception()
+            raise
+        else:
+            self._values[key] = (time.monotonic() + self.ttl_seconds, value)
+            future.set_result(value)
+            return value
+        finally:
+            if not future.done():
+                # Cancelled (or another BaseException); release the waiters
+                future.cancel()
+            del self._inflight[key]
+
+    def invalidate(self, key: str = None):
+        if key is None:
+            self._values.clear()
+        else:
+            self._values.pop(key, None)
@@ -0,0 +1,64 @@
+"""Once-a-day background jobs, run inside the API workers.
+
+A ``DailyJob`` sleeps until ``hour`` UTC and then runs once for that day.
+Every worker runs the scheduler, but the first to insert the day's
+``job_runs`` document (``_id`` is name:day) is the only one that does the
+work. An ``hour`` outside 0-23 disables the job (e.g. ``-1`` where cron or
+another deployment already runs it).
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from pymongo.errors import DuplicateKeyError
+
+
+class DailyJob:
+    name = "daily_job"
+
+    def __init__(self, db, hour: int):
+        self.db = db
+        self.hour = hour
+        self._task: Optional[asyncio.Task] = None
+
+    async def run(self, day: str):
+        """The work for ``day`` (the UTC date the job runs on)"""
+        raise NotImplementedError
+
+    def start(self):
+        if self._task is None and 0 <= self.hour < 24:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _next_run(self, now: datetime) -> datetime:
+        run = now.replace(hour=self.hour, minute=0, second=0, microsecond=0)
+        return run if run > now else run + timedelta(days=1)
+
+    async def run_once(self, day: str) -> bool:
+        """Run for ``day`` unless another worker already claimed it"""
+        try:
+            await self.db.job_runs.insert_one({"_id": f"{self.name}:{day}", "started_at": datetime.now(timezone.utc)})
+        except DuplicateKeyError:
+            return False
+        await self.run(day)
+        return True
+
+    async def _run(self):
+        while True:
+            run_at = self._next_run(datetime.now(timezone.utc))
+            await asyncio.sleep((run_at - datetime.now(timezone.utc)).total_seconds())
+            day = run_at.date().isoformat()
+            try:
+                if await self.run_once(day):
+                    logging.info(f"{self.name} for {day} done")
+            except Exception as e:
+                logging.error(f"{self.name} for {day} failed: {str(e)}")
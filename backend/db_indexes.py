@@ -0,0 +1,220 @@
+"""Index manifest for every collection the API queries.
+
+The manifest is applied idempotently on startup (``ensure_indexes``). Run this
+module directly to compare the manifest with what the database actually has:
+
+    python db_indexes.py report   # missing, unmanaged and unused indexes
+    python db_indexes.py apply    # create missing indexes
+"""
+import asyncio
+import logging
+import os
+import sys
+from pathlib import Path
+
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE, IndexModel
+from pymongo.errors import OperationFailure
+
+INDEX_MANIFEST = {
+    "users": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        # GET /admin/customers
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created_id"),
+    ],
+    "addresses": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # GET /addresses, address ownership checks
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)], name="user_created"),
+    ],
+    "bookings": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # List endpoints page by (sort key, id), see pagination.py
+        # GET /bookings, admin customer booking counts
+        IndexModel(
+            [("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="user_created_id"
+        ),
+        # GET /admin/bookings (unfiltered) and recent bookings
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created_id"),
+        # GET /admin/bookings?status=, status breakdown counts
+        IndexModel(
+            [("status", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="status_created_id"
+        ),
+        # Field stats, admin field team job counts
+        IndexModel(
+            [("assigned_technician_id", ASCENDING), ("status", ASCENDING), ("service_date", ASCENDING)],
+            name="technician_status_date"
+        ),
+        # GET /field/jobs
+        IndexModel(
+            [("assigned_technician_id", ASCENDING), ("service_date", ASCENDING), ("id", ASCENDING)],
+            name="technician_date_id"
+        ),
+        # GET /admin/incidents
+        IndexModel(
+            [("created_at", DESCENDING), ("id", DESCENDING)],
+            name="incidents_created_id",
+            partialFilterExpression={"incident_reports.0": {"$exists": True}}
+        ),
+        # List ETags: newest updated_at per list query, see etags.py
+        IndexModel([("user_id", ASCENDING), ("updated_at", DESCENDING)], name="user_updated"),
+        IndexModel(
+            [("assigned_technician_id", ASCENDING), ("status", ASCENDING), ("updated_at", DESCENDING)],
+            name="technician_status_updated"
+        ),
+        # Auto-assignment batches: confirmed, unassigned, by slot
+        IndexModel(
+            [("status", ASCENDING), ("assigned_technician_id", ASCENDING),
+             ("service_date", ASCENDING), ("service_time", ASCENDING)],
+            name="status_technician_slot"
+        ),
+        # Today's bookings on the admin dashboard
+        IndexModel([("service_date", ASCENDING)], name="service_date"),
+        # Revenue totals
+        IndexModel([("payment_status", ASCENDING)], name="payment_status"),
+        IndexModel([("razorpay_order_id", ASCENDING)], name="razorpay_order", sparse=True),
+    ],
+    "field_teams": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        # GET /admin/field-teams
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created_id"),
+        # Auto-assignment: technicians near a batch of bookings
+        IndexModel([("base_location", GEOSPHERE)], name="base_location_2dsphere"),
+    ],
+    "admins": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    # Cross-worker event fan-out (EVENTS_BACKEND=changestream), see events.py
+    "booking_events": [
+        IndexModel([("created_at", ASCENDING)], name="created_ttl", expireAfterSeconds=3600),
+    ],
+    # Precomputed technician routes (_id is technician:date), see routing.py
+    "routes": [
+        # Incremental updates find the routes a booking is on
+        IndexModel([("stops.booking_id", ASCENDING)], name="stop_booking"),
+        # Nightly batch clears routes of technicians with no jobs left
+        IndexModel([("service_date", ASCENDING)], name="service_date"),
+    ],
+    # Slot capacity counters (_id is date|time|area), see slots.py
+    "slots": [
+        # GET /slots/availability: one area over a date range
+        IndexModel([("area", ASCENDING), ("service_date", ASCENDING), ("service_time", ASCENDING)], name="area_date_time"),
+    ],
+    "booking_rollups": [
+        IndexModel(
+            [("day", ASCENDING), ("package_type", ASCENDING), ("status", ASCENDING), ("payment_status", ASCENDING)],
+            name="rollup_key_unique",
+            unique=True
+        ),
+    ],
+    "idempotency": [
+        # Replayable responses are kept for a day
+        IndexModel([("created_at", ASCENDING)], name="created_ttl", expireAfterSeconds=86400),
+    ],
+    "payment_events": [
+        # Worker claims the oldest pending event
+        IndexModel([("status", ASCENDING), ("received_at", ASCENDING)], name="status_received"),
+    ],
+    # GridFS media store, see blob_store.py
+    "media.files": [
+        # Blobs are named by content hash; makes concurrent uploads of the same bytes store one copy
+        IndexModel([("filename", ASCENDING)], name="filename_unique", unique=True),
+        # Created by GridFS itself; listed so the report does not flag it
+        IndexModel([("filename", ASCENDING), ("uploadDate", ASCENDING)], name="filename_1_uploadDate_1"),
+    ],
+    "otps": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        # Expired OTPs are removed by MongoDB (requires expiry to be a BSON date)
+        IndexModel([("expiry", ASCENDING)], name="expiry_ttl", expireAfterSeconds=0),
+    ],
+}
+
+
+def _key_of(index: dict) -> tuple:
+    """Identify an index by its key pattern and partial filter"""
+    key = tuple((field, int(direction) if isinstance(direction, (int, float)) else direction)
+                for field, direction in index["key"].items())
+    return key, repr(index.get("partialFilterExpression"))
+
+
+async def ensure_indexes(db, manifest: dict = INDEX_MANIFEST) -> list:
+    """Create any missing manifest indexes. Safe to call on every startup."""
+    created = []
+    for collection_name, models in manifest.items():
+        collection = db[collection_name]
+        for model in models:
+            try:
+                created.extend(await collection.create_indexes([model]))
+            except OperationFailure as e:
+                # e.g. duplicates preventing a unique index; keep serving
+                logging.error(f"Index {collection_name}.{model.document['name']} not created: {str(e)}")
+    return created
+
+
+async def index_report(db, manifest: dict = INDEX_MANIFEST) -> dict:
+    """Compare the manifest with the live database.
+
+    missing: in the manifest but not in the database
+    unmanaged: in the database but not in the manifest
+    unused: in the database with no recorded accesses since the server started
+    """
+    report = {"missing": [], "unmanaged": [], "unused": []}
+    for collection_name, models in manifest.items():
+        collection = db[collection_name]
+        existing = {}
+        async for index in collection.list_indexes():
+            if index["name"] != "_id_":
+                existing[_key_of(index)] = index["name"]
+
+        wanted = {_key_of(model.document): model.document["name"] for model in models}
+        for key, name in wanted.items():
+            if key not in existing:
+                report["missing"].append(f"{collection_name}.{name}")
+        for key, name in existing.items():
+            if key not in wanted:
+                report["unmanaged"].append(f"{collection_name}.{name}")
+
+        try:
+            async for stat in collection.aggregate([{"$indexStats": {}}]):
+                if stat["name"] != "_id_" and stat["accesses"]["ops"] == 0:
+                    report["unused"].append(f"{collection_name}.{stat['name']}")
+        except OperationFailure as e:
+            logging.warning(f"$indexStats unavailable for {collection_name}: {str(e)}")
+    return report
+
+
+async def _main(command: str) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        if command == "apply":
+            created = await ensure_indexes(db)
+            print(f"Created {len(created)} index(es)")
+            return 0
+
+        report = await index_report(db)
+        for section in ("missing", "unmanaged", "unused"):
+            print(f"{section}:")
+            for name in report[section]:
+                print(f"  {name}")
+            if not report[section]:
+                print("  (none)")
+        return 1 if report["missing"] else 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "report"
+    if command not in ("report", "apply"):
+        print(__doc__)
+        sys.exit(2)
+    sys.exit(asyncio.run(_main(command)))
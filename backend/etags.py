@@ -0,0 +1,62 @@
+"""ETags and conditional GETs.
+
+Every booking write goes through ``stamp``, which sets ``updated_at`` and
+increments ``version``. A list's ETag is then derived from the newest
+``updated_at`` and the row count of the list's query (two indexed lookups),
+so an unchanged list is answered with 304 without reading it. Single
+documents without a version (e.g. ``/auth/me``) are tagged by a hash of
+their body, which saves the transfer but not the read.
+"""
+import asyncio
+import hashlib
+import json
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from fastapi import Request, Response
+
+CACHE_CONTROL = "private, no-cache"
+
+
+def stamp(update: dict) -> dict:
+    """Add the ``updated_at``/``version`` bump to a booking update document"""
+    update = dict(update)
+    update["$set"] = {**update.get("$set", {}), "updated_at": datetime.now(timezone.utc)}
+    update["$inc"] = {**update.get("$inc", {}), "version": 1}
+    return update
+
+
+def make_etag(*parts: Any) -> str:
+    digest = hashlib.sha256(json.dumps(parts, default=str, sort_keys=True).encode()).hexdigest()
+    # Weak: the representation may be compressed differently per request
+    return f'W/"{digest[:32]}"'
+
+
+async def list_etag(collection, query: dict, *params: Any) -> str:
+    """ETag for the result of ``query``; ``params`` are the page/shape parameters."""
+    newest, count = await asyncio.gather(
+        collection.find_one(query, {"_id": 0, "updated_at": 1}, sort=[("updated_at", -1)]),
+        collection.count_documents(query) if query else collection.estimated_document_count()
+    )
+    return make_etag(query, (newest or {}).get("updated_at"), count, params)
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Weak comparison against If-None-Match"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in header.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+def set_etag(response: Optional[Response], etag: str):
+    if response is not None:
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = CACHE_CONTROL
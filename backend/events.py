@@ -0,0 +1,147 @@
+"""Push channel for booking and job updates.
+
+Booking writes publish small events (``type``, ``booking_id``, ``status``)
+addressed to channels: ``user:<id>`` for the customer, ``technician:<id>``
+for the assigned field team and ``admin`` for the board. Clients hold an SSE
+connection (``/api/events/...``) instead of polling the list endpoints.
+
+Two backends, selected by ``EVENTS_BACKEND``:
+
+- ``memory`` (default): fan-out within this process. Enough for a single
+  uvicorn worker.
+- ``changestream``: events are inserted into the ``booking_events``
+  collection (TTL-expired) and every worker tails it with a change stream,
+  so a subscriber on one worker sees events published on another. Needs a
+  replica set.
+"""
+import asyncio
+import logging
+import os
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, Optional, Set
+
+from pymongo.errors import OperationFailure
+
+# Events queued per subscriber before the oldest are dropped
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def booking_channels(booking: dict) -> list:
+    channels = ["admin"]
+    if booking.get("user_id"):
+        channels.append(f"user:{booking['user_id']}")
+    if booking.get("assigned_technician_id"):
+        channels.append(f"technician:{booking['assigned_technician_id']}")
+    return channels
+
+
+def booking_event(event_type: str, booking: dict, **extra) -> dict:
+    return {
+        "type": event_type,
+        "booking_id": booking.get("id"),
+        "status": booking.get("status"),
+        "version": booking.get("version"),
+        "channels": booking_channels(booking),
+        **extra,
+    }
+
+
+class EventHub:
+    def __init__(self, db=None, backend: str = "memory"):
+        self.db = db
+        self.backend = backend
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.metrics = {"published": 0, "delivered": 0, "dropped": 0}
+
+    @property
+    def subscriber_count(self) -> int:
+        return len({id(queue) for queues in self._subscribers.values() for queue in queues})
+
+    def _dispatch(self, event: dict):
+        delivered: Set[int] = set()
+        for channel in event.get("channels", []):
+            for queue in self._subscribers.get(channel, ()):
+                # A subscriber on several of the event's channels gets it once
+                if id(queue) in delivered:
+                    continue
+                delivered.add(id(queue))
+                if queue.full():
+                    queue.get_nowait()
+                    self.metrics["dropped"] += 1
+                queue.put_nowait(event)
+                self.metrics["delivered"] += 1
+
+    async def publish(self, event: dict):
+        """Publish an event; failures are logged, never raised to the writer"""
+        self.metrics["published"] += 1
+        if self.backend != "changestream":
+            self._dispatch(event)
+            return
+        try:
+            await self.db.booking_events.insert_one({**event, "created_at": datetime.now(timezone.utc)})
+        except Exception as e:
+            logging.error(f"Event publish failed: {str(e)}")
+
+    @contextmanager
+    def subscribe(self, channels: Iterable[str]) -> Iterator[asyncio.Queue]:
+        """Register a queue that receives every event sent to ``channels``"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        channels = list(channels)
+        for channel in channels:
+            self._subscribers.setdefault(channel, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            for channel in channels:
+                queues = self._subscribers.get(channel)
+                if queues is not None:
+                    queues.discard(queue)
+                    if not queues:
+                        del self._subscribers[channel]
+
+    def start(self):
+        if self.backend == "changestream" and self._task is None:
+            self._task = asyncio.create_task(self._tail())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _tail(self):
+        resume_token = None
+        while True:
+            try:
+                async with self.db.booking_events.watch(
+                    [{"$match": {"operationType": "insert"}}],
+                    resume_after=resume_token
+                ) as stream:
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        event = change["fullDocument"]
+                        event.pop("_id", None)
+                        event.pop("created_at", None)
+                        self._dispatch(event)
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                # Most likely the resume point fell off the oplog; start from now
+                logging.error(f"Event change stream error: {str(e)}")
+                resume_token = None
+                await asyncio.sleep(1)
+            except Exception as e:
+                logging.error(f"Event change stream error: {str(e)}")
+                await asyncio.sleep(1)
+
+    def get_metrics(self) -> dict:
+        return {**self.metrics, "backend": self.backend, "subscribers": self.subscriber_count}
+
+
+def event_hub_from_env(db) -> EventHub:
+    return EventHub(db, backend=os.environ.get('EVENTS_BACKEND', 'memory'))
@@ -0,0 +1,46 @@
+"""High-throughput JSON responses for large list endpoints.
+
+With ``FAST_JSON_RESPONSES`` enabled, list endpoints serialize the Mongo
+documents straight to JSON with orjson instead of letting FastAPI validate
+and re-encode every row through the ``response_model``. With
+``RESPONSE_VALIDATION`` also enabled (debug), rows are validated against a
+compiled ``TypeAdapter`` and dumped by pydantic-core instead.
+"""
+import os
+from typing import Any, Optional
+
+import orjson
+from fastapi import Response
+from pydantic import TypeAdapter
+
+FAST_JSON_RESPONSES = os.environ.get('FAST_JSON_RESPONSES', '0') == '1'
+RESPONSE_VALIDATION = os.environ.get('RESPONSE_VALIDATION', '0') == '1'
+
+
+def _raw_response(body: bytes, response: Optional[Response]) -> Response:
+    headers = None
+    if response is not None:
+        headers = {k: v for k, v in response.headers.items() if k != "content-length"}
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def json_response(data: Any, response: Optional[Response] = None, adapter: Optional[TypeAdapter] = None) -> Any:
+    """Serialize ``data`` directly when fast mode is on, else hand it back to FastAPI.
+
+    Headers already set on the endpoint's injected ``response`` (e.g.
+    X-Next-Cursor) are carried over, since FastAPI only merges them for
+    non-Response return values.
+    """
+    if not FAST_JSON_RESPONSES:
+        return data
+
+    if RESPONSE_VALIDATION and adapter is not None:
+        body = adapter.dump_json(adapter.validate_python(data))
+    else:
+        body = orjson.dumps(data, option=orjson.OPT_NAIVE_UTC)
+    return _raw_response(body, response)
+
+
+def partial_response(data: Any, response: Optional[Response] = None) -> Response:
+    """Serialize sparse documents, which would fail the endpoint's ``response_model``"""
+    return _raw_response(orjson.dumps(data, option=orjson.OPT_NAIVE_UTC), response)
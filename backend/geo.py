@@ -0,0 +1,25 @@
+"""Geographic helpers shared by assignment and routing."""
+from typing import Optional
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def point(lat: float, lng: float) -> dict:
+    """GeoJSON point, the form 2dsphere indexes expect (note: lng first)"""
+    return {"type": "Point", "coordinates": [float(lng), float(lat)]}
+
+
+def point_lat_lng(location: Optional[dict]) -> Optional[tuple]:
+    if not location or not location.get("coordinates"):
+        return None
+    lng, lat = location["coordinates"][:2]
+    return lat, lng
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance in km. Arguments are degrees and broadcast like NumPy arrays."""
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
@@ -0,0 +1,109 @@
+"""Idempotency keys for non-idempotent POST endpoints.
+
+The first request with a given key claims it by inserting an ``in_progress``
+record into the ``idempotency`` collection (``_id`` is scope + key, so the
+insert is the lock), runs the handler and stores the JSON response. Replays
+get the stored response without re-executing; a duplicate arriving while
+the first is still running waits for it to finish. A key reused with a
+different body is rejected, whatever state its record is in (a stale claim
+is only taken over by the same request). Records expire through a TTL index
+on ``created_at``.
+"""
+import asyncio
+import hashlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from pymongo.errors import DuplicateKeyError
+
+MAX_KEY_LENGTH = 255
+
+# A claim older than this is assumed to belong to a crashed worker
+STALE_AFTER = timedelta(seconds=60)
+
+
+class KeyReused(Exception):
+    """The key was already used for a request with a different body"""
+
+
+class StillInFlight(Exception):
+    """The original request did not finish within the wait timeout"""
+
+
+def fingerprint(payload: str) -> str:
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+async def _claim(collection, record_id: str, request_hash: str) -> bool:
+    now = datetime.now(timezone.utc)
+    try:
+        await collection.insert_one({
+            "_id": record_id,
+            "status": "in_progress",
+            "request_hash": request_hash,
+            "created_at": now
+        })
+        return True
+    except DuplicateKeyError:
+        # Take over a claim abandoned by a crashed request for the same body
+        result = await collection.update_one(
+            {"_id": record_id, "status": "in_progress", "request_hash": request_hash,
+             "created_at": {"$lt": now - STALE_AFTER}},
+            {"$set": {"created_at": now}}
+        )
+        return result.modified_count == 1
+
+
+async def _wait_for_result(collection, record_id: str, request_hash: str, timeout: float) -> dict:
+    """The finished record, None if it was released, or at once a record for another body"""
+    delay = 0.05
+    deadline = asyncio.get_running_loop().time() + timeout
+    while True:
+        record = await collection.find_one({"_id": record_id})
+        if record is None or record["status"] == "done" or record["request_hash"] != request_hash:
+            return record
+        if asyncio.get_running_loop().time() >= deadline:
+            raise StillInFlight()
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 0.5)
+
+
+async def run(
+    db,
+    scope: str,
+    key: str,
+    payload: str,
+    execute: Callable[[], Awaitable[Any]],
+    wait_timeout: float = 30.0
+) -> Tuple[Any, bool]:
+    """Execute once per (scope, key). Returns (response, replayed)."""
+    collection = db.idempotency
+    record_id = f"{scope}:{key}"
+    request_hash = fingerprint(payload)
+
+    while True:
+        if await _claim(collection, record_id, request_hash):
+            break
+
+        record = await _wait_for_result(collection, record_id, request_hash, wait_timeout)
+        if record is None:
+            # The original request failed and released the key; try again
+            continue
+        if record["request_hash"] != request_hash:
+            raise KeyReused()
+        return record["response"], True
+
+    try:
+        result = await execute()
+    except BaseException:
+        # Failed requests are not remembered, so the client may retry
+        await collection.delete_one({"_id": record_id, "status": "in_progress"})
+        raise
+
+    response = jsonable_encoder(result)
+    await collection.update_one(
+        {"_id": record_id},
+        {"$set": {"status": "done", "response": response}}
+    )
+    return response, False
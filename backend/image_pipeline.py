@@ -0,0 +1,188 @@
+"""Upload image normalization.
+
+Phone photos arrive as multi-megabyte JPEGs with EXIF (including GPS) data.
+``UploadLimitMiddleware`` rejects bodies over ``MAX_UPLOAD_BYTES`` while they
+stream in, before the multipart parser spools them. Uploads are then read in
+chunks and normalized in a process pool, off the event loop: orientation is applied and EXIF dropped,
+the image is downsized to ``IMAGE_MAX_DIMENSION``, recompressed to
+``IMAGE_FORMAT`` (WebP by default, or JPEG) and a ``THUMBNAIL_SIZE``
+thumbnail is produced. List endpoints serve thumbnails (see
+``thumbnail_url``); detail views keep the full image.
+"""
+import asyncio
+import io
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, NamedTuple, Optional
+
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse
+
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', str(15 * 1024 * 1024)))
+IMAGE_MAX_DIMENSION = int(os.environ.get('IMAGE_MAX_DIMENSION', '2048'))
+THUMBNAIL_SIZE = int(os.environ.get('THUMBNAIL_SIZE', '320'))
+IMAGE_FORMAT = os.environ.get('IMAGE_FORMAT', 'WEBP').upper()
+IMAGE_QUALITY = int(os.environ.get('IMAGE_QUALITY', '80'))
+
+READ_CHUNK_SIZE = 64 * 1024
+# Multipart boundaries and part headers around the file
+MULTIPART_OVERHEAD = 64 * 1024
+
+CONTENT_TYPES = {"WEBP": "image/webp", "JPEG": "image/jpeg"}
+
+MEDIA_URL_PATTERN = re.compile(r"/api/media/(?P<hash>[0-9a-f]{64})$")
+CLOUDINARY_UPLOAD_SEGMENT = "/image/upload/"
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class InvalidImage(Exception):
+    pass
+
+
+class NormalizedImage(NamedTuple):
+    data: bytes
+    thumbnail: bytes
+    content_type: str
+    width: int
+    height: int
+
+
+async def read_capped(upload, limit: int = MAX_UPLOAD_BYTES) -> bytes:
+    """Read an UploadFile in chunks, giving up as soon as it exceeds ``limit``"""
+    chunks = []
+    total = 0
+    while True:
+        chunk = await upload.read(READ_CHUNK_SIZE)
+        if not chunk:
+            return b"".join(chunks)
+        total += len(chunk)
+        if total > limit:
+            raise UploadTooLarge()
+        chunks.append(chunk)
+
+
+class UploadLimitMiddleware:
+    """413 for request bodies over ``limit`` on ``paths``: up front from
+    Content-Length, otherwise as soon as the streamed body passes it"""
+
+    def __init__(self, app, paths: Iterable[str], limit: int = MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD):
+        self.app = app
+        self.paths = frozenset(paths)
+        self.limit = limit
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = Headers(scope=scope).get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.limit:
+            response = JSONResponse({"detail": "Image too large"}, status_code=413)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.limit:
+                    # FastAPI re-raises HTTPExceptions from body parsing as they are
+                    raise HTTPException(status_code=413, detail="Image too large")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def _encode(image, image_format: str, quality: int) -> bytes:
+    out = io.BytesIO()
+    if image_format == "JPEG":
+        image.save(out, "JPEG", quality=quality, optimize=True, progressive=True)
+    else:
+        image.save(out, image_format, quality=quality, method=4)
+    return out.getvalue()
+
+
+# Runs in the child processes, so it must be importable at module level
+def _normalize(data: bytes, max_dimension: int, thumbnail_size: int, image_format: str, quality: int) -> NormalizedImage:
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        image = Image.open(io.BytesIO(data))
+        # Decode at reduced size where the codec supports it (JPEG draft mode)
+        image.draft("RGB", (max_dimension, max_dimension))
+        # Bake the EXIF orientation into the pixels; EXIF is not written back out
+        image = ImageOps.exif_transpose(image)
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+        raise InvalidImage(str(e))
+
+    if image.mode not in ("RGB", "RGBA") or (image.mode == "RGBA" and image_format == "JPEG"):
+        image = image.convert("RGB")
+
+    image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+    full = _encode(image, image_format, quality)
+
+    image.thumbnail((thumbnail_size, thumbnail_size), Image.LANCZOS)
+    thumbnail = _encode(image, image_format, quality)
+
+    width, height = Image.open(io.BytesIO(full)).size
+    return NormalizedImage(full, thumbnail, CONTENT_TYPES[image_format], width, height)
+
+
+class ImagePipeline:
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def start(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def normalize(self, data: bytes) -> NormalizedImage:
+        self.start()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, _normalize, data,
+            IMAGE_MAX_DIMENSION, THUMBNAIL_SIZE, IMAGE_FORMAT, IMAGE_QUALITY
+        )
+
+
+def thumbnail_url(url: Optional[str]) -> Optional[str]:
+    """Map a stored photo URL to its thumbnail. Unknown URLs are returned unchanged."""
+    if not url:
+        return url
+    match = MEDIA_URL_PATTERN.search(url)
+    if match:
+        return f"{url}/thumbnail"
+    if CLOUDINARY_UPLOAD_SEGMENT in url:
+        # Cloudinary derives (and caches) resized versions from a URL transformation
+        return url.replace(CLOUDINARY_UPLOAD_SEGMENT, f"{CLOUDINARY_UPLOAD_SEGMENT}c_limit,w_{THUMBNAIL_SIZE},h_{THUMBNAIL_SIZE}/", 1)
+    return url
+
+
+def with_thumbnails(booking: dict) -> dict:
+    """Rewrite a booking's photo URLs to thumbnails, for list responses"""
+    if booking.get("tank_photo_url"):
+        booking["tank_photo_url"] = thumbnail_url(booking["tank_photo_url"])
+    for field in ("before_photos", "after_photos"):
+        if booking.get(field):
+            booking[field] = [thumbnail_url(url) for url in booking[field]]
+    for step in ((booking.get("checklist") or {}).get("steps") or {}).values():
+        if step.get("photos"):
+            step["photos"] = [thumbnail_url(url) for url in step["photos"]]
+    for report in booking.get("incident_reports") or []:
+        if report.get("photo_urls"):
+            report["photo_urls"] = [thumbnail_url(url) for url in report["photo_urls"]]
+    return booking
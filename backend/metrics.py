@@ -0,0 +1,282 @@
+"""Prometheus metrics, served by ``GET /metrics`` in the text exposition format.
+
+Metrics are plain dicts updated without locks: request, gateway and upload
+metrics are only touched on the event loop thread. Mongo command events
+arrive on Motor's executor threads, so their listener only appends to a
+deque (atomic in CPython) that is applied when ``/metrics`` is scraped; if
+nothing scrapes for long, the oldest are dropped. Connection pool gauges
+cannot lose events, so pool events update per-thread counts instead, summed
+on scrape.
+
+Set ``METRICS_TOKEN`` to require ``Authorization: Bearer <token>`` on scrapes.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import monitoring
+
+from query_monitor import collection_of, route_of
+
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+_registry: List["Metric"] = []
+
+# Thread-side events, applied on scrape; bounded in case nothing scrapes
+_deferred = deque(maxlen=100_000)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        _registry.append(self)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        super().__init__(name, documentation, labels)
+        self.values: Dict[Tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1.0):
+        self.values[label_values] = self.values.get(label_values, 0.0) + amount
+
+    def samples(self):
+        for label_values, value in self.values.items():
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}"
+
+
+class Gauge(Metric):
+    """Set directly, or read from ``callback`` on every scrape: a number, or
+    for labelled gauges a dict of label values to numbers"""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (),
+                 callback: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labels)
+        self.values: Dict[Tuple, float] = {}
+        self.callback = callback
+
+    def inc(self, *label_values, amount: float = 1.0):
+        self.values[label_values] = self.values.get(label_values, 0.0) + amount
+
+    def dec(self, *label_values, amount: float = 1.0):
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, *label_values, value: float):
+        self.values[label_values] = value
+
+    def samples(self):
+        values = self.values
+        if self.callback is not None:
+            if not self.labels:
+                yield f"{self.name} {_format_value(self.callback())}"
+                return
+            values = self.callback()
+        for label_values, value in values.items():
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = REQUEST_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last is +Inf), sum]
+        self.values: Dict[Tuple, list] = {}
+
+    def observe(self, *label_values, value: float):
+        entry = self.values.get(label_values)
+        if entry is None:
+            entry = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def samples(self):
+        for label_values, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}"
+            labels = _format_labels(self.labels, label_values)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+@contextmanager
+def timed(histogram: Histogram, errors: Optional[Counter] = None, *label_values):
+    """Observe the block's duration, counting it in ``errors`` if it raises"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        if errors is not None:
+            errors.inc(*label_values)
+        raise
+    finally:
+        histogram.observe(*label_values, value=time.perf_counter() - started)
+
+
+def render() -> str:
+    while _deferred:
+        apply, args, kwargs = _deferred.popleft()
+        apply(*args, **kwargs)
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+# HTTP
+http_requests = Counter("http_requests_total", "Requests by route and status", ("method", "route", "status"))
+http_duration = Histogram("http_request_duration_seconds", "Request latency by route", ("method", "route"))
+http_in_flight = Gauge("http_requests_in_flight", "Requests being handled")
+
+# Event streams stay open for as long as the client listens
+UNTIMED_PREFIXES = ("/api/events/",)
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(UNTIMED_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        http_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_in_flight.dec()
+            # Routes are labelled by template, so cardinality stays bounded
+            route = route_of(scope) if "route" in scope else "unmatched"
+            http_requests.inc(scope["method"], route, status[0])
+            http_duration.observe(scope["method"], route, value=time.perf_counter() - started)
+
+
+# MongoDB
+mongo_duration = Histogram(
+    "mongodb_command_duration_seconds", "Mongo command latency", ("collection", "command"), MONGO_BUCKETS
+)
+mongo_failures = Counter("mongodb_command_failures_total", "Failed Mongo commands", ("collection", "command"))
+# thread id -> {state: net count}; each thread only changes its own entry
+_pool_counts: Dict[int, Dict[str, int]] = {}
+
+
+def _pool_connections() -> Dict[Tuple, float]:
+    totals = {("open",): 0, ("checked_out",): 0}
+    for counts in list(_pool_counts.values()):
+        for state, count in list(counts.items()):
+            totals[(state,)] += count
+    return totals
+
+
+mongo_connections = Gauge("mongodb_pool_connections", "Connections in the driver pool", ("state",),
+                          callback=_pool_connections)
+mongo_checkout_failures = Counter("mongodb_pool_checkout_failures_total", "Failed connection checkouts", ("reason",))
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    def __init__(self):
+        self._collections = {}  # request_id -> collection, for commands in flight
+
+    def started(self, event):
+        self._collections[event.request_id] = collection_of(event)
+
+    def succeeded(self, event):
+        collection = self._collections.pop(event.request_id, event.command_name)
+        _deferred.append((mongo_duration.observe, (collection, event.command_name), {"value": event.duration_micros / 1e6}))
+
+    def failed(self, event):
+        collection = self._collections.pop(event.request_id, event.command_name)
+        _deferred.append((mongo_duration.observe, (collection, event.command_name), {"value": event.duration_micros / 1e6}))
+        _deferred.append((mongo_failures.inc, (collection, event.command_name), {}))
+
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    def _change(self, state: str, amount: int):
+        counts = _pool_counts.get(threading.get_ident())
+        if counts is None:
+            counts = _pool_counts.setdefault(threading.get_ident(), {"open": 0, "checked_out": 0})
+        counts[state] += amount
+
+    def connection_created(self, event):
+        self._change("open", 1)
+
+    def connection_closed(self, event):
+        self._change("open", -1)
+
+    def connection_checked_out(self, event):
+        self._change("checked_out", 1)
+
+    def connection_checked_in(self, event):
+        self._change("checked_out", -1)
+
+    def connection_check_out_failed(self, event):
+        _deferred.append((mongo_checkout_failures.inc, (event.reason,), {}))
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+
+# External services
+gateway_duration = Histogram("payment_gateway_request_duration_seconds", "Razorpay call latency", ("endpoint",))
+gateway_errors = Counter("payment_gateway_errors_total", "Failed Razorpay calls", ("endpoint",))
+cloudinary_duration = Histogram("cloudinary_upload_duration_seconds", "Cloudinary upload latency")
+cloudinary_errors = Counter("cloudinary_upload_errors_total", "Failed Cloudinary uploads")
@@ -0,0 +1,105 @@
+"""Convert ISO-8601 timestamp strings to native BSON dates.
+
+Older documents stored ``created_at`` and friends as ``isoformat()`` strings.
+Run once after deploying (safe to re-run; only string values are touched):
+
+    python migrate_dates.py
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+from pymongo import UpdateOne
+
+BATCH_SIZE = 1000
+
+# collection -> top-level or dotted fields holding a single timestamp
+DATE_FIELDS = {
+    "users": ["created_at"],
+    "addresses": ["created_at"],
+    "field_teams": ["created_at"],
+    "admins": ["created_at"],
+    "otps": ["created_at", "expiry"],
+    "bookings": ["created_at", "started_at", "completed_at", "checklist.started_at"],
+}
+
+
+def parse_timestamp(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def _get(doc: dict, dotted: str):
+    for part in dotted.split("."):
+        doc = doc.get(part) if isinstance(doc, dict) else None
+    return doc
+
+
+async def _flush(collection, ops: list) -> int:
+    if not ops:
+        return 0
+    result = await collection.bulk_write(ops, ordered=False)
+    return result.modified_count
+
+
+async def migrate_field(collection, field: str) -> int:
+    query = {field: {"$type": "string"}}
+    ops = []
+    modified = 0
+    async for doc in collection.find(query, {field: 1}):
+        ops.append(UpdateOne(
+            {"_id": doc["_id"], field: {"$type": "string"}},
+            {"$set": {field: parse_timestamp(_get(doc, field))}}
+        ))
+        if len(ops) >= BATCH_SIZE:
+            modified += await _flush(collection, ops)
+            ops = []
+    return modified + await _flush(collection, ops)
+
+
+async def migrate_incident_reports(collection) -> int:
+    query = {"incident_reports.reported_at": {"$type": "string"}}
+    ops = []
+    modified = 0
+    async for doc in collection.find(query, {"incident_reports": 1}):
+        reports = doc["incident_reports"]
+        for report in reports:
+            if isinstance(report.get("reported_at"), str):
+                report["reported_at"] = parse_timestamp(report["reported_at"])
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"incident_reports": reports}}))
+        if len(ops) >= BATCH_SIZE:
+            modified += await _flush(collection, ops)
+            ops = []
+    return modified + await _flush(collection, ops)
+
+
+async def migrate(db) -> dict:
+    counts = {}
+    for collection_name, fields in DATE_FIELDS.items():
+        for field in fields:
+            counts[f"{collection_name}.{field}"] = await migrate_field(db[collection_name], field)
+    counts["bookings.incident_reports.reported_at"] = await migrate_incident_reports(db.bookings)
+    return counts
+
+
+async def _main() -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        for name, modified in (await migrate(db)).items():
+            print(f"{name}: {modified} converted")
+        return 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main()))
@@ -0,0 +1,38 @@
+"""Replace ``incident_reports: null`` with an empty list.
+
+Bookings used to be created with ``incident_reports: null``, which ``$push``
+rejects, so the first incident reported on such a booking failed. New
+bookings start with ``[]``. Run once after deploying (safe to re-run):
+
+    python migrate_incident_reports.py
+"""
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+from etags import stamp
+
+
+async def migrate(db) -> int:
+    # Also matches bookings without the field; stamped so cached ETags change
+    result = await db.bookings.update_many({"incident_reports": None}, stamp({"$set": {"incident_reports": []}}))
+    return result.modified_count
+
+
+async def _main() -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        print(f"incident_reports: {await migrate(db)} booking(s) set to []")
+        return 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main()))
@@ -0,0 +1,106 @@
+"""Move inline base64 ``data:`` images out of booking documents.
+
+Before the media store existed, uploads without Cloudinary were stored as
+``data:`` URLs inside bookings. This rewrites every such URL into the blob
+store and replaces it with its ``/api/media/{hash}`` URL. Safe to re-run.
+
+    python migrate_media.py
+"""
+import asyncio
+import os
+import sys
+from datetime import timezone
+from pathlib import Path
+
+from blob_store import blob_store_from_env, decode_data_url, media_url
+from etags import stamp
+
+PROJECTION = {
+    "_id": 1,
+    "tank_photo_url": 1,
+    "before_photos": 1,
+    "after_photos": 1,
+    "checklist.steps": 1,
+    "incident_reports": 1,
+}
+
+
+async def _extract(store, url):
+    """Return the media URL replacing ``url``, or None to leave it alone"""
+    if not isinstance(url, str) or not url.startswith("data:"):
+        return None
+    decoded = decode_data_url(url)
+    if decoded is None:
+        return None
+    data, content_type = decoded
+    return media_url(await store.put(data, content_type))
+
+
+async def _extract_list(store, urls):
+    if not urls:
+        return None
+    replaced = [await _extract(store, url) for url in urls]
+    if not any(replaced):
+        return None
+    return [new or old for new, old in zip(replaced, urls)]
+
+
+async def migrate_booking(store, booking: dict) -> dict:
+    """Return the $set document for one booking (empty if nothing inline)"""
+    updates = {}
+
+    new_url = await _extract(store, booking.get("tank_photo_url"))
+    if new_url:
+        updates["tank_photo_url"] = new_url
+
+    for field in ("before_photos", "after_photos"):
+        photos = await _extract_list(store, booking.get(field))
+        if photos:
+            updates[field] = photos
+
+    steps = (booking.get("checklist") or {}).get("steps") or {}
+    for step_name, step in steps.items():
+        photos = await _extract_list(store, step.get("photos"))
+        if photos:
+            updates[f"checklist.steps.{step_name}.photos"] = photos
+
+    reports = booking.get("incident_reports") or []
+    changed = False
+    for report in reports:
+        photos = await _extract_list(store, report.get("photo_urls"))
+        if photos:
+            report["photo_urls"] = photos
+            changed = True
+    if changed:
+        updates["incident_reports"] = reports
+
+    return updates
+
+
+async def migrate(db, store) -> int:
+    migrated = 0
+    async for booking in db.bookings.find({}, PROJECTION):
+        updates = await migrate_booking(store, booking)
+        if updates:
+            await db.bookings.update_one({"_id": booking["_id"]}, stamp({"$set": updates}))
+            migrated += 1
+    return migrated
+
+
+async def _main() -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True, tzinfo=timezone.utc)
+    db = client[os.environ['DB_NAME']]
+    try:
+        migrated = await migrate(db, blob_store_from_env(db))
+        print(f"Moved inline images out of {migrated} booking(s)")
+        return 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main()))
@@ -0,0 +1,80 @@
+"""Keyset (cursor) pagination for list endpoints.
+
+Pages are ordered by ``(sort_field, id)`` and the cursor is the opaque,
+url-safe encoding of the last row's sort key. Each page is a single indexed
+range query, so its cost does not grow with the collection size.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict) and "$date" in value:
+        return datetime.fromisoformat(value["$date"])
+    return value
+
+
+def encode_cursor(sort_value: Any, doc_id: str) -> str:
+    raw = json.dumps([_encode_value(sort_value), doc_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, doc_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return _decode_value(sort_value), doc_id
+    except (ValueError, TypeError):
+        raise InvalidCursor(cursor)
+
+
+def keyset_filter(query: dict, sort_field: str, direction: int, cursor: Optional[str]) -> dict:
+    """Restrict ``query`` to rows strictly after ``cursor`` in (sort_field, id) order"""
+    if not cursor:
+        return query
+    sort_value, doc_id = decode_cursor(cursor)
+    op = "$lt" if direction < 0 else "$gt"
+    after = {"$or": [
+        {sort_field: {op: sort_value}},
+        {sort_field: sort_value, "id": {op: doc_id}},
+    ]}
+    return {"$and": [query, after]} if query else after
+
+
+async def paginate(
+    collection,
+    query: dict,
+    projection: dict,
+    sort_field: str,
+    direction: int,
+    limit: int,
+    cursor: Optional[str] = None
+) -> Tuple[List[dict], Optional[str]]:
+    """Return one page of documents and the cursor for the next page (None on the last page)"""
+    # Sort key and id are needed to build the next cursor
+    if projection and any(v for k, v in projection.items() if k != "_id"):
+        projection = {**projection, sort_field: 1, "id": 1}
+
+    docs = await collection.find(
+        keyset_filter(query, sort_field, direction, cursor),
+        projection
+    ).sort([(sort_field, direction), ("id", direction)]).limit(limit + 1).to_list(limit + 1)
+
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        last = docs[-1]
+        next_cursor = encode_cursor(last.get(sort_field), last['id'])
+    return docs, next_cursor
@@ -0,0 +1,105 @@
+"""Password hashing executor.
+
+bcrypt is deliberately slow (~200ms per hash), so hashing and verification run
+in a bounded process pool instead of on the event loop. When more than
+``max_queue`` operations are waiting the hasher sheds load by raising
+``HasherOverloaded`` so the API can answer 503 instead of stalling every
+other request.
+"""
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from passlib.context import CryptContext
+
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+
+class HasherOverloaded(Exception):
+    pass
+
+
+# Worker functions run in the child processes and must be importable at module level
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify(password: str, hashed_password: str) -> tuple:
+    """Return (valid, needs_rehash) so callers can upgrade legacy hashes."""
+    valid = pwd_context.verify(password, hashed_password)
+    return valid, valid and pwd_context.needs_update(hashed_password)
+
+
+class PasswordHasher:
+    def __init__(self, max_workers: Optional[int] = None, max_queue: int = 64):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self.metrics = {
+            "hash_count": 0,
+            "verify_count": 0,
+            "rejected_count": 0,
+            "rehash_count": 0,
+            "total_seconds": 0.0,
+        }
+
+    @property
+    def queue_depth(self) -> int:
+        return self._pending
+
+    def start(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _run(self, func, *args):
+        if self._pending >= self.max_queue:
+            self.metrics["rejected_count"] += 1
+            raise HasherOverloaded()
+        self.start()
+        self._pending += 1
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self._pending -= 1
+            self.metrics["total_seconds"] += time.perf_counter() - started
+
+    async def hash(self, password: str) -> str:
+        self.metrics["hash_count"] += 1
+        return await self._run(_hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> tuple:
+        self.metrics["verify_count"] += 1
+        return await self._run(_verify, password, hashed_password)
+
+    async def rehash_in_background(self, collection, doc_id: str, password: str):
+        """Replace a hash produced with outdated cost parameters."""
+        try:
+            new_hash = await self.hash(password)
+            await collection.update_one({"id": doc_id}, {"$set": {"password": new_hash}})
+            self.metrics["rehash_count"] += 1
+        except HasherOverloaded:
+            # Try again on the next successful login
+            pass
+        except Exception as e:
+            logging.error(f"Password rehash failed: {str(e)}")
+
+    def get_metrics(self) -> dict:
+        return {
+            **self.metrics,
+            "queue_depth": self._pending,
+            "max_queue": self.max_queue,
+            "max_workers": self.max_workers,
+        }
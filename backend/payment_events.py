@@ -0,0 +1,208 @@
+"""Asynchronous payment reconciliation.
+
+Razorpay webhooks are persisted to ``payment_events`` (``_id`` is the event
+id, so redeliveries are dropped) and acknowledged immediately. An in-process
+worker then applies them to bookings. Every booking update is conditional
+on the current payment state, so applying an event twice changes nothing.
+
+Bookings whose payment is still pending after the webhook should have
+arrived can be reconciled against the gateway in bulk:
+
+    python payment_events.py reconcile [--older-than-minutes 30] [--concurrency 8]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+import rollups
+from payment_gateway import GatewayError, gateway_from_env
+
+PAID_EVENTS = ("payment.captured", "order.paid")
+FAILED_EVENTS = ("payment.failed",)
+
+# A "processing" claim older than this is assumed lost with its worker
+CLAIM_TIMEOUT = timedelta(minutes=5)
+
+
+async def mark_paid(db, order_id: str):
+    # Confirm pending bookings; never reopen cancelled or finished ones
+    before = await rollups.update_booking_tracked(
+        db,
+        {"razorpay_order_id": order_id, "status": "pending"},
+        {"payment_status": "completed", "status": "confirmed"}
+    )
+    if before is None:
+        await rollups.update_booking_tracked(
+            db,
+            {"razorpay_order_id": order_id, "payment_status": {"$ne": "completed"}},
+            {"payment_status": "completed"}
+        )
+
+
+async def mark_failed(db, order_id: str):
+    await rollups.update_booking_tracked(
+        db,
+        {"razorpay_order_id": order_id, "payment_status": "pending"},
+        {"payment_status": "failed"}
+    )
+
+
+def order_id_of(body: dict) -> Optional[str]:
+    entities = body.get("payload", {})
+    payment = entities.get("payment", {}).get("entity", {})
+    if payment.get("order_id"):
+        return payment["order_id"]
+    return entities.get("order", {}).get("entity", {}).get("id")
+
+
+async def record_event(db, event_id: str, payload: dict) -> bool:
+    """Persist a webhook event. Returns False if it was already received."""
+    try:
+        await db.payment_events.insert_one({
+            "_id": event_id,
+            "event": payload.get("event"),
+            "payload": payload,
+            "status": "pending",
+            "received_at": datetime.now(timezone.utc)
+        })
+        return True
+    except DuplicateKeyError:
+        return False
+
+
+async def apply_event(db, event: dict):
+    name = event.get("event")
+    order_id = order_id_of(event.get("payload", {}))
+    if not order_id:
+        return
+    if name in PAID_EVENTS:
+        await mark_paid(db, order_id)
+    elif name in FAILED_EVENTS:
+        await mark_failed(db, order_id)
+
+
+class PaymentEventWorker:
+    """Applies persisted webhook events in the background."""
+
+    def __init__(self, db, poll_interval: float = 5.0):
+        self.db = db
+        self.poll_interval = poll_interval
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def notify(self):
+        self._wakeup.set()
+
+    async def _claim(self) -> Optional[dict]:
+        now = datetime.now(timezone.utc)
+        return await self.db.payment_events.find_one_and_update(
+            {"$or": [
+                {"status": "pending"},
+                {"status": "processing", "claimed_at": {"$lt": now - CLAIM_TIMEOUT}}
+            ]},
+            {"$set": {"status": "processing", "claimed_at": now}},
+            sort=[("received_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def drain(self) -> int:
+        applied = 0
+        while True:
+            event = await self._claim()
+            if event is None:
+                return applied
+            try:
+                await apply_event(self.db, event)
+                status = {"status": "done", "processed_at": datetime.now(timezone.utc)}
+            except Exception as e:
+                logging.error(f"Payment event {event['_id']} failed: {str(e)}")
+                status = {"status": "failed", "error": str(e)}
+            await self.db.payment_events.update_one({"_id": event["_id"]}, {"$set": status})
+            applied += 1
+
+    async def _run(self):
+        while True:
+            try:
+                await self.drain()
+            except Exception as e:
+                logging.error(f"Payment event worker error: {str(e)}")
+            # Poll as well, for events received by other workers
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+
+async def reconcile_stale(db, gateway, older_than: timedelta, concurrency: int = 8) -> dict:
+    """Check every stale pending booking's order with the gateway, ``concurrency`` at a time"""
+    cutoff = datetime.now(timezone.utc) - older_than
+    bookings = await db.bookings.find(
+        {"payment_status": "pending", "razorpay_order_id": {"$ne": None}, "created_at": {"$lt": cutoff}},
+        {"_id": 0, "razorpay_order_id": 1}
+    ).to_list(None)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    counts = {"checked": 0, "paid": 0, "errors": 0}
+
+    async def reconcile(order_id: str):
+        async with semaphore:
+            try:
+                order = await gateway.fetch_order(order_id)
+            except GatewayError as e:
+                logging.error(f"Reconciliation of {order_id} failed: {str(e)}")
+                counts["errors"] += 1
+                return
+        counts["checked"] += 1
+        if order.get("status") == "paid":
+            await mark_paid(db, order_id)
+            counts["paid"] += 1
+
+    await asyncio.gather(*(reconcile(b['razorpay_order_id']) for b in bookings))
+    return counts
+
+
+async def _main(args) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True, tzinfo=timezone.utc)
+    db = client[os.environ['DB_NAME']]
+    gateway = gateway_from_env()
+    try:
+        counts = await reconcile_stale(db, gateway, timedelta(minutes=args.older_than_minutes), args.concurrency)
+        print(f"Checked {counts['checked']} order(s), {counts['paid']} newly paid, {counts['errors']} error(s)")
+        return 1 if counts["errors"] else 0
+    finally:
+        gateway.shutdown()
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconcile stale pending payments with Razorpay")
+    parser.add_argument("command", choices=["reconcile"])
+    parser.add_argument("--older-than-minutes", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, default=8)
+    sys.exit(asyncio.run(_main(parser.parse_args())))
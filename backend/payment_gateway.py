@@ -0,0 +1,207 @@
+"""Non-blocking Razorpay client.
+
+Gateway HTTP calls run on a dedicated thread pool so a slow Razorpay response
+never blocks the event loop. Every call has a timeout, at most
+``max_concurrency`` calls are in flight, idempotent calls are retried with
+jittered backoff, and a circuit breaker fails fast while the gateway is
+degraded. Signature checks are local HMAC computations with no I/O.
+
+Point ``base_url`` at a local fake (see scripts/fake_razorpay.py) to test.
+"""
+import asyncio
+import hashlib
+import hmac
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import requests
+
+import metrics
+
+RAZORPAY_BASE_URL = "https://api.razorpay.com/v1"
+
+
+class GatewayError(Exception):
+    pass
+
+
+class GatewayUnavailable(GatewayError):
+    """The circuit is open, or the call timed out / could not connect"""
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures; after
+    ``reset_timeout`` seconds one trial call is let through (half-open)."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.failures >= self.failure_threshold or self.opened_at is not None:
+            self.opened_at = time.monotonic()
+
+    def record_cancelled(self):
+        """The call was abandoned before it finished; it says nothing about the
+        gateway, but a half-open trial must make way for the next one"""
+        self._trial_in_flight = False
+
+
+class RazorpayGateway:
+    def __init__(
+        self,
+        key_id: str,
+        key_secret: str,
+        base_url: str = RAZORPAY_BASE_URL,
+        timeout: float = 10.0,
+        max_concurrency: int = 16,
+        max_retries: int = 2,
+        breaker: Optional[CircuitBreaker] = None,
+        webhook_secret: str = ""
+    ):
+        self.key_id = key_id
+        self.key_secret = key_secret
+        self.webhook_secret = webhook_secret
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="razorpay")
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._session = requests.Session()
+        self._session.auth = (key_id, key_secret)
+        self.metrics = {"calls": 0, "errors": 0, "rejected": 0, "total_seconds": 0.0}
+
+    def _request(self, method: str, path: str, payload: Optional[dict]) -> dict:
+        response = self._session.request(method, f"{self.base_url}{path}", json=payload, timeout=self.timeout)
+        if response.status_code >= 500:
+            raise GatewayUnavailable(f"Razorpay {method} {path} returned {response.status_code}")
+        if response.status_code >= 400:
+            raise GatewayError(f"Razorpay {method} {path} returned {response.status_code}: {response.text[:200]}")
+        try:
+            return response.json()
+        except ValueError:
+            raise GatewayUnavailable(f"Razorpay {method} {path} returned a malformed body")
+
+    async def _call(self, method: str, path: str, payload: Optional[dict] = None, idempotent: bool = False) -> dict:
+        attempts = 1 + (self.max_retries if idempotent else 0)
+        endpoint = f"{method} /{path.split('/')[1]}"  # no ids, to bound label cardinality
+        for attempt in range(attempts):
+            if not self.breaker.allow():
+                self.metrics["rejected"] += 1
+                raise GatewayUnavailable("Payment gateway circuit is open")
+
+            self.metrics["calls"] += 1
+            started = time.perf_counter()
+            try:
+                async with self._semaphore:
+                    loop = asyncio.get_running_loop()
+                    result = await asyncio.wait_for(
+                        loop.run_in_executor(self._executor, self._request, method, path, payload),
+                        timeout=self.timeout + 1
+                    )
+                self.breaker.record_success()
+                return result
+            except (GatewayUnavailable, asyncio.TimeoutError, requests.RequestException) as e:
+                self.metrics["errors"] += 1
+                metrics.gateway_errors.inc(endpoint)
+                self.breaker.record_failure()
+                if attempt + 1 >= attempts:
+                    raise GatewayUnavailable(str(e) or type(e).__name__) from e
+                # Full jitter backoff: 0..(0.2 * 2^attempt) seconds
+                await asyncio.sleep(random.uniform(0, 0.2 * (2 ** attempt)))
+            except GatewayError:
+                # Client errors say nothing about gateway health
+                self.metrics["errors"] += 1
+                metrics.gateway_errors.inc(endpoint)
+                self.breaker.record_success()
+                raise
+            except asyncio.CancelledError:
+                self.breaker.record_cancelled()
+                raise
+            except Exception:
+                # Anything else still has to settle the breaker (and a half-open trial)
+                self.metrics["errors"] += 1
+                metrics.gateway_errors.inc(endpoint)
+                self.breaker.record_failure()
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                self.metrics["total_seconds"] += elapsed
+                metrics.gateway_duration.observe(endpoint, value=elapsed)
+
+    async def create_order(self, amount: int, currency: str = "INR", receipt: Optional[str] = None) -> dict:
+        # Not idempotent on Razorpay's side, so never retried
+        payload = {"amount": amount, "currency": currency, "payment_capture": 1}
+        if receipt:
+            payload["receipt"] = receipt
+        return await self._call("POST", "/orders", payload)
+
+    async def fetch_order(self, order_id: str) -> dict:
+        return await self._call("GET", f"/orders/{order_id}", idempotent=True)
+
+    def verify_payment_signature(self, order_id: str, payment_id: str, signature: str) -> bool:
+        expected = hmac.new(
+            self.key_secret.encode(),
+            f"{order_id}|{payment_id}".encode(),
+            hashlib.sha256
+        ).hexdigest()
+        return hmac.compare_digest(expected, signature)
+
+    def verify_webhook_signature(self, body: bytes, signature: str) -> bool:
+        if not self.webhook_secret or not signature:
+            return False
+        expected = hmac.new(self.webhook_secret.encode(), body, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected, signature)
+
+    def get_metrics(self) -> dict:
+        return {**self.metrics, "circuit": self.breaker.state}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._session.close()
+
+
+def gateway_from_env() -> RazorpayGateway:
+    return RazorpayGateway(
+        key_id=os.environ.get('RAZORPAY_KEY_ID', ''),
+        key_secret=os.environ.get('RAZORPAY_KEY_SECRET', ''),
+        base_url=os.environ.get('RAZORPAY_BASE_URL', RAZORPAY_BASE_URL),
+        timeout=float(os.environ.get('RAZORPAY_TIMEOUT', '10')),
+        max_concurrency=int(os.environ.get('RAZORPAY_MAX_CONCURRENCY', '16')),
+        breaker=CircuitBreaker(
+            failure_threshold=int(os.environ.get('RAZORPAY_BREAKER_THRESHOLD', '5')),
+            reset_timeout=float(os.environ.get('RAZORPAY_BREAKER_RESET', '30'))
+        ),
+        webhook_secret=os.environ.get('RAZORPAY_WEBHOOK_SECRET', '')
+    )
@@ -0,0 +1,67 @@
+"""Sparse fieldsets for booking reads.
+
+Booking read endpoints take ``view=summary|detail`` and/or ``fields=a,b,c``.
+Both become a Mongo projection, so unneeded fields (checklist, incident
+reports, photo arrays, signature) are never read off disk or sent over the
+wire. ``detail`` is the full document; ``fields`` takes precedence over
+``view`` and may name nested paths such as ``checklist.status``.
+"""
+from typing import Iterable, Optional
+
+BOOKING_FIELDS = frozenset({
+    "id", "user_id", "address_id", "tank_type", "tank_capacity", "tank_photo_url",
+    "service_date", "service_time", "service_area", "package_type",
+    "add_disinfection", "add_maintenance", "add_repair",
+    "payment_method", "status", "amount", "razorpay_order_id", "payment_status",
+    "assigned_technician_id", "checklist", "incident_reports", "customer_signature",
+    "before_photos", "after_photos", "completion_notes",
+    "started_at", "completed_at", "created_at", "updated_at", "version",
+})
+
+# What history, dashboard and job list pages render
+SUMMARY_FIELDS = (
+    "id", "user_id", "address_id", "tank_type", "tank_capacity",
+    "service_date", "service_time", "package_type",
+    "add_disinfection", "add_maintenance", "add_repair",
+    "payment_method", "status", "amount", "payment_status",
+    "assigned_technician_id", "created_at", "updated_at", "version",
+)
+
+VIEWS = ("summary", "detail")
+
+FULL_PROJECTION = {"_id": 0}
+
+
+class InvalidProjection(Exception):
+    pass
+
+
+def booking_projection(view: Optional[str] = None, fields: Optional[str] = None, required: Iterable[str] = ()) -> dict:
+    """Build the projection for a booking read.
+
+    ``required`` lists fields the endpoint itself needs (e.g. for enrichment);
+    they are always included in a partial projection.
+    """
+    if fields:
+        names = [name.strip() for name in fields.split(",") if name.strip()]
+        unknown = sorted(name for name in names if name.split(".")[0] not in BOOKING_FIELDS)
+        if unknown:
+            raise InvalidProjection(f"Unknown field(s): {', '.join(unknown)}")
+    elif view in (None, "detail"):
+        return FULL_PROJECTION
+    elif view == "summary":
+        names = list(SUMMARY_FIELDS)
+    else:
+        raise InvalidProjection(f"Unknown view: {view}")
+
+    # A path and its parent cannot both be projected; keep the parent
+    selected = list(dict.fromkeys(["id", *names, *required]))
+    projection = {
+        name: 1 for name in selected
+        if not any(name.startswith(f"{other}.") for other in selected)
+    }
+    return {"_id": 0, **projection}
+
+
+def is_partial(projection: dict) -> bool:
+    return projection != FULL_PROJECTION
@@ -0,0 +1,173 @@
+"""Per-request MongoDB command accounting.
+
+``QueryListener`` (a pymongo command listener) attributes every command to the
+request that issued it through a contextvar; Motor copies the context into
+its executor threads. ``QueryMonitorMiddleware`` opens a ``RequestQueries``
+for each request and, when the request is done:
+
+- with ``QUERY_DEBUG=1``, adds ``X-DB-Queries``, ``X-DB-Time-Ms`` and
+  ``X-DB-Collections`` (``bookings=3;users=1``) response headers
+- logs a warning naming the route if it ran more than ``QUERY_BUDGET`` commands
+
+Commands issued outside a request (startup, workers, scripts) are not counted.
+Tests can pin a route's query count:
+
+    with query_budget(2):
+        client.get("/api/admin/customers")
+"""
+import contextvars
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from pymongo import monitoring
+from starlette.datastructures import MutableHeaders
+
+QUERY_BUDGET = int(os.environ.get('QUERY_BUDGET', '20'))
+QUERY_DEBUG = os.environ.get('QUERY_DEBUG', '0') == '1'
+
+DEBUG_HEADERS = ["X-DB-Queries", "X-DB-Time-Ms", "X-DB-Collections"]
+
+logger = logging.getLogger(__name__)
+
+
+class RequestQueries:
+    """Commands run on behalf of one request"""
+
+    def __init__(self, scope: Optional[dict] = None):
+        self.scope = scope
+        self.count = 0
+        self.seconds = 0.0
+        self.by_collection: Dict[str, List] = {}  # name -> [count, seconds]
+        # Commands of one request can run on several executor threads at once
+        self._lock = threading.Lock()
+
+    def record(self, collection: str, seconds: float):
+        with self._lock:
+            self.count += 1
+            self.seconds += seconds
+            entry = self.by_collection.setdefault(collection, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    @property
+    def route(self) -> Optional[str]:
+        return route_of(self.scope) if self.scope is not None else None
+
+    def collections_header(self) -> str:
+        return ";".join(f"{name}={count}" for name, (count, _) in sorted(self.by_collection.items()))
+
+
+current: contextvars.ContextVar[Optional[RequestQueries]] = contextvars.ContextVar("request_queries", default=None)
+
+
+def collection_of(event) -> str:
+    """Collection a command ran against (the command name for database-level commands)"""
+    if event.command_name == "getMore":
+        return event.command.get("collection", "getMore")
+    target = event.command.get(event.command_name)
+    return target if isinstance(target, str) else event.command_name
+
+
+class QueryListener(monitoring.CommandListener):
+    """Pass to the client as ``event_listeners=[QueryListener()]``"""
+
+    def __init__(self):
+        # request_id -> (queries, collection) for commands still in flight
+        self._pending = {}
+
+    def started(self, event):
+        queries = current.get()
+        if queries is not None:
+            self._pending[event.request_id] = (queries, collection_of(event))
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event)
+
+    def _finish(self, event):
+        pending = self._pending.pop(event.request_id, None)
+        if pending is not None:
+            queries, collection = pending
+            queries.record(collection, event.duration_micros / 1e6)
+
+
+class FinishedRequest(NamedTuple):
+    method: str
+    route: str
+    queries: RequestQueries
+    seconds: float
+
+
+# Called with every FinishedRequest, see query_budget
+_observers: List[Callable[[FinishedRequest], None]] = []
+
+
+def route_of(scope) -> str:
+    """Route template (``/api/bookings/{booking_id}``), or the raw path if no route matched"""
+    route = scope.get("route")
+    return getattr(route, "path", scope["path"])
+
+
+class QueryMonitorMiddleware:
+    def __init__(self, app, budget: int = QUERY_BUDGET, debug: bool = QUERY_DEBUG):
+        self.app = app
+        self.budget = budget
+        self.debug = debug
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        queries = RequestQueries(scope)
+        token = current.set(queries)
+        started = time.perf_counter()
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers["X-DB-Queries"] = str(queries.count)
+                headers["X-DB-Time-Ms"] = f"{queries.seconds * 1000:.1f}"
+                headers["X-DB-Collections"] = queries.collections_header()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers if self.debug else send)
+        finally:
+            current.reset(token)
+            finished = FinishedRequest(scope["method"], route_of(scope), queries, time.perf_counter() - started)
+            if queries.count > self.budget:
+                logger.warning(
+                    f"{finished.method} {finished.route} ran {queries.count} Mongo commands "
+                    f"(budget {self.budget}, {queries.seconds * 1000:.1f} ms): {queries.collections_header()}"
+                )
+            for observer in _observers:
+                observer(finished)
+
+
+@contextmanager
+def query_budget(max_queries: int, route: Optional[str] = None):
+    """Assert (for pytest) that every request finished inside the block, or only
+    those for ``route``, ran at most ``max_queries`` Mongo commands. Yields the
+    list of FinishedRequest seen so far."""
+    finished: List[FinishedRequest] = []
+    observer = finished.append
+    _observers.append(observer)
+    try:
+        yield finished
+    finally:
+        _observers.remove(observer)
+
+    checked = [f for f in finished if route is None or f.route == route]
+    assert checked, f"No request{f' to {route}' if route else ''} was made"
+    over = [f for f in checked if f.queries.count > max_queries]
+    assert not over, "; ".join(
+        f"{f.method} {f.route} ran {f.queries.count} Mongo commands (budget {max_queries}): {f.queries.collections_header()}"
+        for f in over
+    )
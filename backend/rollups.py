@@ -0,0 +1,182 @@
+"""Daily booking rollups for analytics.
+
+``booking_rollups`` holds one document per (day, package_type, status,
+payment_status) with a booking ``count`` and ``amount`` total, where day is
+the booking's creation date. Booking writes keep it current with ``$inc``;
+analytics then read O(days) rollup rows instead of scanning bookings.
+
+The ``$inc`` runs after the booking write, not with it, so a crash in
+between leaves a row off by one, and rows are missing for bookings written
+before the rollups existed. Rebuild from scratch when deploying (required
+the first time, and after restoring a backup):
+
+    python rollups.py rebuild
+
+``RollupRebuilder`` also rebuilds daily at ``ROLLUP_REBUILD_HOUR_UTC``
+(off-peak; ``-1`` disables it), so drift never outlives a day. With several
+workers, only one of them runs it (see daily_jobs.py).
+"""
+import asyncio
+import os
+import sys
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import List, Optional
+
+from pymongo import ReturnDocument, UpdateOne
+
+from daily_jobs import DailyJob
+from etags import stamp
+
+ROLLUP_KEY_FIELDS = ("package_type", "status", "payment_status")
+ROLLUP_REBUILD_HOUR_UTC = int(os.environ.get('ROLLUP_REBUILD_HOUR_UTC', '21'))
+
+# Projection with everything needed to locate a booking's rollup row
+ROLLUP_PROJECTION = {"_id": 0, "created_at": 1, "amount": 1, **{field: 1 for field in ROLLUP_KEY_FIELDS}}
+
+
+def booking_day(created_at) -> str:
+    if isinstance(created_at, datetime):
+        return created_at.date().isoformat()
+    return str(created_at)[:10]
+
+
+def rollup_key(booking: dict) -> dict:
+    key = {"day": booking_day(booking.get('created_at'))}
+    for field in ROLLUP_KEY_FIELDS:
+        key[field] = booking.get(field)
+    return key
+
+
+def _inc(booking: dict, sign: int) -> UpdateOne:
+    return UpdateOne(
+        rollup_key(booking),
+        {"$inc": {"count": sign, "amount": sign * booking.get('amount', 0)}},
+        upsert=True
+    )
+
+
+async def record_created(db, booking: dict):
+    await db.booking_rollups.bulk_write([_inc(booking, 1)])
+
+
+async def record_transition(db, before: dict, after: dict):
+    """Move a booking from its old rollup row to its new one"""
+    if rollup_key(before) == rollup_key(after):
+        return
+    await db.booking_rollups.bulk_write([_inc(before, -1), _inc(after, 1)], ordered=False)
+
+
+async def update_booking_tracked(db, query: dict, set_fields: dict) -> Optional[dict]:
+    """``$set`` fields on one booking and keep its rollup row in step.
+
+    Returns the booking's rollup fields as they were before the update, or
+    None when nothing matched.
+    """
+    before = await db.bookings.find_one_and_update(
+        query,
+        stamp({"$set": set_fields}),
+        projection=ROLLUP_PROJECTION,
+        return_document=ReturnDocument.BEFORE
+    )
+    if before is not None:
+        after = {**before, **{k: v for k, v in set_fields.items() if k in ROLLUP_PROJECTION}}
+        await record_transition(db, before, after)
+    return before
+
+
+async def rebuild(db):
+    """Recompute every rollup row from the bookings collection.
+
+    ``$out`` swaps the collection in atomically (keeping its indexes), but
+    increments made while the rebuild runs are lost, so run it off-peak.
+    """
+    group_id = {"day": {"$substrBytes": [{"$toString": "$created_at"}, 0, 10]}}
+    group_id.update({field: f"${field}" for field in ROLLUP_KEY_FIELDS})
+    await db.bookings.aggregate([
+        {"$group": {
+            "_id": group_id,
+            "count": {"$sum": 1},
+            "amount": {"$sum": {"$ifNull": ["$amount", 0]}}
+        }},
+        {"$replaceWith": {"$mergeObjects": ["$_id", {"count": "$count", "amount": "$amount"}]}},
+        {"$out": "booking_rollups"}
+    ]).to_list(None)
+
+
+class RollupRebuilder(DailyJob):
+    """Runs ``rebuild`` once a day at ``hour`` UTC, on one worker only"""
+
+    name = "rollup_rebuild"
+
+    def __init__(self, db, hour: int = ROLLUP_REBUILD_HOUR_UTC):
+        super().__init__(db, hour)
+
+    async def run(self, day: str):
+        await rebuild(self.db)
+
+
+def bucket_of(day: str, bucket: str) -> str:
+    if bucket == "month":
+        return day[:7]
+    if bucket == "week":
+        d = date.fromisoformat(day)
+        return (d - timedelta(days=d.weekday())).isoformat()
+    return day
+
+
+async def load_rollups(db, start: str, end: str) -> List[dict]:
+    return await db.booking_rollups.find(
+        {"day": {"$gte": start, "$lte": end}},
+        {"_id": 0}
+    ).to_list(None)
+
+
+def summarize(rows: List[dict], bucket: str = "day") -> dict:
+    """Fold rollup rows into the analytics response"""
+    revenue_by_package = {}
+    series = {}
+    total_bookings = 0
+    paid_bookings = 0
+    paid_amount = 0
+
+    for row in rows:
+        total_bookings += row['count']
+        point = series.setdefault(bucket_of(row['day'], bucket), {"bookings": 0, "revenue": 0})
+        point["bookings"] += row['count']
+        if row.get('payment_status') == 'completed':
+            pkg = row.get('package_type') or 'unknown'
+            revenue_by_package[pkg] = revenue_by_package.get(pkg, 0) + row['amount']
+            paid_bookings += row['count']
+            paid_amount += row['amount']
+            point["revenue"] += row['amount']
+
+    return {
+        "revenue_by_package": revenue_by_package,
+        "average_booking_value": paid_amount / paid_bookings if paid_bookings else 0,
+        "total_bookings": total_bookings,
+        "completed_bookings": paid_bookings,
+        "series": [{"period": period, **values} for period, values in sorted(series.items())]
+    }
+
+
+async def _main(command: str) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        await rebuild(db)
+        print(f"Rebuilt {await db.booking_rollups.count_documents({})} rollup row(s)")
+        return 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "rebuild":
+        print(__doc__)
+        sys.exit(2)
+    sys.exit(asyncio.run(_main(sys.argv[1])))
@@ -0,0 +1,351 @@
+"""Daily route planning for field teams.
+
+A technician's route for a day visits their jobs slot by slot (the
+``service_time`` windows in order), starting from their base location.
+Within a slot, stops are ordered by nearest neighbour and then improved with
+2-opt over a NumPy haversine distance matrix. Travel time is estimated from
+distance with a detour factor and an average city speed; each stop gets an
+ETA that never precedes its window.
+
+Routes are stored in ``routes`` (one document per technician and day).
+``RouteBuilder`` precomputes the next day's routes (UTC dates) every night at
+``ROUTE_BUILD_HOUR_UTC`` on one API worker (see daily_jobs.py; ``-1``
+disables it). To build a day by hand:
+
+    python routing.py build [--date 2025-03-01]
+
+When a job is assigned, rescheduled or cancelled afterwards, ``sync_booking``
+inserts or removes just that stop and re-optimizes its slot. Every write
+increments the route's ``version``, and ``sync_booking`` only saves over the
+version it read, so concurrent syncs for the same technician and day retry
+instead of dropping each other's stops (and fall back to ``build_route``).
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from pymongo import UpdateOne
+
+from booking_queries import fetch_by_ids
+from daily_jobs import DailyJob
+from geo import haversine_km, point_lat_lng
+
+ROUTE_SPEED_KMH = float(os.environ.get('ROUTE_SPEED_KMH', '20'))
+ROUTE_DETOUR_FACTOR = float(os.environ.get('ROUTE_DETOUR_FACTOR', '1.4'))
+JOB_DURATION_MINUTES = int(os.environ.get('JOB_DURATION_MINUTES', '90'))
+SLOT_LENGTH_MINUTES = 180
+ROUTE_SYNC_ATTEMPTS = 3
+# 23:30 in India: after the day's jobs, before the next day's first slot
+ROUTE_BUILD_HOUR_UTC = int(os.environ.get('ROUTE_BUILD_HOUR_UTC', '18'))
+
+# Every assigned job except cancelled ones stays on the day's route
+ROUTE_QUERY_STATUS = {"$ne": "cancelled"}
+
+JOB_PROJECTION = {"_id": 0, "id": 1, "address_id": 1, "service_date": 1, "service_time": 1, "status": 1, "assigned_technician_id": 1}
+
+
+def route_id(technician_id: str, service_date: str) -> str:
+    return f"{technician_id}:{service_date}"
+
+
+def slot_start_minutes(service_time: Optional[str]) -> Optional[int]:
+    try:
+        hours, minutes = (service_time or "").split(":")[:2]
+        return int(hours) * 60 + int(minutes)
+    except ValueError:
+        return None
+
+
+def format_minutes(minutes: float) -> str:
+    minutes = int(round(minutes))
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def travel_minutes(distance_km: float) -> float:
+    return distance_km * ROUTE_DETOUR_FACTOR / ROUTE_SPEED_KMH * 60
+
+
+def _order_segment(origin: Optional[Tuple[float, float]], stops: List[dict]) -> List[dict]:
+    """Nearest neighbour then 2-opt over an open path starting at ``origin``"""
+    located = [s for s in stops if s.get("lat") is not None]
+    unlocated = [s for s in stops if s.get("lat") is None]
+    if len(located) < 2:
+        return located + unlocated
+
+    # Without an origin the path starts at the first stop
+    offset = 1 if origin else 0
+    points = np.array(([origin] if origin else []) + [(s["lat"], s["lng"]) for s in located], dtype=float)
+    matrix = haversine_km(points[:, :1], points[:, 1:], points[:, 0], points[:, 1])
+
+    path = [0]
+    remaining = set(range(1, len(points)))
+    while remaining:
+        nearest = min(remaining, key=lambda j: matrix[path[-1], j])
+        path.append(nearest)
+        remaining.remove(nearest)
+
+    # 2-opt: reverse path[i..k] while that shortens the route; path[0] stays fixed
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, len(path) - 1):
+            for k in range(i + 1, len(path)):
+                a, b, c = path[i - 1], path[i], path[k]
+                delta = matrix[a, c] - matrix[a, b]
+                if k + 1 < len(path):
+                    d = path[k + 1]
+                    delta += matrix[b, d] - matrix[c, d]
+                if delta < -1e-9:
+                    path[i:k + 1] = reversed(path[i:k + 1])
+                    improved = True
+
+    return [located[j - offset] for j in path if j >= offset] + unlocated
+
+
+def _slot_key(stop: dict) -> Tuple[int, int]:
+    start = slot_start_minutes(stop.get("service_time"))
+    # Jobs with an unparseable slot go last
+    return (1, 0) if start is None else (0, start)
+
+
+def _schedule(origin: Optional[Tuple[float, float]], stops: List[dict]) -> List[dict]:
+    """Fill in order, leg distance/time and ETA for stops already in visiting order"""
+    previous = origin
+    clock: Optional[float] = None
+    for order, stop in enumerate(stops, 1):
+        window = slot_start_minutes(stop.get("service_time"))
+        distance = None
+        if previous is not None and stop.get("lat") is not None:
+            distance = float(haversine_km(previous[0], previous[1], stop["lat"], stop["lng"]))
+        travel = travel_minutes(distance) if distance is not None else 0.0
+
+        # The first stop is reached at its window's start; later ones when travel allows
+        arrival = window if clock is None else clock + travel
+        if arrival is not None and window is not None:
+            arrival = max(arrival, window)
+
+        stop.update({
+            "order": order,
+            "distance_km": None if distance is None else round(distance, 2),
+            "travel_minutes": round(travel),
+            "eta": None if arrival is None else format_minutes(arrival),
+            "late": arrival is not None and window is not None and arrival >= window + SLOT_LENGTH_MINUTES,
+        })
+        if arrival is not None:
+            clock = arrival + JOB_DURATION_MINUTES
+        if stop.get("lat") is not None:
+            previous = (stop["lat"], stop["lng"])
+    return stops
+
+
+def plan_route(origin: Optional[Tuple[float, float]], stops: List[dict], reoptimize: Optional[set] = None) -> List[dict]:
+    """Order ``stops`` (dicts with booking_id, service_time, lat, lng) slot by slot.
+
+    With ``reoptimize``, only stops whose service_time is in that set are
+    reordered; the other slots keep their current order (incremental updates).
+    """
+    groups: Dict[Tuple[int, int], List[dict]] = {}
+    for stop in stops:
+        groups.setdefault(_slot_key(stop), []).append(stop)
+
+    ordered = []
+    current = origin
+    for key in sorted(groups):
+        group = groups[key]
+        if reoptimize is None or group[0].get("service_time") in reoptimize:
+            group = _order_segment(current, group)
+        ordered.extend(group)
+        located = [s for s in group if s.get("lat") is not None]
+        if located:
+            current = (located[-1]["lat"], located[-1]["lng"])
+    return _schedule(origin, ordered)
+
+
+def _route_document(technician_id: str, service_date: str, origin, stops: List[dict]) -> dict:
+    return {
+        "_id": route_id(technician_id, service_date),
+        "technician_id": technician_id,
+        "service_date": service_date,
+        "origin": list(origin) if origin else None,
+        "stops": stops,
+        "total_distance_km": round(sum(s["distance_km"] or 0 for s in stops), 2),
+        "total_travel_minutes": sum(s["travel_minutes"] for s in stops),
+        "computed_at": datetime.now(timezone.utc),
+    }
+
+
+def _versioned(route: dict) -> dict:
+    """Update document writing ``route`` and bumping its version"""
+    return {"$set": {key: value for key, value in route.items() if key != "_id"}, "$inc": {"version": 1}}
+
+
+def _stop(job: dict, address: Optional[dict]) -> dict:
+    address = address or {}
+    return {
+        "booking_id": job["id"],
+        "service_time": job.get("service_time"),
+        "lat": address.get("lat"),
+        "lng": address.get("lng"),
+    }
+
+
+async def build_route(db, technician_id: str, service_date: str) -> dict:
+    """Plan and store one technician's route for one day from scratch"""
+    technician, jobs = await asyncio.gather(
+        db.field_teams.find_one({"id": technician_id}, {"_id": 0, "base_location": 1}),
+        db.bookings.find(
+            {"assigned_technician_id": technician_id, "service_date": service_date, "status": ROUTE_QUERY_STATUS},
+            JOB_PROJECTION
+        ).to_list(None)
+    )
+    addresses = await fetch_by_ids(db.addresses, (j["address_id"] for j in jobs), {"_id": 0, "id": 1, "lat": 1, "lng": 1})
+    origin = point_lat_lng((technician or {}).get("base_location"))
+    stops = plan_route(origin, [_stop(job, addresses.get(job["address_id"])) for job in jobs])
+    route = _route_document(technician_id, service_date, origin, stops)
+    await db.routes.update_one({"_id": route["_id"]}, _versioned(route), upsert=True)
+    return route
+
+
+async def build_all(db, service_date: str) -> int:
+    """Plan and store every technician's route for ``service_date`` (the nightly batch)"""
+    jobs = await db.bookings.find(
+        {"service_date": service_date, "assigned_technician_id": {"$ne": None}, "status": ROUTE_QUERY_STATUS},
+        JOB_PROJECTION
+    ).to_list(None)
+    by_technician: Dict[str, List[dict]] = {}
+    for job in jobs:
+        by_technician.setdefault(job["assigned_technician_id"], []).append(job)
+
+    technicians, addresses = await asyncio.gather(
+        fetch_by_ids(db.field_teams, by_technician, {"_id": 0, "id": 1, "base_location": 1}),
+        fetch_by_ids(db.addresses, (j["address_id"] for j in jobs), {"_id": 0, "id": 1, "lat": 1, "lng": 1})
+    )
+
+    routes = []
+    for technician_id, technician_jobs in by_technician.items():
+        origin = point_lat_lng((technicians.get(technician_id) or {}).get("base_location"))
+        stops = plan_route(origin, [_stop(job, addresses.get(job["address_id"])) for job in technician_jobs])
+        routes.append(_route_document(technician_id, service_date, origin, stops))
+
+    if routes:
+        await db.routes.bulk_write([UpdateOne({"_id": r["_id"]}, _versioned(r), upsert=True) for r in routes], ordered=False)
+    # Technicians with no jobs left that day
+    await db.routes.delete_many({"service_date": service_date, "_id": {"$nin": [r["_id"] for r in routes]}})
+    return len(routes)
+
+
+def next_day(day: str) -> str:
+    return (date.fromisoformat(day) + timedelta(days=1)).isoformat()
+
+
+class RouteBuilder(DailyJob):
+    """Runs ``build_all`` for the next day once a day at ``hour`` UTC, on one worker only"""
+
+    name = "route_build"
+
+    def __init__(self, db, hour: int = ROUTE_BUILD_HOUR_UTC):
+        super().__init__(db, hour)
+
+    async def run(self, day: str):
+        service_date = next_day(day)
+        count = await build_all(self.db, service_date)
+        logging.info(f"Planned {count} route(s) for {service_date}")
+
+
+async def _save_stops(db, route: dict, stops: List[dict], reoptimize: set) -> bool:
+    """Re-plan and store ``stops``; False if the route changed since it was read"""
+    origin = tuple(route["origin"]) if route.get("origin") else None
+    stops = plan_route(origin, stops, reoptimize)
+    updated = _route_document(route["technician_id"], route["service_date"], origin, stops)
+    # Routes stored before versioning have no version field, which None matches
+    result = await db.routes.update_one({"_id": route["_id"], "version": route.get("version")}, _versioned(updated))
+    return result.matched_count == 1
+
+
+async def _remove_stop(db, route: dict, booking_id: str):
+    for _ in range(ROUTE_SYNC_ATTEMPTS):
+        removed = {s.get("service_time") for s in route["stops"] if s["booking_id"] == booking_id}
+        if await _save_stops(db, route, [s for s in route["stops"] if s["booking_id"] != booking_id], removed):
+            return
+        route = await db.routes.find_one({"_id": route["_id"]})
+        if route is None or not any(s["booking_id"] == booking_id for s in route["stops"]):
+            return
+    await build_route(db, route["technician_id"], route["service_date"])
+
+
+async def _add_stop(db, job: dict):
+    target = route_id(job["assigned_technician_id"], job["service_date"])
+    address = await db.addresses.find_one({"id": job["address_id"]}, {"_id": 0, "lat": 1, "lng": 1})
+    for _ in range(ROUTE_SYNC_ATTEMPTS):
+        route = await db.routes.find_one({"_id": target})
+        if route is None:
+            break
+        previous = {s.get("service_time") for s in route["stops"] if s["booking_id"] == job["id"]}
+        stops = [s for s in route["stops"] if s["booking_id"] != job["id"]] + [_stop(job, address)]
+        if await _save_stops(db, route, stops, previous | {job.get("service_time")}):
+            return
+    await build_route(db, job["assigned_technician_id"], job["service_date"])
+
+
+async def sync_booking(db, booking_id: str):
+    """Bring stored routes in line with one booking after it was assigned,
+    rescheduled or cancelled. Only the affected slots are re-optimized; a
+    route that keeps changing underneath is rebuilt from scratch instead."""
+    job = await db.bookings.find_one({"id": booking_id}, JOB_PROJECTION)
+    target = None
+    if job and job.get("assigned_technician_id") and job.get("service_date") and job.get("status") != "cancelled":
+        target = route_id(job["assigned_technician_id"], job["service_date"])
+
+    # Drop it from routes it no longer belongs to
+    async for route in db.routes.find({"stops.booking_id": booking_id, "_id": {"$ne": target}}):
+        await _remove_stop(db, route, booking_id)
+
+    if target is not None:
+        await _add_stop(db, job)
+
+
+async def sync_booking_logged(db, booking_id: str):
+    """``sync_booking`` for background tasks: failures are logged, since the
+    nightly batch rebuilds every route anyway"""
+    try:
+        await sync_booking(db, booking_id)
+    except Exception as e:
+        logging.error(f"Route sync for booking {booking_id} failed: {str(e)}")
+
+
+async def rebuild_routes_logged(db, routes):
+    """Rebuild several (technician_id, service_date) routes, e.g. after a batch assignment"""
+    for technician_id, service_date in routes:
+        try:
+            await build_route(db, technician_id, service_date)
+        except Exception as e:
+            logging.error(f"Route rebuild for {technician_id} on {service_date} failed: {str(e)}")
+
+
+async def _main(args) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True, tzinfo=timezone.utc)
+    db = client[os.environ['DB_NAME']]
+    try:
+        service_date = args.date or next_day(datetime.now(timezone.utc).date().isoformat())
+        count = await build_all(db, service_date)
+        print(f"Planned {count} route(s) for {service_date}")
+        return 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute technician routes for a day")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("--date", help="service date (YYYY-MM-DD), default tomorrow")
+    sys.exit(asyncio.run(_main(parser.parse_args())))
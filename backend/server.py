@@ -1,42 +1,108 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Request, File, UploadFile
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Request, Response, Query, File, UploadFile, BackgroundTasks
+from fastapi.responses import RedirectResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.gzip import GZipMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, TypeAdapter
 from typing import List, Optional
 import uuid
-from datetime import datetime, timezone, timedelta
+from datetime import datetime, date, timezone, timedelta
 import jwt
-from passlib.context import CryptContext
 import random
-import razorpay
 import cloudinary
 import cloudinary.uploader
-import base64
+import asyncio
+import json
+import hashlib
+from password_hashing import PasswordHasher, HasherOverloaded
+from db_indexes import ensure_indexes
+from booking_queries import count_bookings, enrich_bookings
+from pagination import paginate, InvalidCursor
+from cache import SingleFlightCache
+import rollups
+import assignment
+import routing
+import slots
+import booking_state
+import idempotency
+from payment_gateway import gateway_from_env, GatewayError, GatewayUnavailable
+from fast_json import json_response, partial_response
+from payment_events import PaymentEventWorker, record_event
+from blob_store import blob_store_from_env, media_url, parse_range, BlobNotFound, HASH_PATTERN
+from geo import point
+from events import event_hub_from_env, booking_event
+from etags import stamp, make_etag, list_etag, etag_matches, not_modified, set_etag
+from projections import booking_projection, is_partial, InvalidProjection
+from query_monitor import QueryListener, QueryMonitorMiddleware, DEBUG_HEADERS
+import metrics
+from slow_queries import SlowQueryRecorder, SlowQueryListener, top_offenders
+from image_pipeline import ImagePipeline, UploadLimitMiddleware, UploadTooLarge, InvalidImage, read_capped, thumbnail_url, with_thumbnails
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
+# Commands over SLOW_QUERY_MS are logged with sampled plans (see slow_queries.py)
+slow_query_recorder = SlowQueryRecorder()
+
+# MongoDB connection (timestamps are stored as BSON dates and decoded as aware UTC datetimes).
+# Every command is attributed to the request that issued it, see query_monitor.py
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(
+    mongo_url, tz_aware=True, tzinfo=timezone.utc,
+    event_listeners=[
+        QueryListener(),
+        metrics.CommandMetricsListener(),
+        metrics.PoolMetricsListener(),
+        SlowQueryListener(slow_query_recorder)
+    ]
+)
 db = client[os.environ['DB_NAME']]
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing (bcrypt runs in a process pool, off the event loop)
+password_hasher = PasswordHasher(
+    max_workers=int(os.environ.get('PASSWORD_HASH_WORKERS', '0')) or None,
+    max_queue=int(os.environ.get('PASSWORD_HASH_MAX_QUEUE', '64'))
+)
+
+metrics.Gauge("password_hash_queue_depth", "bcrypt operations queued or running",
+              callback=lambda: password_hasher.queue_depth)
+
+# Admin dashboard figures are shared by every admin tab for a few seconds
+dashboard_cache = SingleFlightCache(ttl_seconds=float(os.environ.get('DASHBOARD_CACHE_TTL', '10')))
 
 # JWT settings
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 720  # 30 days
 
-# Razorpay client
-razorpay_client = razorpay.Client(
-    auth=(os.environ.get('RAZORPAY_KEY_ID', ''), os.environ.get('RAZORPAY_KEY_SECRET', ''))
-)
+# Razorpay gateway (thread pool, timeouts, retries and circuit breaker; see payment_gateway.py)
+payment_gateway = gateway_from_env()
+
+metrics.Gauge("payment_gateway_circuit_open", "1 while the Razorpay circuit breaker is not closed",
+              callback=lambda: int(payment_gateway.breaker.state != "closed"))
+
+# Applies Razorpay webhook events in the background (see payment_events.py)
+payment_event_worker = PaymentEventWorker(db)
+
+# Daily rollup rebuild, repairing any drift (see rollups.py)
+rollup_rebuilder = rollups.RollupRebuilder(db)
+
+# Nightly precompute of the next day's technician routes (see routing.py)
+route_builder = routing.RouteBuilder(db)
+
+# Content-addressed media store used when Cloudinary is not configured (see blob_store.py)
+blob_store = blob_store_from_env(db)
+
+# Pushes booking updates to SSE subscribers (see events.py)
+event_hub = event_hub_from_env(db)
+
+# Strips EXIF, downsizes and thumbnails uploads in worker processes (see image_pipeline.py)
+image_pipeline = ImagePipeline(max_workers=int(os.environ.get('IMAGE_WORKERS', '2')))
 
 # Configure Cloudinary (optional - for production image hosting)
 cloudinary.config(
@@ -117,6 +183,7 @@ class Booking(BaseModel):
     tank_photo_url: Optional[str] = None
     service_date: str
     service_time: str
+    service_area: Optional[str] = None  # capacity area, see slots.py
     package_type: str
     add_disinfection: bool = False
     add_maintenance: bool = False
@@ -128,9 +195,14 @@ class Booking(BaseModel):
     payment_status: str = "pending"  # pending/completed/failed
     assigned_technician_id: Optional[str] = None
     checklist: Optional[dict] = None
-    incident_reports: Optional[List[dict]] = None
+    incident_reports: List[dict] = Field(default_factory=list)  # $push needs an array, see migrate_incident_reports.py
     customer_signature: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    version: int = 1  # incremented by every write, see etags.stamp
+
+# Compiled once; only used when RESPONSE_VALIDATION is on (see fast_json.py)
+bookings_adapter = TypeAdapter(List[Booking])
 
 class PaymentOrder(BaseModel):
     booking_id: str
@@ -142,11 +214,38 @@ class VerifyPayment(BaseModel):
     booking_id: str
 
 # Helper functions
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+def password_hasher_busy() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Server busy, please retry",
+        headers={"Retry-After": "1"}
+    )
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def hash_password(password: str) -> str:
+    try:
+        return await password_hasher.hash(password)
+    except HasherOverloaded:
+        raise password_hasher_busy()
+
+async def authenticate(collection, email: str, password: str, background_tasks: BackgroundTasks) -> Optional[dict]:
+    """Return the account document if the credentials are valid, else None"""
+    account = await collection.find_one({"email": email})
+    if not account:
+        return None
+    
+    try:
+        valid, needs_rehash = await password_hasher.verify(password, account['password'])
+    except HasherOverloaded:
+        raise password_hasher_busy()
+    
+    if not valid:
+        return None
+    
+    # Upgrade hashes created with outdated cost parameters
+    if needs_rehash:
+        background_tasks.add_task(password_hasher.rehash_in_background, collection, account['id'], password)
+    
+    return account
 
 def create_jwt_token(user_id: str) -> str:
     expiration = datetime.now(timezone.utc) + timedelta(hours=JWT_EXPIRATION_HOURS)
@@ -172,6 +271,105 @@ async def get_current_user(authorization: str = Header(None)) -> str:
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+async def fetch_page(response: Response, collection, query: dict, projection: dict,
+                     sort_field: str, direction: int, limit: int, cursor: Optional[str]) -> List[dict]:
+    """Keyset-paginated find; the next page's cursor is returned in the X-Next-Cursor header"""
+    try:
+        docs, next_cursor = await paginate(collection, query, projection, sort_field, direction, limit, cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return docs
+
+def projection_for(view: Optional[str], fields: Optional[str], required: tuple = ()) -> dict:
+    """Mongo projection for the view/fields query parameters (see projections.py)"""
+    try:
+        return booking_projection(view, fields, required)
+    except InvalidProjection as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def transition_booking(name: str, query: dict, set_fields: Optional[dict] = None,
+                             push: Optional[dict] = None, not_found: str = "Booking not found",
+                             return_before: bool = False):
+    """Run a booking state transition (see booking_state.py), mapping failures to 404/409.
+    Returns the updated booking, or (before, after) with ``return_before``."""
+    try:
+        before, after = await booking_state.apply(db, name, query, set_fields, push)
+        return (before, after) if return_before else after
+    except booking_state.BookingNotFound:
+        raise HTTPException(status_code=404, detail=not_found)
+    except booking_state.InvalidTransition as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+async def reserve_slot(service_date: str, service_time: str, area: str):
+    """Take a place in a slot (see slots.py), mapping failures to 400/409"""
+    try:
+        slots.validate_slot(service_date, service_time)
+        await slots.reserve(db, service_date, service_time, area)
+    except slots.InvalidSlot as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except slots.SlotFull:
+        raise HTTPException(status_code=409, detail="Selected slot is full")
+
+async def reschedule_with_slot(query: dict, service_date: str, service_time: str) -> dict:
+    """Move a booking to another slot: the new place is reserved first and the old one released after"""
+    booking = await db.bookings.find_one(
+        query, {"_id": 0, "address_id": 1, "service_date": 1, "service_time": 1, "service_area": 1, "slot_reserved": 1}
+    )
+    if not booking:
+        raise HTTPException(status_code=404, detail="Booking not found")
+    
+    area = booking.get("service_area")
+    if area is None:
+        # Booked before slot capacity existed
+        address = await db.addresses.find_one({"id": booking["address_id"]}, {"_id": 0, "lat": 1, "lng": 1})
+        area = slots.service_area(address)
+    
+    new_slot = (service_date, service_time, area)
+    old_slot = (booking["service_date"], booking["service_time"], area)
+    if new_slot == old_slot and booking.get("slot_reserved"):
+        return await transition_booking("reschedule", query)
+    
+    await reserve_slot(*new_slot)
+    try:
+        # Guarded on the old slot, so a concurrent reschedule cannot release the wrong place
+        updated = await transition_booking(
+            "reschedule",
+            {**query, "service_date": booking["service_date"], "service_time": booking["service_time"]},
+            {
+                "service_date": service_date,
+                "service_time": service_time,
+                "service_area": area,
+                "slot_reserved": True
+            }
+        )
+    except BaseException:
+        await slots.unreserve(db, *new_slot)
+        raise
+    
+    if booking.get("slot_reserved"):
+        await slots.unreserve(db, *old_slot)
+    return updated
+
+async def idempotent(response: Response, key: Optional[str], scope: str, payload: BaseModel, execute):
+    """Run ``execute`` at most once per Idempotency-Key (see idempotency.py)"""
+    if not key:
+        return await execute()
+    if len(key) > idempotency.MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail="Idempotency-Key too long")
+    
+    try:
+        result, replayed = await idempotency.run(db, scope, key, payload.model_dump_json(), execute)
+    except idempotency.KeyReused:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+    except idempotency.StillInFlight:
+        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+    
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
 def calculate_booking_amount(booking_data: BookingCreate) -> int:
     """Calculate booking amount in paise"""
     base_price = 150000  # Rs 1500
@@ -204,17 +402,16 @@ async def register(user_data: UserRegister):
     )
     
     user_dict = user.model_dump()
-    user_dict['password'] = hash_password(user_data.password)
-    user_dict['created_at'] = user_dict['created_at'].isoformat()
+    user_dict['password'] = await hash_password(user_data.password)
     
     await db.users.insert_one(user_dict)
     
     return {"message": "User registered successfully", "email": user.email}
 
 @api_router.post("/auth/login")
-async def login(credentials: UserLogin):
-    user = await db.users.find_one({"email": credentials.email})
-    if not user or not verify_password(credentials.password, user['password']):
+async def login(credentials: UserLogin, background_tasks: BackgroundTasks):
+    user = await authenticate(db.users, credentials.email, credentials.password, background_tasks)
+    if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     token = create_jwt_token(user['id'])
@@ -241,8 +438,8 @@ async def send_otp(data: SendOTP):
         {"email": data.email},
         {"$set": {
             "otp": otp,
-            "expiry": expiry.isoformat(),
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "expiry": expiry,
+            "created_at": datetime.now(timezone.utc)
         }},
         upsert=True
     )
@@ -259,8 +456,7 @@ async def verify_otp(data: VerifyOTP):
     if not otp_record:
         raise HTTPException(status_code=400, detail="OTP not found")
     
-    expiry = datetime.fromisoformat(otp_record['expiry'])
-    if datetime.now(timezone.utc) > expiry:
+    if datetime.now(timezone.utc) > otp_record['expiry']:
         raise HTTPException(status_code=400, detail="OTP expired")
     
     if otp_record['otp'] != data.otp:
@@ -278,10 +474,15 @@ async def verify_otp(data: VerifyOTP):
     return {"message": "Email verified successfully"}
 
 @api_router.get("/auth/me")
-async def get_me(user_id: str = Depends(get_current_user)):
+async def get_me(request: Request, response: Response, user_id: str = Depends(get_current_user)):
     user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    
+    etag = make_etag(user)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
     return user
 
 # Address Routes
@@ -293,7 +494,6 @@ async def create_address(address_data: AddressCreate, user_id: str = Depends(get
     )
     
     address_dict = address.model_dump()
-    address_dict['created_at'] = address_dict['created_at'].isoformat()
     
     await db.addresses.insert_one(address_dict)
     return address
@@ -302,10 +502,6 @@ async def create_address(address_data: AddressCreate, user_id: str = Depends(get
 async def get_addresses(user_id: str = Depends(get_current_user)):
     addresses = await db.addresses.find({"user_id": user_id}, {"_id": 0}).to_list(100)
     
-    for addr in addresses:
-        if isinstance(addr['created_at'], str):
-            addr['created_at'] = datetime.fromisoformat(addr['created_at'])
-    
     return addresses
 
 @api_router.delete("/addresses/{address_id}")
@@ -331,14 +527,10 @@ async def update_address(address_id: str, address_data: AddressCreate, user_id:
     
     # Return updated address
     updated_address = await db.addresses.find_one({"id": address_id}, {"_id": 0})
-    if isinstance(updated_address.get('created_at'), str):
-        updated_address['created_at'] = datetime.fromisoformat(updated_address['created_at'])
-    
     return updated_address
 
 # Booking Routes
-@api_router.post("/bookings", response_model=Booking)
-async def create_booking(booking_data: BookingCreate, user_id: str = Depends(get_current_user)):
+async def insert_booking(booking_data: BookingCreate, user_id: str) -> Booking:
     # Verify address belongs to user
     address = await db.addresses.find_one({"id": booking_data.address_id, "user_id": user_id})
     if not address:
@@ -347,37 +539,79 @@ async def create_booking(booking_data: BookingCreate, user_id: str = Depends(get
     # Calculate amount
     amount = calculate_booking_amount(booking_data)
     
+    area = slots.service_area(address)
+    await reserve_slot(booking_data.service_date, booking_data.service_time, area)
+    
     booking = Booking(
         user_id=user_id,
         amount=amount,
+        service_area=area,
         **booking_data.model_dump()
     )
     
     booking_dict = booking.model_dump()
-    booking_dict['created_at'] = booking_dict['created_at'].isoformat()
+    booking_dict["slot_reserved"] = True
     
-    await db.bookings.insert_one(booking_dict)
+    try:
+        await db.bookings.insert_one(booking_dict)
+    except BaseException:
+        await slots.unreserve(db, booking_data.service_date, booking_data.service_time, area)
+        raise
+    await rollups.record_created(db, booking_dict)
     return booking
 
+@api_router.post("/bookings", response_model=Booking)
+async def create_booking(
+    booking_data: BookingCreate,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None),
+    user_id: str = Depends(get_current_user)
+):
+    return await idempotent(
+        response, idempotency_key, f"bookings:{user_id}", booking_data,
+        lambda: insert_booking(booking_data, user_id)
+    )
+
 @api_router.get("/bookings", response_model=List[Booking])
-async def get_bookings(user_id: str = Depends(get_current_user)):
-    bookings = await db.bookings.find({"user_id": user_id}, {"_id": 0}).sort("created_at", -1).to_list(100)
+async def get_bookings(
+    request: Request,
+    response: Response,
+    limit: int = Query(100, ge=1, le=100),
+    cursor: Optional[str] = None,
+    view: Optional[str] = None,
+    fields: Optional[str] = None,
+    user_id: str = Depends(get_current_user)
+):
+    projection = projection_for(view, fields)
+    query = {"user_id": user_id}
+    
+    # Tagged before reading, so a concurrent write can only make the tag stale, never the body
+    etag = await list_etag(db.bookings, query, limit, cursor, projection)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
     
-    for booking in bookings:
-        if isinstance(booking['created_at'], str):
-            booking['created_at'] = datetime.fromisoformat(booking['created_at'])
+    bookings = await fetch_page(response, db.bookings, query, projection, "created_at", -1, limit, cursor)
     
-    return bookings
+    bookings = [with_thumbnails(b) for b in bookings]
+    if is_partial(projection):
+        return partial_response(bookings, response)
+    return json_response(bookings, response, bookings_adapter)
 
 @api_router.get("/bookings/{booking_id}", response_model=Booking)
-async def get_booking(booking_id: str, user_id: str = Depends(get_current_user)):
-    booking = await db.bookings.find_one({"id": booking_id, "user_id": user_id}, {"_id": 0})
+async def get_booking(
+    booking_id: str,
+    view: Optional[str] = None,
+    fields: Optional[str] = None,
+    user_id: str = Depends(get_current_user)
+):
+    projection = projection_for(view, fields)
+    booking = await db.bookings.find_one({"id": booking_id, "user_id": user_id}, projection)
     if not booking:
         raise HTTPException(status_code=404, detail="Booking not found")
     
-    if isinstance(booking['created_at'], str):
-        booking['created_at'] = datetime.fromisoformat(booking['created_at'])
-    
+    if is_partial(projection):
+        return partial_response(booking)
     return booking
 
 @api_router.put("/bookings/{booking_id}/reschedule")
@@ -385,49 +619,67 @@ async def reschedule_booking_customer(
     booking_id: str,
     service_date: str,
     service_time: str,
+    background_tasks: BackgroundTasks,
     user_id: str = Depends(get_current_user)
 ):
     """Customer can reschedule their own booking"""
-    booking = await db.bookings.find_one({"id": booking_id, "user_id": user_id})
-    if not booking:
-        raise HTTPException(status_code=404, detail="Booking not found")
-    
-    if booking['status'] in ['completed', 'cancelled']:
-        raise HTTPException(status_code=400, detail="Cannot reschedule completed or cancelled bookings")
-    
-    await db.bookings.update_one(
-        {"id": booking_id, "user_id": user_id},
-        {"$set": {
-            "service_date": service_date,
-            "service_time": service_time
-        }}
-    )
+    await reschedule_with_slot({"id": booking_id, "user_id": user_id}, service_date, service_time)
+    background_tasks.add_task(routing.sync_booking_logged, db, booking_id)
     
     return {"message": "Booking rescheduled successfully"}
 
 @api_router.delete("/bookings/{booking_id}")
 async def cancel_booking_customer(
     booking_id: str,
+    background_tasks: BackgroundTasks,
     user_id: str = Depends(get_current_user)
 ):
     """Customer can cancel their own booking"""
-    booking = await db.bookings.find_one({"id": booking_id, "user_id": user_id})
-    if not booking:
-        raise HTTPException(status_code=404, detail="Booking not found")
+    await transition_booking("cancel", {"id": booking_id, "user_id": user_id})
+    await slots.release_booking(db, booking_id)
+    background_tasks.add_task(routing.sync_booking_logged, db, booking_id)
     
-    if booking['status'] in ['completed']:
-        raise HTTPException(status_code=400, detail="Cannot cancel completed bookings")
+    return {"message": "Booking cancelled successfully"}
+
+# Slot Routes
+@api_router.get("/slots/availability")
+async def get_slot_availability(
+    start: str = Query(..., alias="from"),
+    end: str = Query(..., alias="to"),
+    address_id: Optional[str] = None,
+    user_id: str = Depends(get_current_user)
+):
+    """Capacity left in every slot from ``from`` to ``to`` (inclusive) for an address's area"""
+    try:
+        first, last = date.fromisoformat(start), date.fromisoformat(end)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+    if last < first or (last - first).days >= slots.MAX_AVAILABILITY_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range must be 1 to {slots.MAX_AVAILABILITY_DAYS} days")
     
-    await db.bookings.update_one(
-        {"id": booking_id, "user_id": user_id},
-        {"$set": {"status": "cancelled"}}
-    )
+    address = None
+    if address_id:
+        address = await db.addresses.find_one({"id": address_id, "user_id": user_id}, {"_id": 0, "lat": 1, "lng": 1})
+        if not address:
+            raise HTTPException(status_code=404, detail="Address not found")
     
-    return {"message": "Booking cancelled successfully"}
+    area = slots.service_area(address)
+    return {"area": area, "slots": await slots.availability(db, area, first, last)}
 
 # Payment Routes
 @api_router.post("/payments/create-order")
-async def create_payment_order(data: PaymentOrder, user_id: str = Depends(get_current_user)):
+async def create_payment_order(
+    data: PaymentOrder,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None),
+    user_id: str = Depends(get_current_user)
+):
+    return await idempotent(
+        response, idempotency_key, f"payment-orders:{user_id}", data,
+        lambda: create_order_for_booking(data, user_id)
+    )
+
+async def create_order_for_booking(data: PaymentOrder, user_id: str) -> dict:
     # Get booking
     booking = await db.bookings.find_one({"id": data.booking_id, "user_id": user_id})
     if not booking:
@@ -436,65 +688,88 @@ async def create_payment_order(data: PaymentOrder, user_id: str = Depends(get_cu
     # Check if payment is COD
     if booking['payment_method'] == 'cod':
         # For COD, just mark as confirmed
-        await db.bookings.update_one(
+        await rollups.update_booking_tracked(
+            db,
             {"id": data.booking_id},
-            {"$set": {"status": "confirmed", "payment_status": "pending"}}
+            {"status": "confirmed", "payment_status": "pending"}
         )
         return {"payment_method": "cod", "message": "Booking confirmed"}
     
     # Create Razorpay order
     try:
-        razorpay_order = razorpay_client.order.create({
-            "amount": booking['amount'],
-            "currency": "INR",
-            "payment_capture": 1
-        })
-        
-        # Update booking with order_id
-        await db.bookings.update_one(
-            {"id": data.booking_id},
-            {"$set": {"razorpay_order_id": razorpay_order['id']}}
-        )
-        
-        return {
-            "order_id": razorpay_order['id'],
-            "amount": razorpay_order['amount'],
-            "currency": razorpay_order['currency'],
-            "key_id": os.environ.get('RAZORPAY_KEY_ID', '')
-        }
-    except Exception as e:
+        razorpay_order = await payment_gateway.create_order(booking['amount'], "INR", receipt=booking['id'])
+    except GatewayUnavailable as e:
+        logging.error(f"Razorpay order creation failed: {str(e)}")
+        raise HTTPException(status_code=503, detail="Payment gateway unavailable, please retry")
+    except GatewayError as e:
         logging.error(f"Razorpay order creation failed: {str(e)}")
         raise HTTPException(status_code=500, detail="Payment order creation failed")
+    
+    # Update booking with order_id
+    await db.bookings.update_one(
+        {"id": data.booking_id},
+        stamp({"$set": {"razorpay_order_id": razorpay_order['id']}})
+    )
+    
+    return {
+        "order_id": razorpay_order['id'],
+        "amount": razorpay_order['amount'],
+        "currency": razorpay_order['currency'],
+        "key_id": payment_gateway.key_id
+    }
 
 @api_router.post("/payments/verify")
 async def verify_payment(data: VerifyPayment, user_id: str = Depends(get_current_user)):
-    try:
-        # Verify signature
-        params_dict = {
-            'razorpay_order_id': data.razorpay_order_id,
-            'razorpay_payment_id': data.razorpay_payment_id,
-            'razorpay_signature': data.razorpay_signature
-        }
-        
-        razorpay_client.utility.verify_payment_signature(params_dict)
-        
-        # Update booking
-        await db.bookings.update_one(
-            {"id": data.booking_id, "user_id": user_id},
-            {"$set": {
-                "payment_status": "completed",
-                "status": "confirmed"
-            }}
-        )
-        
-        return {"message": "Payment verified successfully"}
-    except Exception as e:
-        logging.error(f"Payment verification failed: {str(e)}")
-        await db.bookings.update_one(
+    # Verify signature locally (HMAC, no gateway call)
+    valid = payment_gateway.verify_payment_signature(
+        data.razorpay_order_id,
+        data.razorpay_payment_id,
+        data.razorpay_signature
+    )
+    
+    if not valid:
+        logging.error(f"Payment verification failed: invalid signature for order {data.razorpay_order_id}")
+        await rollups.update_booking_tracked(
+            db,
             {"id": data.booking_id, "user_id": user_id},
-            {"$set": {"payment_status": "failed"}}
+            {"payment_status": "failed"}
         )
         raise HTTPException(status_code=400, detail="Payment verification failed")
+    
+    # Update booking
+    await rollups.update_booking_tracked(
+        db,
+        {"id": data.booking_id, "user_id": user_id},
+        {
+            "payment_status": "completed",
+            "status": "confirmed"
+        }
+    )
+    
+    return {"message": "Payment verified successfully"}
+
+@api_router.post("/payments/webhook")
+async def payment_webhook(
+    request: Request,
+    x_razorpay_signature: Optional[str] = Header(None),
+    x_razorpay_event_id: Optional[str] = Header(None)
+):
+    """Razorpay webhook: verify, persist and acknowledge; the event is applied asynchronously"""
+    body = await request.body()
+    if not payment_gateway.verify_webhook_signature(body, x_razorpay_signature):
+        raise HTTPException(status_code=400, detail="Invalid webhook signature")
+    
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid webhook payload")
+    
+    # Razorpay sends the event id in a header; fall back to a digest of the body
+    event_id = x_razorpay_event_id or hashlib.sha256(body).hexdigest()
+    if await record_event(db, event_id, payload):
+        payment_event_worker.notify()
+    
+    return {"status": "ok"}
 
 # Field Team Models
 class FieldTeamRegister(BaseModel):
@@ -503,6 +778,9 @@ class FieldTeamRegister(BaseModel):
     name: str
     phone: str
     employee_id: str
+    base_lat: Optional[float] = Field(None, ge=-90, le=90)
+    base_lng: Optional[float] = Field(None, ge=-180, le=180)
+    skills: List[str] = ["manual", "automated"]
 
 class FieldTeamLogin(BaseModel):
     email: EmailStr
@@ -516,15 +794,40 @@ class FieldTeam(BaseModel):
     phone: str
     employee_id: str
     active: bool = True
+    base_location: Optional[dict] = None  # GeoJSON point, see geo.point
+    skills: List[str] = ["manual", "automated"]  # package types serviced
+    max_jobs_per_day: int = assignment.DEFAULT_MAX_JOBS_PER_DAY
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class FieldTeamProfileUpdate(BaseModel):
+    base_lat: Optional[float] = Field(None, ge=-90, le=90)
+    base_lng: Optional[float] = Field(None, ge=-180, le=180)
+    skills: Optional[List[str]] = None
+    max_jobs_per_day: Optional[int] = Field(None, ge=1)
+    active: Optional[bool] = None
+
+CHECKLIST_STEPS = [
+    "arrival",
+    "customer_verification",
+    "pre_inspection",
+    "drain",
+    "scrub",
+    "high_pressure_clean",
+    "disinfection",
+    "final_rinse"
+]
+
 class ChecklistUpdate(BaseModel):
     step_name: str
     status: str  # completed/pending/na/escalate
     notes: Optional[str] = None
     photo_url: Optional[str] = None
+    photo_urls: Optional[List[str]] = None
     timestamp: Optional[str] = None
 
+class ChecklistBatchUpdate(BaseModel):
+    updates: List[ChecklistUpdate]
+
 class IncidentReport(BaseModel):
     description: str
     severity: str  # low/medium/high/critical
@@ -546,25 +849,32 @@ async def register_field_team(team_data: FieldTeamRegister):
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Create field team member
+    if any(skill not in assignment.PACKAGE_TYPES for skill in team_data.skills):
+        raise HTTPException(status_code=400, detail="Unknown skill")
+    if (team_data.base_lat is None) != (team_data.base_lng is None):
+        raise HTTPException(status_code=400, detail="base_lat and base_lng must be given together")
+    
     team_member = FieldTeam(
         email=team_data.email,
         name=team_data.name,
         phone=team_data.phone,
-        employee_id=team_data.employee_id
+        employee_id=team_data.employee_id,
+        skills=team_data.skills
     )
+    if team_data.base_lat is not None:
+        team_member.base_location = point(team_data.base_lat, team_data.base_lng)
     
     team_dict = team_member.model_dump()
-    team_dict['password'] = hash_password(team_data.password)
-    team_dict['created_at'] = team_dict['created_at'].isoformat()
+    team_dict['password'] = await hash_password(team_data.password)
     
     await db.field_teams.insert_one(team_dict)
     
     return {"message": "Field team member registered successfully"}
 
 @api_router.post("/field/login")
-async def field_login(credentials: FieldTeamLogin):
-    team_member = await db.field_teams.find_one({"email": credentials.email})
-    if not team_member or not verify_password(credentials.password, team_member['password']):
+async def field_login(credentials: FieldTeamLogin, background_tasks: BackgroundTasks):
+    team_member = await authenticate(db.field_teams, credentials.email, credentials.password, background_tasks)
+    if not team_member:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     if not team_member.get('active', True):
@@ -608,19 +918,45 @@ async def get_field_me(team_id: str = Depends(get_current_field_team)):
     return team_member
 
 @api_router.get("/field/jobs")
-async def get_field_jobs(team_id: str = Depends(get_current_field_team)):
+async def get_field_jobs(
+    request: Request,
+    response: Response,
+    limit: int = Query(100, ge=1, le=100),
+    cursor: Optional[str] = None,
+    view: Optional[str] = None,
+    fields: Optional[str] = None,
+    team_id: str = Depends(get_current_field_team)
+):
     # Get jobs assigned to this technician
-    jobs = await db.bookings.find({
+    query = {
         "assigned_technician_id": team_id,
         "status": {"$in": ["confirmed", "in-progress"]}
-    }, {"_id": 0}).sort("service_date", 1).to_list(100)
+    }
+    projection = projection_for(view, fields)
     
-    # Convert datetime strings
-    for job in jobs:
-        if isinstance(job.get('created_at'), str):
-            job['created_at'] = datetime.fromisoformat(job['created_at'])
+    etag = await list_etag(db.bookings, query, limit, cursor, projection)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
     
-    return jobs
+    jobs = await fetch_page(response, db.bookings, query, projection, "service_date", 1, limit, cursor)
+    
+    return json_response([with_thumbnails(job) for job in jobs], response)
+
+# Declared before /field/jobs/{job_id} so "route" is not taken for a job id
+@api_router.get("/field/jobs/route")
+async def get_field_route(
+    service_date: Optional[str] = None,
+    team_id: str = Depends(get_current_field_team)
+):
+    """The technician's jobs for a day in visiting order, with travel estimates (see routing.py)"""
+    service_date = service_date or datetime.now(timezone.utc).date().isoformat()
+    route = await db.routes.find_one({"_id": routing.route_id(team_id, service_date)}, {"_id": 0})
+    if route is None:
+        # Not precomputed yet (e.g. the nightly batch has not run for this day)
+        route = await routing.build_route(db, team_id, service_date)
+        route.pop("_id")
+    return route
 
 @api_router.get("/field/jobs/{job_id}")
 async def get_field_job(job_id: str, team_id: str = Depends(get_current_field_team)):
@@ -638,9 +974,6 @@ async def get_field_job(job_id: str, team_id: str = Depends(get_current_field_te
     # Get customer details
     customer = await db.users.find_one({"id": job['user_id']}, {"_id": 0, "password": 0})
     
-    if isinstance(job.get('created_at'), str):
-        job['created_at'] = datetime.fromisoformat(job['created_at'])
-    
     return {
         "job": job,
         "address": address,
@@ -649,70 +982,88 @@ async def get_field_job(job_id: str, team_id: str = Depends(get_current_field_te
 
 @api_router.post("/field/jobs/{job_id}/start")
 async def start_job(job_id: str, team_id: str = Depends(get_current_field_team)):
-    job = await db.bookings.find_one({"id": job_id, "assigned_technician_id": team_id})
-    if not job:
-        raise HTTPException(status_code=404, detail="Job not found")
-    
     # Initialize checklist
     checklist = {
-        "started_at": datetime.now(timezone.utc).isoformat(),
+        "started_at": datetime.now(timezone.utc),
         "steps": {
-            "arrival": {"status": "pending", "timestamp": None, "photos": [], "notes": ""},
-            "customer_verification": {"status": "pending", "timestamp": None, "photos": [], "notes": ""},
-            "pre_inspection": {"status": "pending", "timestamp": None, "photos": [], "notes": ""},
-            "drain": {"status": "pending", "timestamp": None, "photos": [], "notes": ""},
-            "scrub": {"status": "pending", "timestamp": None, "photos": [], "notes": ""},
-            "high_pressure_clean": {"status": "pending", "timestamp": None, "photos": [], "notes": ""},
-            "disinfection": {"status": "pending", "timestamp": None, "photos": [], "notes": ""},
-            "final_rinse": {"status": "pending", "timestamp": None, "photos": [], "notes": ""}
+            step: {"status": "pending", "timestamp": None, "photos": [], "notes": ""}
+            for step in CHECKLIST_STEPS
         },
         "chemicals_used": [],
         "water_usage": 0
     }
     
-    await db.bookings.update_one(
-        {"id": job_id},
-        {"$set": {
-            "status": "in-progress",
+    booking = await transition_booking(
+        "start",
+        {"id": job_id, "assigned_technician_id": team_id},
+        {
             "checklist": checklist,
-            "started_at": datetime.now(timezone.utc).isoformat()
-        }}
+            "started_at": checklist["started_at"]
+        },
+        not_found="Job not found"
     )
+    await event_hub.publish(booking_event("job.started", booking))
     
     return {"message": "Job started successfully", "checklist": checklist}
 
+def build_checklist_update(updates: List[ChecklistUpdate]) -> dict:
+    """Fold checklist step updates into a single $set/$push update document"""
+    now = datetime.now(timezone.utc).isoformat()
+    set_fields = {}
+    push_photos = {}
+    
+    for update in updates:
+        if update.step_name not in CHECKLIST_STEPS:
+            raise HTTPException(status_code=400, detail=f"Unknown checklist step: {update.step_name}")
+        
+        prefix = f"checklist.steps.{update.step_name}"
+        set_fields[f"{prefix}.status"] = update.status
+        set_fields[f"{prefix}.timestamp"] = update.timestamp or now
+        
+        if update.notes:
+            set_fields[f"{prefix}.notes"] = update.notes
+        
+        photos = ([update.photo_url] if update.photo_url else []) + (update.photo_urls or [])
+        if photos:
+            push_photos.setdefault(f"{prefix}.photos", []).extend(photos)
+    
+    update_doc = {"$set": set_fields}
+    if push_photos:
+        update_doc["$push"] = {path: {"$each": photos} for path, photos in push_photos.items()}
+    return update_doc
+
+async def apply_checklist_update(job_id: str, team_id: str, updates: List[ChecklistUpdate]):
+    # One conditional write: ownership check, status and photos together
+    result = await db.bookings.update_one(
+        {"id": job_id, "assigned_technician_id": team_id},
+        stamp(build_checklist_update(updates))
+    )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Job not found")
+
 @api_router.put("/field/jobs/{job_id}/checklist")
 async def update_checklist(
     job_id: str,
     update: ChecklistUpdate,
     team_id: str = Depends(get_current_field_team)
 ):
-    job = await db.bookings.find_one({"id": job_id, "assigned_technician_id": team_id})
-    if not job:
-        raise HTTPException(status_code=404, detail="Job not found")
+    await apply_checklist_update(job_id, team_id, [update])
     
-    # Update checklist step
-    update_data = {
-        f"checklist.steps.{update.step_name}.status": update.status,
-        f"checklist.steps.{update.step_name}.timestamp": update.timestamp or datetime.now(timezone.utc).isoformat()
-    }
-    
-    if update.notes:
-        update_data[f"checklist.steps.{update.step_name}.notes"] = update.notes
-    
-    if update.photo_url:
-        # Add photo to array
-        await db.bookings.update_one(
-            {"id": job_id},
-            {"$push": {f"checklist.steps.{update.step_name}.photos": update.photo_url}}
-        )
+    return {"message": "Checklist updated successfully"}
+
+@api_router.post("/field/jobs/{job_id}/checklist/batch")
+async def update_checklist_batch(
+    job_id: str,
+    batch: ChecklistBatchUpdate,
+    team_id: str = Depends(get_current_field_team)
+):
+    """Apply several checklist step updates (with notes and photos) in one request"""
+    if not batch.updates:
+        raise HTTPException(status_code=400, detail="No checklist updates provided")
     
-    await db.bookings.update_one(
-        {"id": job_id},
-        {"$set": update_data}
-    )
+    await apply_checklist_update(job_id, team_id, batch.updates)
     
-    return {"message": "Checklist updated successfully"}
+    return {"message": "Checklist updated successfully", "updated_steps": len(batch.updates)}
 
 @api_router.post("/field/jobs/{job_id}/incident")
 async def report_incident(
@@ -720,31 +1071,35 @@ async def report_incident(
     incident: IncidentReport,
     team_id: str = Depends(get_current_field_team)
 ):
-    job = await db.bookings.find_one({"id": job_id, "assigned_technician_id": team_id})
-    if not job:
-        raise HTTPException(status_code=404, detail="Job not found")
-    
     incident_data = {
         "id": str(uuid.uuid4()),
         "description": incident.description,
         "severity": incident.severity,
         "photo_urls": incident.photo_urls or [],
         "unable_to_proceed": incident.unable_to_proceed,
-        "reported_at": datetime.now(timezone.utc).isoformat(),
+        "reported_at": datetime.now(timezone.utc),
         "reported_by": team_id
     }
     
-    await db.bookings.update_one(
-        {"id": job_id},
-        {"$push": {"incident_reports": incident_data}}
-    )
+    query = {"id": job_id, "assigned_technician_id": team_id}
+    push = {"incident_reports": incident_data}
     
-    # If unable to proceed, mark job status
+    # If unable to proceed, record the incident and escalate the job in one write
     if incident.unable_to_proceed:
-        await db.bookings.update_one(
-            {"id": job_id},
-            {"$set": {"status": "escalated"}}
+        booking = await transition_booking("escalate", query, push=push, not_found="Job not found")
+    else:
+        booking = await db.bookings.find_one_and_update(
+            query,
+            stamp({"$push": push}),
+            projection={"_id": 0, "id": 1, "user_id": 1, "assigned_technician_id": 1, "status": 1, "version": 1},
+            return_document=ReturnDocument.AFTER
         )
+        if booking is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+    await event_hub.publish(booking_event(
+        "job.incident", booking,
+        incident_id=incident_data["id"], severity=incident.severity, unable_to_proceed=incident.unable_to_proceed
+    ))
     
     return {"message": "Incident reported successfully", "incident_id": incident_data["id"]}
 
@@ -754,21 +1109,19 @@ async def complete_job(
     completion: JobCompletion,
     team_id: str = Depends(get_current_field_team)
 ):
-    job = await db.bookings.find_one({"id": job_id, "assigned_technician_id": team_id})
-    if not job:
-        raise HTTPException(status_code=404, detail="Job not found")
-    
-    await db.bookings.update_one(
-        {"id": job_id},
-        {"$set": {
-            "status": "completed",
-            "completed_at": datetime.now(timezone.utc).isoformat(),
+    booking = await transition_booking(
+        "complete",
+        {"id": job_id, "assigned_technician_id": team_id},
+        {
+            "completed_at": datetime.now(timezone.utc),
             "before_photos": completion.before_photo_urls,
             "after_photos": completion.after_photo_urls,
             "customer_signature": completion.customer_signature,
             "completion_notes": completion.notes or ""
-        }}
+        },
+        not_found="Job not found"
     )
+    await event_hub.publish(booking_event("job.completed", booking))
     
     return {"message": "Job completed successfully"}
 
@@ -800,37 +1153,101 @@ async def get_field_stats(team_id: str = Depends(get_current_field_team)):
         "in_progress": in_progress
     }
 
+def upload_to_cloudinary(data: bytes) -> str:
+    # Blocking HTTP call; run on a worker thread
+    result = cloudinary.uploader.upload(data, folder="aquaclean/jobs", resource_type="image")
+    return result['secure_url']
+
 @api_router.post("/field/upload-image")
 async def upload_image(
     file: UploadFile = File(...),
     team_id: str = Depends(get_current_field_team)
 ):
-    """Upload job photo (before/after)"""
+    """Upload job photo (before/after). Returns the normalized image and its thumbnail.
+    Oversized bodies are cut off by UploadLimitMiddleware while they stream in."""
+    try:
+        contents = await read_capped(file)
+        image = await image_pipeline.normalize(contents)
+    except UploadTooLarge:
+        raise HTTPException(status_code=413, detail="Image too large")
+    except InvalidImage:
+        raise HTTPException(status_code=400, detail="File is not a supported image")
+    
     try:
-        # Read file content
-        contents = await file.read()
-        
         # Option 1: Use Cloudinary if configured
         if os.environ.get('CLOUDINARY_CLOUD_NAME'):
-            result = cloudinary.uploader.upload(
-                contents,
-                folder="aquaclean/jobs",
-                resource_type="auto"
-            )
-            return {"url": result['secure_url']}
+            # Cloudinary derives the thumbnail from a URL transformation
+            with metrics.timed(metrics.cloudinary_duration, metrics.cloudinary_errors):
+                url = await asyncio.to_thread(upload_to_cloudinary, image.data)
+            return {"url": url, "thumbnail_url": thumbnail_url(url)}
         
-        # Option 2: Convert to base64 data URL (for demo/MVP)
+        # Option 2: Store in the content-addressed media store
         else:
-            base64_image = base64.b64encode(contents).decode('utf-8')
-            # Determine mime type
-            mime_type = file.content_type or 'image/jpeg'
-            data_url = f"data:{mime_type};base64,{base64_image}"
-            return {"url": data_url}
+            thumb_hash = await blob_store.put(image.thumbnail, image.content_type)
+            blob_hash = await blob_store.put(image.data, image.content_type, thumbnail=thumb_hash)
+            return {"url": media_url(blob_hash), "thumbnail_url": media_url(thumb_hash)}
             
     except Exception as e:
         logging.error(f"Image upload failed: {str(e)}")
         raise HTTPException(status_code=500, detail="Image upload failed")
 
+async def serve_blob(blob_hash: str, request: Request, info=None) -> Response:
+    """Stream a blob with Range support. Content-addressed, so it is immutable and cacheable forever"""
+    etag = f'"{blob_hash}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Accept-Ranges": "bytes"
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    
+    try:
+        info = info or await blob_store.info(blob_hash)
+    except BlobNotFound:
+        raise HTTPException(status_code=404, detail="Media not found")
+    
+    try:
+        byte_range = parse_range(request.headers.get("range"), info.size)
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{info.size}"})
+    
+    status_code = 200
+    start, end = 0, info.size - 1
+    if byte_range:
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{info.size}"
+    headers["Content-Length"] = str(end - start + 1)
+    
+    return StreamingResponse(
+        blob_store.stream(blob_hash, start, end),
+        status_code=status_code,
+        media_type=info.content_type,
+        headers=headers
+    )
+
+@api_router.get("/media/{blob_hash}")
+async def get_media(blob_hash: str, request: Request):
+    """Serve a stored blob"""
+    if not HASH_PATTERN.match(blob_hash):
+        raise HTTPException(status_code=404, detail="Media not found")
+    return await serve_blob(blob_hash, request)
+
+@api_router.get("/media/{blob_hash}/thumbnail")
+async def get_media_thumbnail(blob_hash: str, request: Request):
+    """Serve a blob's thumbnail, or redirect to the blob itself if it was stored without one"""
+    if not HASH_PATTERN.match(blob_hash):
+        raise HTTPException(status_code=404, detail="Media not found")
+    try:
+        info = await blob_store.info(blob_hash)
+    except BlobNotFound:
+        raise HTTPException(status_code=404, detail="Media not found")
+    if info.thumbnail:
+        return await serve_blob(info.thumbnail, request)
+    # Not cached, so a thumbnail stored later (re-uploading the image adds one) is picked up
+    return RedirectResponse(media_url(blob_hash), status_code=307, headers={"Cache-Control": "no-cache"})
+
 # Admin Models
 class AdminRegister(BaseModel):
     email: EmailStr
@@ -856,6 +1273,12 @@ class AssignTechnician(BaseModel):
 class UpdateBookingStatus(BaseModel):
     status: str
 
+class SlotCapacityUpdate(BaseModel):
+    service_date: str
+    service_time: str
+    area: str = slots.DEFAULT_AREA
+    capacity: int = Field(ge=0)
+
 # Admin Routes
 @api_router.post("/admin/register")
 async def register_admin(admin_data: AdminRegister):
@@ -871,17 +1294,16 @@ async def register_admin(admin_data: AdminRegister):
     )
     
     admin_dict = admin.model_dump()
-    admin_dict['password'] = hash_password(admin_data.password)
-    admin_dict['created_at'] = admin_dict['created_at'].isoformat()
+    admin_dict['password'] = await hash_password(admin_data.password)
     
     await db.admins.insert_one(admin_dict)
     
     return {"message": "Admin registered successfully"}
 
 @api_router.post("/admin/login")
-async def admin_login(credentials: AdminLogin):
-    admin = await db.admins.find_one({"email": credentials.email})
-    if not admin or not verify_password(credentials.password, admin['password']):
+async def admin_login(credentials: AdminLogin, background_tasks: BackgroundTasks):
+    admin = await authenticate(db.admins, credentials.email, credentials.password, background_tasks)
+    if not admin:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     token = create_jwt_token(admin['id'])
@@ -925,49 +1347,85 @@ async def get_admin_me(admin_id: str = Depends(get_current_admin)):
         raise HTTPException(status_code=404, detail="Admin not found")
     return admin
 
-@api_router.get("/admin/dashboard-stats")
-async def get_admin_dashboard_stats(admin_id: str = Depends(get_current_admin)):
-    # Get overall statistics
-    total_customers = await db.users.count_documents({})
-    total_technicians = await db.field_teams.count_documents({})
-    total_bookings = await db.bookings.count_documents({})
-    
-    # Today's stats
-    today = datetime.now(timezone.utc).date().isoformat()
-    today_bookings = await db.bookings.count_documents({"service_date": today})
-    
-    # Status breakdown
-    pending_bookings = await db.bookings.count_documents({"status": "pending"})
-    confirmed_bookings = await db.bookings.count_documents({"status": "confirmed"})
-    in_progress_bookings = await db.bookings.count_documents({"status": "in-progress"})
-    completed_bookings = await db.bookings.count_documents({"status": "completed"})
+@api_router.get("/admin/metrics/password-hashing")
+async def get_password_hashing_metrics(admin_id: str = Depends(get_current_admin)):
+    return password_hasher.get_metrics()
+
+@api_router.get("/admin/metrics/payment-gateway")
+async def get_payment_gateway_metrics(admin_id: str = Depends(get_current_admin)):
+    return payment_gateway.get_metrics()
+
+@api_router.get("/admin/metrics/events")
+async def get_event_metrics(admin_id: str = Depends(get_current_admin)):
+    return event_hub.get_metrics()
+
+@api_router.get("/admin/metrics/slow-queries")
+async def get_slow_query_metrics(admin_id: str = Depends(get_current_admin)):
+    return slow_query_recorder.get_metrics()
+
+@api_router.get("/admin/slow-queries")
+async def get_slow_queries(
+    hours: int = Query(24, ge=1, le=24 * 30),
+    limit: int = Query(20, ge=1, le=100),
+    admin_id: str = Depends(get_current_admin)
+):
+    """Slowest query shapes by total time, with the route that issued them and their latest plan"""
+    return await top_offenders(db, timedelta(hours=hours), limit)
+
+async def compute_dashboard_stats(today: str) -> dict:
+    # All booking figures in one round trip; totals are summed by MongoDB
+    facet_query = db.bookings.aggregate([{"$facet": {
+        "total": [{"$count": "n"}],
+        "today": [{"$match": {"service_date": today}}, {"$count": "n"}],
+        "by_status": [{"$group": {"_id": "$status", "n": {"$sum": 1}}}],
+        "revenue": [
+            {"$match": {"payment_status": "completed"}},
+            {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
+        ],
+        "recent": [{"$sort": {"created_at": -1, "id": -1}}, {"$limit": 5}, {"$project": {"_id": 0}}]
+    }}]).to_list(1)
+    
+    facets, total_customers, total_technicians = await asyncio.gather(
+        facet_query,
+        db.users.estimated_document_count(),
+        db.field_teams.estimated_document_count()
+    )
+    facets = facets[0]
     
-    # Revenue calculation (completed bookings)
-    completed_jobs = await db.bookings.find({"payment_status": "completed"}, {"_id": 0, "amount": 1}).to_list(10000)
-    total_revenue = sum(job.get("amount", 0) for job in completed_jobs)
+    def first(facet: str, field: str) -> int:
+        return facets[facet][0][field] if facets[facet] else 0
     
-    # Recent bookings
-    recent_bookings = await db.bookings.find({}, {"_id": 0}).sort("created_at", -1).limit(5).to_list(5)
-    for booking in recent_bookings:
-        if isinstance(booking.get('created_at'), str):
-            booking['created_at'] = datetime.fromisoformat(booking['created_at'])
+    by_status = {row['_id']: row['n'] for row in facets['by_status']}
     
     return {
         "total_customers": total_customers,
         "total_technicians": total_technicians,
-        "total_bookings": total_bookings,
-        "today_bookings": today_bookings,
-        "pending_bookings": pending_bookings,
-        "confirmed_bookings": confirmed_bookings,
-        "in_progress_bookings": in_progress_bookings,
-        "completed_bookings": completed_bookings,
-        "total_revenue": total_revenue,
-        "recent_bookings": recent_bookings
+        "total_bookings": first('total', 'n'),
+        "today_bookings": first('today', 'n'),
+        "pending_bookings": by_status.get('pending', 0),
+        "confirmed_bookings": by_status.get('confirmed', 0),
+        "in_progress_bookings": by_status.get('in-progress', 0),
+        "completed_bookings": by_status.get('completed', 0),
+        "total_revenue": first('revenue', 'total'),
+        "recent_bookings": facets['recent']
     }
 
+@api_router.get("/admin/dashboard-stats")
+async def get_admin_dashboard_stats(admin_id: str = Depends(get_current_admin)):
+    today = datetime.now(timezone.utc).date().isoformat()
+    return await dashboard_cache.get_or_compute(
+        f"dashboard-stats:{today}",
+        lambda: compute_dashboard_stats(today)
+    )
+
 @api_router.get("/admin/bookings")
 async def get_all_bookings(
+    response: Response,
     status: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    view: Optional[str] = None,
+    fields: Optional[str] = None,
     admin_id: str = Depends(get_current_admin)
 ):
     # Build filter
@@ -975,52 +1433,41 @@ async def get_all_bookings(
     if status:
         filter_query["status"] = status
     
-    bookings = await db.bookings.find(filter_query, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    
-    # Enrich with customer and technician info
-    for booking in bookings:
-        if isinstance(booking.get('created_at'), str):
-            booking['created_at'] = datetime.fromisoformat(booking['created_at'])
-        
-        # Get customer info
-        customer = await db.users.find_one({"id": booking['user_id']}, {"_id": 0, "password": 0})
-        booking['customer'] = customer
-        
-        # Get technician info if assigned
-        if booking.get('assigned_technician_id'):
-            technician = await db.field_teams.find_one(
-                {"id": booking['assigned_technician_id']}, 
-                {"_id": 0, "password": 0}
-            )
-            booking['technician'] = technician
-        
-        # Get address info
-        address = await db.addresses.find_one({"id": booking['address_id']}, {"_id": 0})
-        booking['address'] = address
+    # Enrichment needs the customer, technician and address references
+    projection = projection_for(view, fields, ("user_id", "assigned_technician_id", "address_id"))
+    bookings = await fetch_page(response, db.bookings, filter_query, projection, "created_at", -1, limit, cursor)
     
-    return bookings
+    # Enrich with customer, technician and address info (batched)
+    bookings = await enrich_bookings(db, [with_thumbnails(b) for b in bookings])
+    return json_response(bookings, response)
 
 @api_router.put("/admin/bookings/{booking_id}/assign")
 async def assign_technician_to_booking(
     booking_id: str,
     data: AssignTechnician,
+    background_tasks: BackgroundTasks,
     admin_id: str = Depends(get_current_admin)
 ):
     # Verify technician exists
-    technician = await db.field_teams.find_one({"id": data.technician_id})
+    technician = await db.field_teams.find_one({"id": data.technician_id}, {"_id": 1})
     if not technician:
         raise HTTPException(status_code=404, detail="Technician not found")
     
-    # Verify booking exists
-    booking = await db.bookings.find_one({"id": booking_id})
-    if not booking:
-        raise HTTPException(status_code=404, detail="Booking not found")
-    
     # Assign technician
-    await db.bookings.update_one(
+    before, booking = await transition_booking(
+        "assign",
         {"id": booking_id},
-        {"$set": {"assigned_technician_id": data.technician_id}}
+        {"assigned_technician_id": data.technician_id},
+        return_before=True
     )
+    await event_hub.publish(booking_event("booking.assigned", booking))
+    previous = before.get("assigned_technician_id")
+    if previous and previous != data.technician_id:
+        # The previous technician's job list drops the booking
+        await event_hub.publish(booking_event(
+            "booking.unassigned", before, channels=[f"technician:{previous}"], version=booking["version"]
+        ))
+    background_tasks.add_task(routing.sync_booking_logged, db, booking_id)
     
     return {"message": "Technician assigned successfully"}
 
@@ -1028,16 +1475,20 @@ async def assign_technician_to_booking(
 async def update_booking_status(
     booking_id: str,
     data: UpdateBookingStatus,
+    background_tasks: BackgroundTasks,
     admin_id: str = Depends(get_current_admin)
 ):
-    booking = await db.bookings.find_one({"id": booking_id})
-    if not booking:
-        raise HTTPException(status_code=404, detail="Booking not found")
-    
-    await db.bookings.update_one(
-        {"id": booking_id},
-        {"$set": {"status": data.status}}
-    )
+    if data.status not in booking_state.STATUSES:
+        raise HTTPException(status_code=400, detail="Invalid booking status")
+    
+    booking = await transition_booking("set_status", {"id": booking_id}, {"status": data.status})
+    if data.status == "cancelled":
+        await slots.release_booking(db, booking_id)
+    else:
+        # Reopening a cancelled booking takes its place back
+        await slots.reclaim_booking(db, booking_id)
+    await event_hub.publish(booking_event("booking.status_changed", booking))
+    background_tasks.add_task(routing.sync_booking_logged, db, booking_id)
     
     return {"message": "Booking status updated successfully"}
 
@@ -1046,19 +1497,11 @@ async def reschedule_booking(
     booking_id: str,
     service_date: str,
     service_time: str,
+    background_tasks: BackgroundTasks,
     admin_id: str = Depends(get_current_admin)
 ):
-    booking = await db.bookings.find_one({"id": booking_id})
-    if not booking:
-        raise HTTPException(status_code=404, detail="Booking not found")
-    
-    await db.bookings.update_one(
-        {"id": booking_id},
-        {"$set": {
-            "service_date": service_date,
-            "service_time": service_time
-        }}
-    )
+    await reschedule_with_slot({"id": booking_id}, service_date, service_time)
+    background_tasks.add_task(routing.sync_booking_logged, db, booking_id)
     
     return {"message": "Booking rescheduled successfully"}
 
@@ -1066,91 +1509,153 @@ async def reschedule_booking(
 async def create_booking_admin(
     booking_data: BookingCreate,
     user_id: str,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None),
     admin_id: str = Depends(get_current_admin)
 ):
     """Admin can create booking for any customer"""
-    # Verify customer exists
-    customer = await db.users.find_one({"id": user_id})
-    if not customer:
-        raise HTTPException(status_code=404, detail="Customer not found")
-    
-    # Verify address belongs to customer
-    address = await db.addresses.find_one({"id": booking_data.address_id, "user_id": user_id})
-    if not address:
-        raise HTTPException(status_code=404, detail="Address not found")
-    
-    # Calculate amount
-    amount = calculate_booking_amount(booking_data)
+    async def create():
+        # Verify customer exists
+        customer = await db.users.find_one({"id": user_id}, {"_id": 1})
+        if not customer:
+            raise HTTPException(status_code=404, detail="Customer not found")
+        
+        return await insert_booking(booking_data, user_id)
     
-    booking = Booking(
-        user_id=user_id,
-        amount=amount,
-        **booking_data.model_dump()
+    return await idempotent(
+        response, idempotency_key, f"admin-bookings:{admin_id}:{user_id}", booking_data, create
     )
-    
-    booking_dict = booking.model_dump()
-    booking_dict['created_at'] = booking_dict['created_at'].isoformat()
-    
-    await db.bookings.insert_one(booking_dict)
-    return booking
 
 @api_router.delete("/admin/bookings/{booking_id}")
 async def cancel_booking_admin(
     booking_id: str,
+    background_tasks: BackgroundTasks,
     admin_id: str = Depends(get_current_admin)
 ):
     """Admin can cancel any booking"""
-    booking = await db.bookings.find_one({"id": booking_id})
-    if not booking:
-        raise HTTPException(status_code=404, detail="Booking not found")
-    
-    await db.bookings.update_one(
-        {"id": booking_id},
-        {"$set": {"status": "cancelled"}}
-    )
+    await transition_booking("cancel", {"id": booking_id})
+    await slots.release_booking(db, booking_id)
+    background_tasks.add_task(routing.sync_booking_logged, db, booking_id)
     
     return {"message": "Booking cancelled successfully"}
 
 @api_router.get("/admin/customers")
-async def get_all_customers(admin_id: str = Depends(get_current_admin)):
-    customers = await db.users.find({}, {"_id": 0, "password": 0}).to_list(1000)
+async def get_all_customers(
+    response: Response,
+    limit: int = Query(1000, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    admin_id: str = Depends(get_current_admin)
+):
+    customers = await fetch_page(response, db.users, {}, {"_id": 0, "password": 0}, "created_at", -1, limit, cursor)
     
+    # Booking counts for the whole page in one aggregation
+    counts = await count_bookings(db, "user_id", (c['id'] for c in customers))
     for customer in customers:
-        if isinstance(customer.get('created_at'), str):
-            customer['created_at'] = datetime.fromisoformat(customer['created_at'])
-        
-        # Get booking count for each customer
-        booking_count = await db.bookings.count_documents({"user_id": customer['id']})
-        customer['total_bookings'] = booking_count
+        customer['total_bookings'] = counts.get(customer['id'], {}).get("total", 0)
     
-    return customers
+    return json_response(customers, response)
 
 @api_router.get("/admin/field-teams")
-async def get_all_field_teams(admin_id: str = Depends(get_current_admin)):
-    teams = await db.field_teams.find({}, {"_id": 0, "password": 0}).to_list(1000)
+async def get_all_field_teams(
+    response: Response,
+    limit: int = Query(1000, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    admin_id: str = Depends(get_current_admin)
+):
+    teams = await fetch_page(response, db.field_teams, {}, {"_id": 0, "password": 0}, "created_at", -1, limit, cursor)
     
+    # Job counts for the whole page in one aggregation
+    counts = await count_bookings(db, "assigned_technician_id", (t['id'] for t in teams), statuses=("completed",))
     for team in teams:
-        if isinstance(team.get('created_at'), str):
-            team['created_at'] = datetime.fromisoformat(team['created_at'])
-        
-        # Get job counts
-        total_jobs = await db.bookings.count_documents({"assigned_technician_id": team['id']})
-        completed_jobs = await db.bookings.count_documents({
-            "assigned_technician_id": team['id'],
-            "status": "completed"
-        })
-        team['total_jobs'] = total_jobs
-        team['completed_jobs'] = completed_jobs
+        team_counts = counts.get(team['id'], {})
+        team['total_jobs'] = team_counts.get("total", 0)
+        team['completed_jobs'] = team_counts.get("completed", 0)
+    
+    return json_response(teams, response)
+
+@api_router.put("/admin/field-teams/{team_id}/profile")
+async def update_field_team_profile(
+    team_id: str,
+    data: FieldTeamProfileUpdate,
+    admin_id: str = Depends(get_current_admin)
+):
+    """Set the base location, skills and capacity used by auto-assignment"""
+    update = {}
+    if (data.base_lat is None) != (data.base_lng is None):
+        raise HTTPException(status_code=400, detail="base_lat and base_lng must be given together")
+    if data.base_lat is not None:
+        update["base_location"] = point(data.base_lat, data.base_lng)
+    if data.skills is not None:
+        if any(skill not in assignment.PACKAGE_TYPES for skill in data.skills):
+            raise HTTPException(status_code=400, detail="Unknown skill")
+        update["skills"] = data.skills
+    if data.max_jobs_per_day is not None:
+        update["max_jobs_per_day"] = data.max_jobs_per_day
+    if data.active is not None:
+        update["active"] = data.active
+    if not update:
+        raise HTTPException(status_code=400, detail="No changes provided")
+    
+    result = await db.field_teams.update_one({"id": team_id}, {"$set": update})
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Technician not found")
     
-    return teams
+    return {"message": "Field team profile updated successfully"}
+
+@api_router.post("/admin/assignments/auto")
+async def auto_assign_bookings(
+    background_tasks: BackgroundTasks,
+    service_date: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=2000),
+    dry_run: bool = False,
+    admin_id: str = Depends(get_current_admin)
+):
+    """Assign confirmed, unassigned bookings to nearby technicians (see assignment.py)"""
+    result = await assignment.auto_assign(db, service_date, limit, dry_run)
+    for booking in result["applied"]:
+        await event_hub.publish(booking_event("booking.assigned", booking))
+    if result["applied"]:
+        applied = {b["id"] for b in result["applied"]}
+        routes = {(a["technician_id"], a["service_date"]) for a in result["assignments"] if a["booking_id"] in applied}
+        background_tasks.add_task(routing.rebuild_routes_logged, db, routes)
+    
+    return {
+        "dry_run": result["dry_run"],
+        "considered": result["considered"],
+        "assigned": len(result["applied"]) if not dry_run else len(result["assignments"]),
+        "assignments": result["assignments"],
+        "unassigned": result["unassigned"],
+        "elapsed_ms": result["elapsed_ms"]
+    }
+
+@api_router.put("/admin/slots/capacity")
+async def update_slot_capacity(
+    data: SlotCapacityUpdate,
+    admin_id: str = Depends(get_current_admin)
+):
+    """Override one slot's capacity; lowering it below what is reserved only blocks new bookings"""
+    try:
+        slots.validate_slot(data.service_date, data.service_time)
+    except slots.InvalidSlot as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    await slots.set_capacity(db, data.service_date, data.service_time, data.area, data.capacity)
+    return {"message": "Slot capacity updated successfully"}
 
 @api_router.get("/admin/incidents")
-async def get_all_incidents(admin_id: str = Depends(get_current_admin)):
-    # Get all bookings with incidents
-    bookings_with_incidents = await db.bookings.find(
-        {"incident_reports": {"$exists": True, "$ne": []}},
-        {"_id": 0}
-    ).to_list(1000)
+async def get_all_incidents(
+    response: Response,
+    limit: int = Query(1000, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    admin_id: str = Depends(get_current_admin)
+):
+    # Get all bookings with incidents (the cursor pages over bookings)
+    bookings_with_incidents = await fetch_page(
+        response, db.bookings,
+        {"incident_reports.0": {"$exists": True}},
+        {"_id": 0, "id": 1, "service_date": 1, "tank_type": 1, "incident_reports": 1},
+        "created_at", -1, limit, cursor
+    )
     
     incidents = []
     for booking in bookings_with_incidents:
@@ -1162,54 +1667,224 @@ async def get_all_incidents(admin_id: str = Depends(get_current_admin)):
                 "incident": incident
             })
     
-    return incidents
+    return json_response(incidents, response)
 
 @api_router.get("/admin/analytics")
-async def get_analytics(admin_id: str = Depends(get_current_admin)):
-    # Revenue by month (last 6 months)
-    from datetime import timedelta
-    six_months_ago = (datetime.now(timezone.utc) - timedelta(days=180)).date().isoformat()
-    
-    recent_bookings = await db.bookings.find(
-        {"created_at": {"$gte": six_months_ago}},
-        {"_id": 0, "amount": 1, "payment_status": 1, "service_date": 1, "package_type": 1}
-    ).to_list(10000)
-    
-    # Calculate metrics
-    revenue_by_package = {}
-    for booking in recent_bookings:
-        if booking.get('payment_status') == 'completed':
-            pkg = booking.get('package_type', 'unknown')
-            revenue_by_package[pkg] = revenue_by_package.get(pkg, 0) + booking.get('amount', 0)
-    
-    # Average booking value
-    completed_amounts = [b.get('amount', 0) for b in recent_bookings if b.get('payment_status') == 'completed']
-    avg_booking_value = sum(completed_amounts) / len(completed_amounts) if completed_amounts else 0
+async def get_analytics(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    bucket: str = Query("month", pattern="^(day|week|month)$"),
+    admin_id: str = Depends(get_current_admin)
+):
+    """Booking analytics from the daily rollups (defaults to the last 6 months)"""
+    today = datetime.now(timezone.utc).date()
+    try:
+        # Normalized, since rollup days are compared as strings
+        end = date.fromisoformat(end).isoformat() if end else today.isoformat()
+        start = date.fromisoformat(start).isoformat() if start else (today - timedelta(days=180)).isoformat()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+    
+    rows = await rollups.load_rollups(db, start, end)
+    summary = rollups.summarize(rows, bucket)
     
     return {
-        "revenue_by_package": revenue_by_package,
-        "average_booking_value": avg_booking_value,
-        "total_bookings_6months": len(recent_bookings),
-        "completed_bookings_6months": len([b for b in recent_bookings if b.get('payment_status') == 'completed'])
+        "revenue_by_package": summary["revenue_by_package"],
+        "average_booking_value": summary["average_booking_value"],
+        "total_bookings_6months": summary["total_bookings"],
+        "completed_bookings_6months": summary["completed_bookings"],
+        "start": start,
+        "end": end,
+        "bucket": bucket,
+        "series": summary["series"]
     }
 
+# Event Stream Routes
+EVENT_HEARTBEAT_SECONDS = 15
+EVENT_TOKEN_SECONDS = 60
+# A separate key, so an event token cannot be used as a login token
+EVENT_TOKEN_SECRET = f"{JWT_SECRET}:events"
+
+def create_event_token(account_id: str) -> str:
+    expiration = datetime.now(timezone.utc) + timedelta(seconds=EVENT_TOKEN_SECONDS)
+    return jwt.encode({"user_id": account_id, "exp": expiration}, EVENT_TOKEN_SECRET, algorithm=JWT_ALGORITHM)
+
+async def stream_account(authorization: Optional[str], token: Optional[str], authenticate) -> str:
+    """The account opening an event stream, from the Authorization header or ?token=.
+    EventSource cannot send headers, so it passes a short-lived token from
+    POST /events/token; a 30-day login token in the URL would end up in access logs."""
+    if authorization or not token:
+        return await authenticate(authorization)
+    try:
+        payload = jwt.decode(token, EVENT_TOKEN_SECRET, algorithms=[JWT_ALGORITHM])
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token expired")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    if not payload.get("user_id"):
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return payload["user_id"]
+
+@api_router.post("/events/token")
+async def create_event_stream_token(account_id: str = Depends(get_current_user)):
+    """Short-lived token for ?token= on the event streams (customers, field teams and admins alike)"""
+    return {"token": create_event_token(account_id), "expires_in": EVENT_TOKEN_SECONDS}
+
+def event_stream(channels: List[str]) -> StreamingResponse:
+    """Server-sent events for ``channels``, with a comment line as heartbeat"""
+    async def stream():
+        with event_hub.subscribe(channels) as queue:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=EVENT_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                data = {k: v for k, v in event.items() if k != "channels"}
+                yield f"event: {event['type']}\ndata: {json.dumps(data, default=str)}\n\n"
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api_router.get("/events/bookings")
+async def stream_booking_events(token: Optional[str] = None, authorization: str = Header(None)):
+    """Updates to the current customer's bookings"""
+    user_id = await stream_account(authorization, token, get_current_user)
+    return event_stream([f"user:{user_id}"])
+
+@api_router.get("/events/field")
+async def stream_field_events(token: Optional[str] = None, authorization: str = Header(None)):
+    """Assignments and updates for the current field team's jobs"""
+    team_id = await stream_account(authorization, token, get_current_field_team)
+    return event_stream([f"technician:{team_id}"])
+
+@api_router.get("/events/admin")
+async def stream_admin_events(token: Optional[str] = None, authorization: str = Header(None)):
+    """Every booking update, for the admin board"""
+    admin_id = await stream_account(authorization, token, get_current_admin)
+    if not authorization and not await db.admins.find_one({"id": admin_id}, {"_id": 1}):
+        # get_current_admin checked this for header authentication
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return event_stream(["admin"])
+
 # Include router
 app.include_router(api_router)
 
+# Scraped directly by Prometheus, outside /api
+@app.get("/metrics", include_in_schema=False)
+async def get_prometheus_metrics(authorization: str = Header(None)):
+    if metrics.METRICS_TOKEN and authorization != f"Bearer {metrics.METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
+
+class APIGZipMiddleware(GZipMiddleware):
+    """GZip, except for media (already compressed, and Range offsets must stay
+    valid) and event streams (gzip would buffer the events)"""
+    uncompressed_prefixes = ("/api/media/", "/api/events/")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(self.uncompressed_prefixes):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+# Reject oversized photos while they stream in, before multipart parsing spools them
+app.add_middleware(UploadLimitMiddleware, paths=["/api/field/upload-image"])
+
+# Compress JSON responses (list pages are large and highly repetitive)
+app.add_middleware(APIGZipMiddleware, minimum_size=int(os.environ.get('GZIP_MIN_SIZE', '1024')))
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Idempotent-Replayed", "ETag"] + DEBUG_HEADERS,
 )
 
+# Mongo commands per request: debug headers and over-budget warnings
+app.add_middleware(QueryMonitorMiddleware)
+
+# Outermost, so latency includes the other middleware
+app.add_middleware(metrics.MetricsMiddleware)
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def create_indexes():
+    created = await ensure_indexes(db)
+    if created:
+        logger.info(f"Created indexes: {', '.join(created)}")
+
+@app.on_event("startup")
+async def start_password_hasher():
+    password_hasher.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    client.close()
+
+@app.on_event("shutdown")
+async def shutdown_password_hasher():
+    password_hasher.shutdown()
+
+@app.on_event("startup")
+async def start_image_pipeline():
+    image_pipeline.start()
+
+@app.on_event("shutdown")
+async def shutdown_image_pipeline():
+    image_pipeline.shutdown()
+
+@app.on_event("startup")
+async def start_event_hub():
+    event_hub.start()
+
+@app.on_event("shutdown")
+async def shutdown_event_hub():
+    await event_hub.stop()
+
+@app.on_event("startup")
+async def start_slow_query_recorder():
+    await slow_query_recorder.start(db)
+
+@app.on_event("shutdown")
+async def shutdown_slow_query_recorder():
+    await slow_query_recorder.stop()
+
+@app.on_event("startup")
+async def start_payment_event_worker():
+    payment_event_worker.start()
+
+@app.on_event("shutdown")
+async def shutdown_payment_event_worker():
+    await payment_event_worker.stop()
+
+@app.on_event("startup")
+async def start_rollup_rebuilder():
+    rollup_rebuilder.start()
+
+@app.on_event("shutdown")
+async def shutdown_rollup_rebuilder():
+    await rollup_rebuilder.stop()
+
+@app.on_event("startup")
+async def start_route_builder():
+    route_builder.start()
+
+@app.on_event("shutdown")
+async def shutdown_route_builder():
+    await route_builder.stop()
+
+@app.on_event("shutdown")
+async def shutdown_payment_gateway():
+    payment_gateway.shutdown()
\ No newline at end of file
@@ -0,0 +1,152 @@
+"""Slot capacity per (service_date, service_time, service area).
+
+Each slot is a counter document in ``slots`` (``_id`` is date|time|area)
+holding ``capacity`` and ``reserved``. Booking creation and reschedules
+reserve with a conditional update that only matches while
+``reserved < capacity``. MongoDB rejects ``$expr`` in an upsert, so when
+that matches nothing the counter is created (if missing) by a separate
+``$setOnInsert`` upsert and the conditional update is tried once more;
+only a second miss is ``SlotFull``.
+Bookings record the reservation (``service_area``, ``slot_reserved``) so
+releasing it on cancel is idempotent.
+
+Service areas are grid cells of ``SERVICE_AREA_GRID_DEGREES`` over the
+address coordinates; addresses without coordinates share one area.
+Availability for a date range is one indexed range query; slots without a
+counter document have their full default capacity.
+"""
+import math
+import os
+from datetime import date, timedelta
+from typing import List, Optional
+
+from pymongo.errors import DuplicateKeyError
+
+from etags import stamp
+
+SERVICE_SLOTS = ("09:00", "12:00", "15:00")
+SLOT_CAPACITY = int(os.environ.get('SLOT_CAPACITY', '5'))
+SERVICE_AREA_GRID_DEGREES = float(os.environ.get('SERVICE_AREA_GRID_DEGREES', '0.25'))
+DEFAULT_AREA = "default"
+MAX_AVAILABILITY_DAYS = 31
+
+
+class SlotFull(Exception):
+    pass
+
+
+class InvalidSlot(Exception):
+    pass
+
+
+def validate_slot(service_date: str, service_time: str) -> date:
+    try:
+        day = date.fromisoformat(service_date)
+    except ValueError:
+        raise InvalidSlot(f"Invalid service date: {service_date}")
+    if service_time not in SERVICE_SLOTS:
+        raise InvalidSlot(f"Invalid service time: {service_time}")
+    return day
+
+
+def service_area(address: Optional[dict]) -> str:
+    if not address or address.get("lat") is None or address.get("lng") is None:
+        return DEFAULT_AREA
+    cell = SERVICE_AREA_GRID_DEGREES
+    return f"{math.floor(address['lat'] / cell) * cell:.2f},{math.floor(address['lng'] / cell) * cell:.2f}"
+
+
+def slot_id(service_date: str, service_time: str, area: str) -> str:
+    return f"{service_date}|{service_time}|{area}"
+
+
+async def _take(db, query: dict) -> bool:
+    return await db.slots.find_one_and_update(query, {"$inc": {"reserved": 1}}, projection={"_id": 1}) is not None
+
+
+async def reserve(db, service_date: str, service_time: str, area: str, force: bool = False):
+    """Take one place in a slot. Raises SlotFull unless ``force`` (admin overrides)."""
+    slot = {"_id": slot_id(service_date, service_time, area)}
+    counter = {"service_date": service_date, "service_time": service_time, "area": area, "capacity": SLOT_CAPACITY}
+    if force:
+        await db.slots.update_one(slot, {"$inc": {"reserved": 1}, "$setOnInsert": counter}, upsert=True)
+        return
+
+    query = {**slot, "$expr": {"$lt": ["$reserved", "$capacity"]}}
+    if await _take(db, query):
+        return
+    # Full, or no counter yet: create it, then try once more
+    try:
+        await db.slots.update_one(slot, {"$setOnInsert": {**counter, "reserved": 0}}, upsert=True)
+    except DuplicateKeyError:
+        # A concurrent first reservation created it
+        pass
+    if not await _take(db, query):
+        raise SlotFull()
+
+
+async def unreserve(db, service_date: str, service_time: str, area: str):
+    await db.slots.update_one(
+        {"_id": slot_id(service_date, service_time, area), "reserved": {"$gt": 0}},
+        {"$inc": {"reserved": -1}}
+    )
+
+
+async def release_booking(db, booking_id: str):
+    """Give back a booking's place, once, however many times this is called"""
+    booking = await db.bookings.find_one_and_update(
+        {"id": booking_id, "slot_reserved": True},
+        stamp({"$set": {"slot_reserved": False}}),
+        projection={"_id": 0, "service_date": 1, "service_time": 1, "service_area": 1}
+    )
+    if booking is not None:
+        await unreserve(db, booking["service_date"], booking["service_time"], booking["service_area"])
+
+
+async def reclaim_booking(db, booking_id: str):
+    """Take a place again for a reopened booking (capacity is not enforced)"""
+    booking = await db.bookings.find_one_and_update(
+        {"id": booking_id, "slot_reserved": False},
+        stamp({"$set": {"slot_reserved": True}}),
+        projection={"_id": 0, "service_date": 1, "service_time": 1, "service_area": 1}
+    )
+    if booking is not None:
+        await reserve(db, booking["service_date"], booking["service_time"], booking["service_area"], force=True)
+
+
+async def set_capacity(db, service_date: str, service_time: str, area: str, capacity: int):
+    await db.slots.update_one(
+        {"_id": slot_id(service_date, service_time, area)},
+        {
+            "$set": {"capacity": capacity},
+            "$setOnInsert": {"service_date": service_date, "service_time": service_time, "area": area, "reserved": 0}
+        },
+        upsert=True
+    )
+
+
+async def availability(db, area: str, start: date, end: date) -> List[dict]:
+    """Every slot from ``start`` to ``end`` inclusive, from the counters alone"""
+    counters = {
+        (doc["service_date"], doc["service_time"]): doc
+        async for doc in db.slots.find(
+            {"area": area, "service_date": {"$gte": start.isoformat(), "$lte": end.isoformat()}},
+            {"_id": 0, "service_date": 1, "service_time": 1, "capacity": 1, "reserved": 1}
+        )
+    }
+    result = []
+    day = start
+    while day <= end:
+        for service_time in SERVICE_SLOTS:
+            counter = counters.get((day.isoformat(), service_time), {})
+            capacity = counter.get("capacity", SLOT_CAPACITY)
+            reserved = counter.get("reserved", 0)
+            result.append({
+                "service_date": day.isoformat(),
+                "service_time": service_time,
+                "capacity": capacity,
+                "reserved": reserved,
+                "available": max(capacity - reserved, 0),
+            })
+        day += timedelta(days=1)
+    return result
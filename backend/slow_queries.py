@@ -0,0 +1,296 @@
+"""Slow Mongo command log with sampled query plans.
+
+``SlowQueryListener`` sees every command; those taking at least
+``SLOW_QUERY_MS`` are handed to ``SlowQueryRecorder`` on the event loop
+together with the route that issued them (see query_monitor.py). The
+recorder runs ``explain`` with ``executionStats`` for the first occurrence of
+each query shape and a ``SLOW_QUERY_EXPLAIN_RATE`` sample after that, and
+stores a summary in the capped ``slow_queries`` collection:
+
+    {at, route, collection, command, shape, duration_ms, explained,
+     plan: {stages, indexes, collscan, docs_examined, keys_examined, returned}}
+
+Shapes keep field names and operators but not values, so no customer data
+is logged. ``GET /api/admin/slow-queries`` ranks shapes by total time.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from pymongo import monitoring
+from pymongo.errors import CollectionInvalid, OperationFailure
+
+import query_monitor
+
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '100'))
+SLOW_QUERY_EXPLAIN_RATE = float(os.environ.get('SLOW_QUERY_EXPLAIN_RATE', '0.1'))
+SLOW_QUERY_LOG_BYTES = int(os.environ.get('SLOW_QUERY_LOG_MB', '16')) * 1024 * 1024
+
+COLLECTION = "slow_queries"
+
+# Commands explain() accepts, and the fields that make up their shape
+SHAPE_FIELDS = {
+    "find": ("filter", "sort"),
+    "aggregate": ("pipeline",),
+    "count": ("query",),
+    "distinct": ("key", "query"),
+    "findAndModify": ("query", "sort"),
+    "update": ("updates",),
+    "delete": ("deletes",),
+}
+
+# Session and routing fields the driver adds, which explain rejects
+_DRIVER_FIELDS = ("lsid", "txnNumber", "autocommit", "startTransaction", "writeConcern", "readConcern")
+
+
+def shape_of(value):
+    """``value`` with every literal replaced by 1 (lists of like items collapse to one)"""
+    if isinstance(value, dict):
+        return {key: shape_of(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        shapes = []
+        for item in value:
+            shape = shape_of(item)
+            if shape not in shapes:
+                shapes.append(shape)
+        return shapes
+    return 1
+
+
+def command_shape(command_name: str, command: dict) -> str:
+    if command_name in ("update", "delete"):
+        # Only the first statement's filter; the update document is not a query
+        statements = command.get(f"{command_name}s") or [{}]
+        source = {"q": statements[0].get("q", {})}
+    else:
+        source = {field: command[field] for field in SHAPE_FIELDS[command_name] if field in command}
+    return json.dumps(shape_of(source), sort_keys=True, default=str)
+
+
+def explainable(command_name: str, command: dict) -> dict:
+    cleaned = {key: value for key, value in command.items()
+               if not key.startswith("$") and key not in _DRIVER_FIELDS}
+    if command_name in ("update", "delete"):
+        # explain takes a single statement
+        cleaned[f"{command_name}s"] = cleaned[f"{command_name}s"][:1]
+    return cleaned
+
+
+def _find(doc, key: str):
+    """First value of ``key`` anywhere in nested dicts/lists"""
+    if isinstance(doc, dict):
+        if key in doc:
+            return doc[key]
+        children = doc.values()
+    elif isinstance(doc, list):
+        children = doc
+    else:
+        return None
+    for child in children:
+        found = _find(child, key)
+        if found is not None:
+            return found
+    return None
+
+
+def _walk_plan(plan, stages: list, indexes: list):
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        if "indexName" in plan:
+            indexes.append(plan["indexName"])
+        for key, child in plan.items():
+            if key != "rejectedPlans":
+                _walk_plan(child, stages, indexes)
+    elif isinstance(plan, list):
+        for child in plan:
+            _walk_plan(child, stages, indexes)
+
+
+def _lookup_collscans(doc) -> int:
+    """Collection scans made by $lookup stages (reported in their executionStats)"""
+    if isinstance(doc, dict):
+        return doc.get("collectionScans", 0) + sum(_lookup_collscans(child) for child in doc.values())
+    if isinstance(doc, list):
+        return sum(_lookup_collscans(child) for child in doc)
+    return 0
+
+
+def summarize_plan(explain: dict) -> dict:
+    """COLLSCAN/IXSCAN and examined vs returned counts from explain("executionStats").
+
+    For counts and writes ``returned`` is the number of documents counted or matched."""
+    planner = _find(explain, "queryPlanner") or {}
+    stages, indexes = [], []
+    _walk_plan(planner.get("winningPlan", {}), stages, indexes)
+    stats = _find(explain, "executionStats") or {}
+    root = stats.get("executionStages", {})
+    returned = stats.get("nReturned")
+    for key in ("nCounted", "nMatched", "nWouldDelete"):
+        if key in root:
+            returned = root[key]
+    return {
+        "stages": stages,
+        "indexes": sorted(set(indexes)),
+        "collscan": "COLLSCAN" in stages or _lookup_collscans(explain) > 0,
+        "docs_examined": stats.get("totalDocsExamined"),
+        "keys_examined": stats.get("totalKeysExamined"),
+        "returned": returned,
+    }
+
+
+class SlowQueryRecorder:
+    """Created before the client (its listener is a client option); ``start`` gives it the database"""
+
+    def __init__(self, threshold_ms: float = SLOW_QUERY_MS, explain_rate: float = SLOW_QUERY_EXPLAIN_RATE):
+        self.db = None
+        self.threshold_ms = threshold_ms
+        self.explain_rate = explain_rate
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=1000)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._explained_shapes = set()
+        self.metrics = {"recorded": 0, "explained": 0, "explain_errors": 0, "dropped": 0}
+
+    async def start(self, db):
+        self.db = db
+        try:
+            await self.db.create_collection(COLLECTION, capped=True, size=SLOW_QUERY_LOG_BYTES)
+        except CollectionInvalid:
+            pass
+        except OperationFailure as e:
+            logging.error(f"Slow query log not created: {str(e)}")
+        self._loop = asyncio.get_running_loop()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._loop = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def submit(self, record: dict):
+        """Called from driver threads"""
+        loop = self._loop
+        if loop is not None:
+            loop.call_soon_threadsafe(self._enqueue, record)
+
+    def _enqueue(self, record: dict):
+        try:
+            self._queue.put_nowait(record)
+        except asyncio.QueueFull:
+            self.metrics["dropped"] += 1
+
+    def _should_explain(self, shape_key: tuple) -> bool:
+        if shape_key not in self._explained_shapes:
+            if len(self._explained_shapes) >= 10000:
+                self._explained_shapes.clear()
+            self._explained_shapes.add(shape_key)
+            return True
+        return random.random() < self.explain_rate
+
+    async def _record(self, record: dict):
+        command = record.pop("command_doc")
+        record["plan"] = None
+        record["explained"] = False
+        if command is not None:
+            record["shape"] = command_shape(record["command"], command)
+            if self._should_explain((record["collection"], record["command"], record["shape"])):
+                try:
+                    explain = await self.db.command(
+                        {"explain": explainable(record["command"], command), "verbosity": "executionStats"}
+                    )
+                    record["plan"] = summarize_plan(explain)
+                    record["explained"] = True
+                    self.metrics["explained"] += 1
+                except OperationFailure as e:
+                    self.metrics["explain_errors"] += 1
+                    logging.warning(f"explain failed for slow {record['command']} on {record['collection']}: {str(e)}")
+        await self.db[COLLECTION].insert_one(record)
+        self.metrics["recorded"] += 1
+
+    async def _run(self):
+        while True:
+            record = await self._queue.get()
+            try:
+                await self._record(record)
+            except Exception as e:
+                logging.error(f"Slow query recording failed: {str(e)}")
+
+    def get_metrics(self) -> dict:
+        return {**self.metrics, "threshold_ms": self.threshold_ms, "queued": self._queue.qsize()}
+
+
+class SlowQueryListener(monitoring.CommandListener):
+    """Pass to the client as ``event_listeners=[SlowQueryListener(recorder)]``"""
+
+    def __init__(self, recorder: SlowQueryRecorder):
+        self.recorder = recorder
+        self._pending = {}  # request_id -> (command or None, collection, request queries)
+
+    def started(self, event):
+        name = event.command_name
+        if name == "explain" or (name == "getMore" and "maxTimeMS" in event.command):
+            # The recorder's own explains, and awaitData getMores (change streams) that wait by design
+            return
+        collection = query_monitor.collection_of(event)
+        if collection == COLLECTION:
+            return
+        command = event.command if name in SHAPE_FIELDS else None
+        self._pending[event.request_id] = (command, collection, query_monitor.current.get())
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event)
+
+    def _finish(self, event):
+        pending = self._pending.pop(event.request_id, None)
+        duration_ms = event.duration_micros / 1000
+        if pending is None or duration_ms < self.recorder.threshold_ms:
+            return
+        command, collection, queries = pending
+        self.recorder.submit({
+            "at": datetime.now(timezone.utc),
+            "route": queries.route if queries is not None else None,
+            "collection": collection,
+            "command": event.command_name,
+            "shape": None,
+            "duration_ms": round(duration_ms, 1),
+            "command_doc": command,
+        })
+
+
+async def top_offenders(db, since: timedelta, limit: int = 20) -> List[dict]:
+    """Query shapes ranked by total time, with their most recent plan"""
+    pipeline = [
+        {"$match": {"at": {"$gte": datetime.now(timezone.utc) - since}}},
+        # Explained records first, so $first picks the latest plan
+        {"$sort": {"explained": -1, "at": -1}},
+        {"$group": {
+            "_id": {"collection": "$collection", "command": "$command", "shape": "$shape", "route": "$route"},
+            "count": {"$sum": 1},
+            "total_ms": {"$sum": "$duration_ms"},
+            "max_ms": {"$max": "$duration_ms"},
+            "last_seen": {"$max": "$at"},
+            "plan": {"$first": "$plan"},
+        }},
+        {"$sort": {"total_ms": -1}},
+        {"$limit": limit},
+    ]
+    offenders = []
+    async for row in db[COLLECTION].aggregate(pipeline):
+        key = row.pop("_id")
+        row["avg_ms"] = round(row["total_ms"] / row["count"], 1)
+        offenders.append({**key, **row})
+    return offenders
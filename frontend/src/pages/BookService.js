@@ -38,11 +38,38 @@ const BookService = () => {
   const [addMaintenance, setAddMaintenance] = useState(false);
   const [addRepair, setAddRepair] = useState(false);
   const [paymentMethod, setPaymentMethod] = useState('upi');
+  const [slotAvailability, setSlotAvailability] = useState({});
 
   useEffect(() => {
     fetchAddresses();
   }, []);
 
+  useEffect(() => {
+    if (serviceDate && selectedAddress) {
+      fetchSlotAvailability();
+    } else {
+      setSlotAvailability({});
+    }
+  }, [serviceDate, selectedAddress]);
+
+  const fetchSlotAvailability = async () => {
+    const day = format(serviceDate, 'yyyy-MM-dd');
+    try {
+      const response = await axios.get(`${API}/slots/availability`, {
+        params: { from: day, to: day, address_id: selectedAddress }
+      });
+      const available = {};
+      response.data.slots.forEach((slot) => {
+        available[slot.service_time] = slot.available;
+      });
+      setSlotAvailability(available);
+    } catch (error) {
+      console.error('Failed to fetch slot availability:', error);
+    }
+  };
+
+  const isSlotFull = (time) => slotAvailability[time] === 0;
+
   const fetchAddresses = async () => {
     try {
       const response = await axios.get(`${API}/addresses`);
@@ -102,6 +129,10 @@ const BookService = () => {
       toast.error('Please select a service date');
       return;
     }
+    if (step === 3 && isSlotFull(serviceTime)) {
+      toast.error('Selected time slot is full, please pick another');
+      return;
+    }
     setStep(step + 1);
   };
 
@@ -185,7 +216,7 @@ const BookService = () => {
         navigate(`/booking-confirmation/${booking.id}`);
       }
     } catch (error) {
-      toast.error('Booking failed');
+      toast.error(error.response?.status === 409 ? 'Selected time slot is full' : 'Booking failed');
       console.error(error);
     } finally {
       setLoading(false);
@@ -440,9 +471,9 @@ const BookService = () => {
                     onChange={(e) => setServiceTime(e.target.value)}
                     data-testid="time-select"
                   >
-                    <option value="09:00">9:00 AM - 12:00 PM</option>
-                    <option value="12:00">12:00 PM - 3:00 PM</option>
-                    <option value="15:00">3:00 PM - 6:00 PM</option>
+                    <option value="09:00" disabled={isSlotFull('09:00')}>9:00 AM - 12:00 PM{isSlotFull('09:00') ? ' (full)' : ''}</option>
+                    <option value="12:00" disabled={isSlotFull('12:00')}>12:00 PM - 3:00 PM{isSlotFull('12:00') ? ' (full)' : ''}</option>
+                    <option value="15:00" disabled={isSlotFull('15:00')}>3:00 PM - 6:00 PM{isSlotFull('15:00') ? ' (full)' : ''}</option>
                   </select>
                 </div>
               </div>
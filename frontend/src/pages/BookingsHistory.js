@@ -28,7 +28,9 @@ const BookingsHistory = () => {
 
   const fetchBookings = async () => {
     try {
-      const response = await axios.get(`${API}/bookings`);
+      const response = await axios.get(`${API}/bookings`, {
+        params: { view: 'summary' }
+      });
       setBookings(response.data);
     } catch (error) {
       console.error('Failed to fetch bookings:', error);
@@ -23,7 +23,9 @@ const Dashboard = () => {
 
   const fetchBookings = async () => {
     try {
-      const response = await axios.get(`${API}/bookings`);
+      const response = await axios.get(`${API}/bookings`, {
+        params: { view: 'summary', limit: 3 }
+      });
       setBookings(response.data.slice(0, 3)); // Show only latest 3
     } catch (error) {
       console.error('Failed to fetch bookings:', error);
@@ -31,6 +31,7 @@ const FieldDashboard = () => {
       const token = localStorage.getItem('token');
       const [jobsRes, statsRes] = await Promise.all([
         axios.get(`${API}/field/jobs`, {
+          params: { view: 'summary' },
           headers: { Authorization: `Bearer ${token}` }
         }),
         axios.get(`${API}/field/stats`, {
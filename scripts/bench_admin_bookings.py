@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Benchmark the /admin/bookings enrichment: per-booking find_one calls (old)
+versus batched $in lookups (new).
+
+Seeds a throwaway database on MONGO_URL (default mongodb://localhost:27017),
+counts the Mongo commands each approach issues and times them.
+
+Usage: python scripts/bench_admin_bookings.py [--bookings 1000] [--runs 5]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+from pathlib import Path
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+from booking_queries import enrich_bookings  # noqa: E402
+
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+async def enrich_bookings_n_plus_one(db, bookings):
+    """The original per-booking enrichment, kept here for comparison"""
+    for booking in bookings:
+        booking['customer'] = await db.users.find_one({"id": booking['user_id']}, {"_id": 0, "password": 0})
+        if booking.get('assigned_technician_id'):
+            booking['technician'] = await db.field_teams.find_one(
+                {"id": booking['assigned_technician_id']},
+                {"_id": 0, "password": 0}
+            )
+        booking['address'] = await db.addresses.find_one({"id": booking['address_id']}, {"_id": 0})
+    return bookings
+
+
+async def seed(db, n_bookings):
+    users = [{"id": str(uuid.uuid4()), "email": f"user{i}@example.com", "name": f"User {i}",
+              "phone": "9876543210", "password": "x"} for i in range(max(1, n_bookings // 4))]
+    addresses = [{"id": str(uuid.uuid4()), "user_id": u['id'], "name": "Home",
+                  "address_line": "1 Main Road"} for u in users]
+    teams = [{"id": str(uuid.uuid4()), "email": f"tech{i}@example.com", "name": f"Tech {i}",
+              "phone": "9876543210", "employee_id": f"E{i}", "password": "x"} for i in range(20)]
+    bookings = []
+    for i in range(n_bookings):
+        j = random.randrange(len(users))
+        bookings.append({
+            "id": str(uuid.uuid4()),
+            "user_id": users[j]['id'],
+            "address_id": addresses[j]['id'],
+            "assigned_technician_id": random.choice(teams)['id'] if random.random() < 0.7 else None,
+            "status": "confirmed",
+            "created_at": f"2025-01-01T00:00:{i % 60:02d}",
+        })
+    await db.users.insert_many(users)
+    await db.addresses.insert_many(addresses)
+    await db.field_teams.insert_many(teams)
+    await db.bookings.insert_many(bookings)
+    for name in ("users", "addresses", "field_teams"):
+        await db[name].create_index("id", unique=True)
+
+
+async def measure(db, counter, enrich, runs):
+    timings = []
+    commands = 0
+    for _ in range(runs):
+        bookings = await db.bookings.find({}, {"_id": 0}).sort("created_at", -1).to_list(None)
+        counter.count = 0
+        started = time.perf_counter()
+        await enrich(db, bookings)
+        timings.append(time.perf_counter() - started)
+        commands = counter.count
+    return commands, sorted(timings)[len(timings) // 2]
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bookings", type=int, default=1000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    counter = CommandCounter()
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"), event_listeners=[counter])
+    db_name = f"aquaclean_bench_{uuid.uuid4().hex[:8]}"
+    db = client[db_name]
+    try:
+        await seed(db, args.bookings)
+        print(f"{args.bookings} bookings, median of {args.runs} runs")
+        for label, enrich in (("before (N+1 find_one)", enrich_bookings_n_plus_one),
+                              ("after (batched $in)", enrich_bookings)):
+            commands, median = await measure(db, counter, enrich, args.runs)
+            print(f"  {label:<24} {commands:>6} round trips  {median * 1000:>9.1f} ms")
+    finally:
+        await client.drop_database(db_name)
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
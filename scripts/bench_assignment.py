@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Benchmark automatic technician assignment on a synthetic city.
+
+Technicians and customer addresses are scattered over a ~40 km square
+around Bangalore; bookings are spread over a few days and the three
+service slots. By default only the in-memory planner is timed. With
+--mongo, a throwaway database on MONGO_URL (default mongodb://localhost:27017)
+is seeded and the full batch (queries, planning, bulk write) is timed and
+its round trips counted.
+
+Usage: python scripts/bench_assignment.py [--bookings 500] [--technicians 300] [--runs 5] [--mongo]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+from assignment import auto_assign, plan_assignments  # noqa: E402
+from db_indexes import ensure_indexes  # noqa: E402
+from geo import point  # noqa: E402
+
+CENTER = (12.9716, 77.5946)
+SPAN_DEGREES = 0.18  # ~20 km either side
+DAYS = ["2025-03-01", "2025-03-02", "2025-03-03"]
+SLOTS = ["09:00", "12:00", "15:00"]
+
+
+def random_location():
+    return (CENTER[0] + random.uniform(-SPAN_DEGREES, SPAN_DEGREES),
+            CENTER[1] + random.uniform(-SPAN_DEGREES, SPAN_DEGREES))
+
+
+def synthetic_city(n_bookings, n_technicians):
+    technicians = []
+    for i in range(n_technicians):
+        lat, lng = random_location()
+        technicians.append({
+            "id": str(uuid.uuid4()),
+            "email": f"tech{i}@example.com",
+            "name": f"Tech {i}",
+            "active": True,
+            "base_location": point(lat, lng),
+            "skills": ["manual", "automated"] if random.random() < 0.6 else ["manual"],
+            "max_jobs_per_day": 6,
+        })
+    bookings = []
+    for _ in range(n_bookings):
+        lat, lng = random_location()
+        bookings.append({
+            "id": str(uuid.uuid4()),
+            "address_id": str(uuid.uuid4()),
+            "user_id": str(uuid.uuid4()),
+            "status": "confirmed",
+            "assigned_technician_id": None,
+            "service_date": random.choice(DAYS),
+            "service_time": random.choice(SLOTS),
+            "package_type": random.choice(["manual", "automated"]),
+            "lat": lat,
+            "lng": lng,
+        })
+    return bookings, technicians
+
+
+def median_ms(timings):
+    return sorted(timings)[len(timings) // 2] * 1000
+
+
+def bench_planner(bookings, technicians, runs):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        assignments, unassigned = plan_assignments(bookings, technicians, {})
+        timings.append(time.perf_counter() - started)
+    print(f"  planner only        {median_ms(timings):>8.1f} ms  "
+          f"({len(assignments)} assigned, {len(unassigned)} unassigned)")
+
+
+async def bench_mongo(bookings, technicians, runs):
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from pymongo import monitoring
+
+    class CommandCounter(monitoring.CommandListener):
+        count = 0
+
+        def started(self, event):
+            self.count += 1
+
+        def succeeded(self, event):
+            pass
+
+        def failed(self, event):
+            pass
+
+    counter = CommandCounter()
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"), event_listeners=[counter])
+    db_name = f"aquaclean_bench_{uuid.uuid4().hex[:8]}"
+    db = client[db_name]
+    try:
+        await ensure_indexes(db)
+        await db.field_teams.insert_many([dict(t) for t in technicians])
+        await db.addresses.insert_many([
+            {"id": b["address_id"], "user_id": b["user_id"], "lat": b["lat"], "lng": b["lng"]} for b in bookings
+        ])
+        await db.bookings.insert_many([
+            {k: v for k, v in b.items() if k not in ("lat", "lng")} for b in bookings
+        ])
+
+        timings = []
+        for _ in range(runs):
+            counter.count = 0
+            started = time.perf_counter()
+            await auto_assign(db, limit=len(bookings), dry_run=True)
+            timings.append(time.perf_counter() - started)
+        print(f"  full batch, dry run {median_ms(timings):>8.1f} ms  ({counter.count} round trips)")
+
+        counter.count = 0
+        started = time.perf_counter()
+        result = await auto_assign(db, limit=len(bookings))
+        print(f"  full batch, applied {(time.perf_counter() - started) * 1000:>8.1f} ms  "
+              f"({counter.count} round trips, {len(result['applied'])} assigned)")
+    finally:
+        await client.drop_database(db_name)
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bookings", type=int, default=500)
+    parser.add_argument("--technicians", type=int, default=300)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--mongo", action="store_true", help="also time the full batch against MongoDB")
+    args = parser.parse_args()
+
+    random.seed(42)
+    bookings, technicians = synthetic_city(args.bookings, args.technicians)
+    print(f"{args.bookings} bookings, {args.technicians} technicians, median of {args.runs} runs")
+    bench_planner(bookings, technicians, args.runs)
+    if args.mongo:
+        asyncio.run(bench_mongo(bookings, technicians, args.runs))
+
+
+if __name__ == "__main__":
+    main()
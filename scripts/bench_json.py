@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark booking list serialization:
+
+  fastapi     response_model validation + jsonable_encoder + json.dumps (default path)
+  typeadapter compiled TypeAdapter validate + dump_json (RESPONSE_VALIDATION mode)
+  orjson      orjson.dumps on the raw Mongo documents (FAST_JSON_RESPONSES mode)
+
+Imports the Booking model from backend/server.py, so run it with the backend
+requirements installed. No database connection is made.
+
+Usage: python scripts/bench_json.py [--sizes 1000 10000] [--runs 5]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List
+
+import orjson
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "aquaclean_bench")
+
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+from server import Booking, bookings_adapter  # noqa: E402
+
+
+def make_bookings(n):
+    now = datetime.now(timezone.utc)
+    return [{
+        "id": str(uuid.uuid4()),
+        "user_id": str(uuid.uuid4()),
+        "address_id": str(uuid.uuid4()),
+        "tank_type": "overhead",
+        "tank_capacity": "1000L",
+        "tank_photo_url": None,
+        "service_date": "2025-01-15",
+        "service_time": "10:00 AM - 12:00 PM",
+        "package_type": "manual" if i % 2 else "automated",
+        "add_disinfection": bool(i % 3),
+        "add_maintenance": False,
+        "add_repair": False,
+        "payment_method": "upi",
+        "status": "confirmed",
+        "amount": 150000,
+        "razorpay_order_id": f"order_{i}",
+        "payment_status": "completed",
+        "assigned_technician_id": None,
+        "checklist": None,
+        "incident_reports": [],
+        "customer_signature": None,
+        "created_at": now,
+    } for i in range(n)]
+
+
+def bench(fn, runs):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return sorted(timings)[len(timings) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    field = create_response_field(name="Response_get_bookings", type_=List[Booking], mode="serialization")
+
+    def fastapi_default(docs):
+        content = asyncio.run(serialize_response(field=field, response_content=docs))
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+
+    approaches = (
+        ("fastapi", fastapi_default),
+        ("typeadapter", lambda docs: bookings_adapter.dump_json(bookings_adapter.validate_python(docs))),
+        ("orjson", lambda docs: orjson.dumps(docs, option=orjson.OPT_NAIVE_UTC)),
+    )
+
+    for size in args.sizes:
+        docs = make_bookings(size)
+        print(f"{size} bookings, median of {args.runs} runs")
+        baseline = None
+        for label, serialize in approaches:
+            median = bench(lambda: serialize(docs), args.runs)
+            baseline = baseline or median
+            print(f"  {label:<12} {median * 1000:>9.2f} ms  {size / median:>12,.0f} rows/s  {baseline / median:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Minimal fake Razorpay API for local testing of backend/payment_gateway.py.
+
+Implements POST /v1/orders and GET /v1/orders/{id}, with optional injected
+latency and 5xx errors to exercise timeouts, retries and the circuit breaker.
+POST /v1/_fake/orders/{id}/pay marks an order as paid.
+
+Usage:
+    python scripts/fake_razorpay.py --port 9999 --latency 0.5 --error-rate 0.2
+    RAZORPAY_BASE_URL=http://localhost:9999/v1 uvicorn server:app
+"""
+
+import argparse
+import json
+import random
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+orders = {}
+
+
+class FakeRazorpayHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    error_rate = 0.0
+
+    def _send(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _degrade(self):
+        if self.latency:
+            time.sleep(self.latency)
+        if random.random() < self.error_rate:
+            self._send(502, {"error": {"code": "SERVER_ERROR", "description": "Injected failure"}})
+            return True
+        return False
+
+    def do_POST(self):
+        if self._degrade():
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+
+        if self.path == "/v1/orders":
+            order = {
+                "id": f"order_{uuid.uuid4().hex[:14]}",
+                "entity": "order",
+                "amount": body.get("amount"),
+                "amount_paid": 0,
+                "currency": body.get("currency", "INR"),
+                "receipt": body.get("receipt"),
+                "status": "created",
+                "created_at": int(time.time()),
+            }
+            orders[order["id"]] = order
+            self._send(200, order)
+        elif self.path.startswith("/v1/_fake/orders/") and self.path.endswith("/pay"):
+            order = orders.get(self.path.split("/")[4])
+            if not order:
+                self._send(404, {"error": {"code": "BAD_REQUEST_ERROR", "description": "Order not found"}})
+                return
+            order.update(status="paid", amount_paid=order["amount"])
+            self._send(200, order)
+        else:
+            self._send(404, {"error": {"code": "BAD_REQUEST_ERROR", "description": "Not found"}})
+
+    def do_GET(self):
+        if self._degrade():
+            return
+        if self.path.startswith("/v1/orders/"):
+            order = orders.get(self.path.split("/")[3])
+            if order:
+                self._send(200, order)
+                return
+        self._send(404, {"error": {"code": "BAD_REQUEST_ERROR", "description": "Not found"}})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=9999)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 502")
+    args = parser.parse_args()
+
+    FakeRazorpayHandler.latency = args.latency
+    FakeRazorpayHandler.error_rate = args.error_rate
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), FakeRazorpayHandler)
+    print(f"Fake Razorpay listening on http://127.0.0.1:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
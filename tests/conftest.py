@@ -0,0 +1,205 @@
+"""Shared test setup.
+
+Unit tests only import backend modules. Tests of database code run their
+coroutines through ``run_db``, which hands them a Motor database of their
+own, emptied before and after. Tests that use the ``client`` fixture run the
+app in process against a throwaway database seeded once per session with
+``TEST_BOOKINGS`` synthetic bookings. Both use the mongod on
+``TEST_MONGO_URL`` (default ``mongodb://localhost:27017``) and are skipped
+when none is reachable there, unless ``TEST_MONGO_REQUIRED=1``, which makes
+that an error. Set it wherever a mongod is provided, so the plan, budget and
+store tests cannot pass by skipping:
+
+    TEST_MONGO_REQUIRED=1 python -m pytest -q tests
+
+``server`` is only imported by the ``app`` fixture, i.e. after collection,
+so the app is configured by the environment below.
+"""
+import asyncio
+import os
+import random
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+TEST_MONGO_URL = os.environ.get("TEST_MONGO_URL", "mongodb://localhost:27017")
+TEST_BOOKINGS = int(os.environ.get("TEST_BOOKINGS", "3000"))
+TEST_MONGO_REQUIRED = os.environ.get("TEST_MONGO_REQUIRED", "0") == "1"
+
+os.environ["MONGO_URL"] = TEST_MONGO_URL
+os.environ["DB_NAME"] = f"aquaclean_test_{uuid.uuid4().hex[:8]}"
+os.environ["BCRYPT_ROUNDS"] = "4"
+os.environ["RAZORPAY_KEY_SECRET"] = "test-secret"
+os.environ["RAZORPAY_WEBHOOK_SECRET"] = "test-secret"
+os.environ["EVENTS_BACKEND"] = "memory"
+os.environ["MEDIA_BACKEND"] = "gridfs"
+os.environ["SLOW_QUERY_MS"] = "1000000"
+os.environ["ROLLUP_REBUILD_HOUR_UTC"] = "-1"
+os.environ["ROUTE_BUILD_HOUR_UTC"] = "-1"
+os.environ.pop("CLOUDINARY_CLOUD_NAME", None)
+
+CENTER = (12.9716, 77.5946)
+SPAN_DEGREES = 0.18
+PASSWORD = "test-pass"
+STATUSES = ["pending", "confirmed", "in-progress", "completed", "cancelled"]
+STATUS_WEIGHTS = [15, 30, 5, 40, 10]
+
+
+@pytest.fixture(scope="session")
+def mongo_db():
+    from pymongo import MongoClient
+    from pymongo.errors import ConnectionFailure
+
+    mongo = MongoClient(TEST_MONGO_URL, tz_aware=True, serverSelectionTimeoutMS=2000)
+    try:
+        mongo.admin.command("ping")
+    except ConnectionFailure:
+        mongo.close()
+        if TEST_MONGO_REQUIRED:
+            pytest.fail(f"no mongod at {TEST_MONGO_URL} (TEST_MONGO_REQUIRED=1)")
+        pytest.skip(f"no mongod at {TEST_MONGO_URL}")
+    yield mongo[os.environ["DB_NAME"]]
+    mongo.drop_database(os.environ["DB_NAME"])
+    mongo.close()
+
+
+@pytest.fixture
+def run_db(mongo_db):
+    """``run_db(test)`` runs ``await test(db)`` on a new event loop, with a Motor
+    client of its own (Motor binds to the loop it first runs on)"""
+    name = f"{mongo_db.name}_unit"
+
+    def run(test):
+        async def main():
+            from motor.motor_asyncio import AsyncIOMotorClient
+
+            client = AsyncIOMotorClient(TEST_MONGO_URL, tz_aware=True)
+            try:
+                return await test(client[name])
+            finally:
+                client.close()
+
+        return asyncio.run(main())
+
+    mongo_db.client.drop_database(name)
+    yield run
+    mongo_db.client.drop_database(name)
+
+
+@pytest.fixture(scope="session")
+def app(mongo_db):
+    import server
+
+    return server
+
+
+def random_location():
+    return (CENTER[0] + random.uniform(-SPAN_DEGREES, SPAN_DEGREES),
+            CENTER[1] + random.uniform(-SPAN_DEGREES, SPAN_DEGREES))
+
+
+def seed(server, db, n_bookings: int) -> dict:
+    """Insert the synthetic dataset; returns the documents and ids tests act on"""
+    import slots
+    from geo import point
+    from password_hashing import pwd_context
+
+    random.seed(42)
+    now = datetime.now(timezone.utc)
+    today = now.date()
+    password = pwd_context.hash(PASSWORD)
+
+    admin = server.Admin(email="admin@example.com", name="Admin").model_dump()
+    db.admins.insert_one({**admin, "password": password})
+
+    users, addresses = [], []
+    for i in range(max(n_bookings // 10, 100)):
+        user = server.User(email=f"user{i}@example.com", name=f"User {i}", phone="9000000000",
+                           created_at=now - timedelta(days=random.uniform(0, 365))).model_dump()
+        lat, lng = random_location()
+        address = server.Address(user_id=user["id"], name="Home", address_line=f"{i} Test Road",
+                                 lat=lat, lng=lng).model_dump()
+        users.append({**user, "password": password})
+        addresses.append(address)
+    db.users.insert_many(users)
+    db.addresses.insert_many(addresses)
+
+    teams = []
+    for i in range(30):
+        lat, lng = random_location()
+        team = server.FieldTeam(email=f"tech{i}@example.com", name=f"Tech {i}", phone="9000000001",
+                                employee_id=f"EMP{i:03d}", base_location=point(lat, lng)).model_dump()
+        teams.append({**team, "password": password})
+    db.field_teams.insert_many(teams)
+
+    def booking(address, status, service_date, technician=None, **extra):
+        doc = server.Booking(
+            user_id=address["user_id"], address_id=address["id"], tank_type="overhead", tank_capacity="1000",
+            service_date=service_date.isoformat(), service_time=random.choice(slots.SERVICE_SLOTS),
+            service_area=slots.service_area(address), package_type=random.choice(["manual", "automated"]),
+            payment_method=random.choice(["upi", "card", "cod"]), status=status, amount=150000,
+            payment_status="completed" if status in ("confirmed", "in-progress", "completed") else "pending",
+            assigned_technician_id=technician,
+            created_at=now - timedelta(days=random.uniform(0, 60)),
+            **extra
+        ).model_dump()
+        doc["slot_reserved"] = status != "cancelled"
+        return doc
+
+    bookings = []
+    for _ in range(n_bookings):
+        address = random.choice(addresses)
+        status = random.choices(STATUSES, STATUS_WEIGHTS)[0]
+        technician = random.choice(teams)["id"] if status != "pending" and random.random() < 0.8 else None
+        extra = {}
+        if random.random() < 0.03:
+            extra["incident_reports"] = [{"id": str(uuid.uuid4()), "description": "Crack", "severity": "low",
+                                          "reported_at": now}]
+        bookings.append(booking(address, status, today + timedelta(days=random.randint(-15, 15)), technician, **extra))
+
+    # The bookings tests act on, on the first customer and technician
+    user_address = addresses[0]
+    technician = teams[0]
+    subjects = {
+        "job": booking(user_address, "confirmed", today, technician["id"]),
+        "assign": booking(user_address, "confirmed", today + timedelta(days=1)),
+        "status": booking(user_address, "pending", today + timedelta(days=2)),
+        "reschedule": booking(user_address, "confirmed", today + timedelta(days=2)),
+        "verify": booking(user_address, "pending", today + timedelta(days=3), razorpay_order_id="order_test"),
+    }
+    bookings.extend(subjects.values())
+    db.bookings.insert_many(bookings)
+
+    return {
+        "user": users[0], "address": user_address, "technician": technician, "admin": admin,
+        **{name: doc["id"] for name, doc in subjects.items()},
+    }
+
+
+@pytest.fixture(scope="session")
+def dataset(app, mongo_db):
+    return seed(app, mongo_db, TEST_BOOKINGS)
+
+
+@pytest.fixture(scope="session")
+def client(app, dataset):
+    from fastapi.testclient import TestClient
+
+    # Entering the client runs the startup hooks, which build every manifest index
+    with TestClient(app.app) as http:
+        http.portal.call(app.rollups.rebuild, app.db)
+        yield http
+
+
+@pytest.fixture(scope="session")
+def auth(app, dataset):
+    """Authorization headers by role"""
+    return {
+        role: {"Authorization": f"Bearer {app.create_jwt_token(dataset[role]['id'])}"}
+        for role in ("user", "technician", "admin")
+    }
@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+
+from blob_store import (BlobNotFound, GridFSBlobStore, LocalBlobStore, content_hash, decode_data_url,
+                        parse_range)
+from db_indexes import INDEX_MANIFEST
+
+DATA = bytes(range(256)) * 4000  # spans several GridFS chunks
+
+
+async def read(store, blob_hash: str, start: int, end: int) -> bytes:
+    return b"".join([chunk async for chunk in store.stream(blob_hash, start, end)])
+
+
+async def roundtrip(store):
+    thumb_hash = await store.put(b"thumb", "image/webp")
+    blob_hash = await store.put(DATA, "image/webp", thumbnail=thumb_hash)
+    info = await store.info(blob_hash)
+    return blob_hash, thumb_hash, info, await read(store, blob_hash, 0, len(DATA) - 1), await read(store, blob_hash, 10, 19)
+
+
+def check_roundtrip(result):
+    blob_hash, thumb_hash, info, full, part = result
+    assert blob_hash == content_hash(DATA)
+    assert (info.size, info.content_type, info.thumbnail) == (len(DATA), "image/webp", thumb_hash)
+    assert full == DATA
+    assert part == DATA[10:20]
+
+
+async def dedup(store):
+    hashes = await asyncio.gather(*(store.put(DATA, "image/jpeg") for _ in range(5)))
+    # A later upload with a thumbnail adds it to the stored blob
+    await store.put(DATA, "image/jpeg", thumbnail="t" * 64)
+    return set(hashes), await store.info(content_hash(DATA))
+
+
+async def missing(store):
+    with pytest.raises(BlobNotFound):
+        await store.info("0" * 64)
+
+
+def test_local_roundtrip(tmp_path):
+    check_roundtrip(asyncio.run(roundtrip(LocalBlobStore(str(tmp_path)))))
+
+
+def test_local_dedup(tmp_path):
+    hashes, info = asyncio.run(dedup(LocalBlobStore(str(tmp_path))))
+    assert hashes == {content_hash(DATA)}
+    assert info.thumbnail == "t" * 64
+    # The blob, its metadata, and no leftover temp files
+    assert sorted(p.suffix for p in tmp_path.rglob("*") if p.is_file()) == ["", ".json"]
+
+
+def test_local_missing(tmp_path):
+    asyncio.run(missing(LocalBlobStore(str(tmp_path))))
+
+
+def test_gridfs_roundtrip(run_db):
+    async def test(db):
+        return await roundtrip(GridFSBlobStore(db))
+
+    check_roundtrip(run_db(test))
+
+
+def test_gridfs_concurrent_uploads_store_one_copy(run_db):
+    async def test(db):
+        await db["media.files"].create_indexes(INDEX_MANIFEST["media.files"])
+        result = await dedup(GridFSBlobStore(db))
+        files = await db["media.files"].count_documents({})
+        chunk_owners = await db["media.chunks"].distinct("files_id")
+        return result, files, chunk_owners
+
+    (hashes, info), files, chunk_owners = run_db(test)
+    assert hashes == {content_hash(DATA)}
+    assert info.thumbnail == "t" * 64
+    assert files == 1
+    assert len(chunk_owners) == 1
+
+
+def test_gridfs_missing(run_db):
+    async def test(db):
+        await missing(GridFSBlobStore(db))
+
+    run_db(test)
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("bytes=0-9", (0, 9)),
+    ("bytes=90-", (90, 99)),
+    ("bytes=-10", (90, 99)),
+    ("bytes=95-200", (95, 99)),
+    ("bytes=0-1,5-6", None),
+    ("items=0-1", None),
+    ("bytes=a-b", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 100) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=-0", "bytes=9-5"])
+def test_unsatisfiable_range(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 100)
+
+
+def test_decode_data_url():
+    assert decode_data_url("data:image/png;base64,aGVsbG8=") == (b"hello", "image/png")
+    assert decode_data_url("data:;base64,aGVsbG8=") == (b"hello", "application/octet-stream")
+    assert decode_data_url("data:image/png;base64,aGVsbG8") is None
+    assert decode_data_url("https://example.com/a.png") is None
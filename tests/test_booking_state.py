@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+import booking_state
+from booking_state import OPEN_STATUSES, STATUSES, TRANSITIONS
+
+
+class FakeBookings:
+    """find_one_and_update/find_one over one in-memory booking"""
+
+    def __init__(self, booking):
+        self.booking = booking
+
+    def _matches(self, query):
+        for field, condition in query.items():
+            value = self.booking.get(field) if self.booking else None
+            if isinstance(condition, dict) and "$in" in condition:
+                if value not in condition["$in"]:
+                    return False
+            elif value != condition:
+                return False
+        return self.booking is not None
+
+    async def find_one_and_update(self, query, update, projection=None, return_document=None):
+        if not self._matches(query):
+            return None
+        before = dict(self.booking)
+        self.booking.update(update["$set"])
+        return before
+
+    async def find_one(self, query, projection=None):
+        return dict(self.booking) if self._matches(query) else None
+
+
+class FakeRollups:
+    def __init__(self):
+        self.writes = []
+
+    async def bulk_write(self, ops, ordered=True):
+        self.writes.append(ops)
+
+
+class FakeDB:
+    def __init__(self, booking):
+        self.bookings = FakeBookings(booking)
+        self.booking_rollups = FakeRollups()
+
+
+def booking(status="confirmed"):
+    return {"id": "b1", "status": status, "package_type": "manual", "payment_status": "pending",
+            "created_at": "2025-01-01T00:00:00", "amount": 100, "version": 3}
+
+
+def test_transitions_only_use_known_statuses():
+    for name, spec in TRANSITIONS.items():
+        assert set(spec.sources) <= set(STATUSES), name
+        assert spec.target is None or spec.target in STATUSES, name
+
+
+def test_closed_bookings_only_change_through_admin_override():
+    closed = set(STATUSES) - set(OPEN_STATUSES)
+    movable = {name for name, spec in TRANSITIONS.items() if closed & set(spec.sources)}
+    assert movable == {"set_status"}
+
+
+@pytest.mark.parametrize("name, status, target", [
+    ("start", "confirmed", "in-progress"),
+    ("complete", "in-progress", "completed"),
+    ("cancel", "pending", "cancelled"),
+    ("escalate", "in-progress", "escalated"),
+    ("assign", "pending", "pending"),
+])
+def test_transition_applies_target(name, status, target):
+    db = FakeDB(booking(status))
+    after = asyncio.run(booking_state.transition(db, name, {"id": "b1"}))
+    assert after["status"] == target
+    assert after["version"] == 4
+    assert db.bookings.booking["status"] == target
+
+
+def test_apply_returns_before_and_after():
+    db = FakeDB(booking("confirmed"))
+    before, after = asyncio.run(booking_state.apply(db, "assign", {"id": "b1"}, {"assigned_technician_id": "t2"}))
+    assert before.get("assigned_technician_id") is None
+    assert after["assigned_technician_id"] == "t2"
+
+
+def test_status_change_moves_rollup_row():
+    db = FakeDB(booking("in-progress"))
+    asyncio.run(booking_state.transition(db, "complete", {"id": "b1"}))
+    assert len(db.booking_rollups.writes) == 1
+    assert db.booking_rollups.writes[0][0]._filter["status"] == "in-progress"
+    assert db.booking_rollups.writes[0][1]._filter["status"] == "completed"
+
+
+@pytest.mark.parametrize("name, status", [("start", "pending"), ("complete", "confirmed"), ("cancel", "completed")])
+def test_invalid_transition(name, status):
+    db = FakeDB(booking(status))
+    with pytest.raises(booking_state.InvalidTransition) as error:
+        asyncio.run(booking_state.transition(db, name, {"id": "b1"}))
+    assert error.value.status == status
+    assert db.bookings.booking["status"] == status
+
+
+def test_missing_booking():
+    with pytest.raises(booking_state.BookingNotFound):
+        asyncio.run(booking_state.transition(FakeDB(None), "cancel", {"id": "b1"}))
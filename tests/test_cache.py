@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from cache import SingleFlightCache
+
+
+def test_concurrent_callers_share_one_computation():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return len(calls)
+
+    async def main():
+        cache = SingleFlightCache(ttl_seconds=60)
+        return await asyncio.gather(*(cache.get_or_compute("k", compute) for _ in range(10)))
+
+    assert asyncio.run(main()) == [1] * 10
+    assert len(calls) == 1
+
+
+def test_value_expires_and_can_be_invalidated():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return len(calls)
+
+    async def main(ttl):
+        cache = SingleFlightCache(ttl_seconds=ttl)
+        first = await cache.get_or_compute("k", compute)
+        second = await cache.get_or_compute("k", compute)
+        cache.invalidate("k")
+        third = await cache.get_or_compute("k", compute)
+        return first, second, third
+
+    assert asyncio.run(main(60)) == (1, 1, 2)
+    calls.clear()
+    assert asyncio.run(main(0)) == (1, 2, 3)
+
+
+def test_error_reaches_every_waiter_and_is_not_cached():
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("down")
+
+    async def ok():
+        return "up"
+
+    async def main():
+        cache = SingleFlightCache(ttl_seconds=60)
+        results = await asyncio.gather(*(cache.get_or_compute("k", fail) for _ in range(3)), return_exceptions=True)
+        return results, await cache.get_or_compute("k", ok)
+
+    results, retried = asyncio.run(main())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert retried == "up"
+
+
+def test_cancelled_leader_hands_over_to_a_waiter():
+    async def compute():
+        await asyncio.sleep(0.05)
+        return "value"
+
+    async def main():
+        cache = SingleFlightCache(ttl_seconds=60)
+        leader = asyncio.create_task(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.wait_for(waiter, 1)
+
+    assert asyncio.run(main()) == "value"
+
+
+def test_cancelled_waiter_leaves_leader_running():
+    async def compute():
+        await asyncio.sleep(0.05)
+        return "value"
+
+    async def main():
+        cache = SingleFlightCache(ttl_seconds=60)
+        leader = asyncio.create_task(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return await leader
+
+    assert asyncio.run(main()) == "value"
@@ -0,0 +1,78 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+
+from daily_jobs import DailyJob
+from geo import point
+from routing import RouteBuilder, route_id
+
+
+class Counter(DailyJob):
+    name = "counter"
+
+    def __init__(self, db, hour=3):
+        super().__init__(db, hour)
+        self.days = []
+
+    async def run(self, day: str):
+        self.days.append(day)
+
+
+@pytest.mark.parametrize("now, expected", [
+    (datetime(2030, 1, 7, 2, 59, tzinfo=timezone.utc), datetime(2030, 1, 7, 3, tzinfo=timezone.utc)),
+    (datetime(2030, 1, 7, 3, 0, tzinfo=timezone.utc), datetime(2030, 1, 8, 3, tzinfo=timezone.utc)),
+    (datetime(2030, 1, 31, 23, 0, tzinfo=timezone.utc), datetime(2030, 2, 1, 3, tzinfo=timezone.utc)),
+])
+def test_next_run(now, expected):
+    assert Counter(None)._next_run(now) == expected
+
+
+@pytest.mark.parametrize("hour", [-1, 24])
+def test_hour_outside_the_day_disables_the_job(hour):
+    async def main():
+        job = Counter(None, hour)
+        job.start()
+        return job._task
+
+    assert asyncio.run(main()) is None
+
+
+def test_one_run_per_day_across_workers(run_db):
+    async def test(db):
+        workers = [Counter(db), Counter(db)]
+        claimed = await asyncio.gather(*(w.run_once("2030-01-07") for w in workers))
+        again = await workers[0].run_once("2030-01-07")
+        next_day = await workers[1].run_once("2030-01-08")
+
+        class Other(Counter):
+            name = "other"
+
+        other = await Other(db).run_once("2030-01-07")
+        return sorted(claimed), again, next_day, other, workers[0].days + workers[1].days
+
+    claimed, again, next_day, other, days = run_db(test)
+    assert claimed == [False, True]
+    assert (again, next_day, other) == (False, True, True)
+    assert sorted(days) == ["2030-01-07", "2030-01-08"]
+
+
+def test_route_builder_plans_the_next_day(run_db):
+    async def test(db):
+        await db.field_teams.insert_one({"id": "t1", "base_location": point(12.97, 77.59)})
+        await db.addresses.insert_many([{"id": "a1", "lat": 12.98, "lng": 77.60}, {"id": "a2", "lat": 12.99, "lng": 77.61}])
+        await db.bookings.insert_many([
+            {"id": "b1", "address_id": "a1", "service_date": "2030-01-08", "service_time": "12:00",
+             "status": "confirmed", "assigned_technician_id": "t1"},
+            {"id": "b2", "address_id": "a2", "service_date": "2030-01-08", "service_time": "09:00",
+             "status": "confirmed", "assigned_technician_id": "t1"},
+            {"id": "b3", "address_id": "a2", "service_date": "2030-01-07", "service_time": "09:00",
+             "status": "confirmed", "assigned_technician_id": "t1"},
+        ])
+        builder = RouteBuilder(db, hour=18)
+        ran = await builder.run_once("2030-01-07")
+        return ran, await db.routes.find({}, {"_id": 1, "stops.booking_id": 1}).to_list(None)
+
+    ran, routes = run_db(test)
+    assert ran
+    assert routes == [{"_id": route_id("t1", "2030-01-08"), "stops": [{"booking_id": "b2"}, {"booking_id": "b1"}]}]
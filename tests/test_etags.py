@@ -0,0 +1,109 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from starlette.requests import Request
+
+import etags
+import slots
+from etags import etag_matches, list_etag, make_etag, stamp
+
+
+def request(if_none_match=None):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+def test_stamp_bumps_version_and_keeps_the_update():
+    update = stamp({"$set": {"status": "confirmed"}, "$push": {"log": 1}})
+    assert update["$set"]["status"] == "confirmed"
+    assert isinstance(update["$set"]["updated_at"], datetime)
+    assert update["$inc"] == {"version": 1}
+    assert update["$push"] == {"log": 1}
+
+
+@pytest.mark.parametrize("header, matches", [
+    (None, False),
+    ("*", True),
+    ('W/"abc"', True),
+    ('"abc"', True),
+    ('W/"other", W/"abc"', True),
+    ('W/"other"', False),
+])
+def test_etag_matches_weakly(header, matches):
+    assert etag_matches(request(header), 'W/"abc"') is matches
+
+
+def test_make_etag_depends_on_every_part():
+    assert make_etag({"user_id": "u1"}, 2) == make_etag({"user_id": "u1"}, 2)
+    assert make_etag({"user_id": "u1"}, 2) != make_etag({"user_id": "u1"}, 3)
+    assert make_etag({"user_id": "u1"}, 2).startswith('W/"')
+
+
+def test_list_etag_tracks_writes_and_counts(run_db):
+    query = {"user_id": "u1"}
+
+    async def test(db):
+        await db.bookings.insert_many([
+            {"id": "b1", "user_id": "u1", "updated_at": datetime(2030, 1, 1, tzinfo=timezone.utc), "version": 1},
+            {"id": "b2", "user_id": "u2", "updated_at": datetime(2030, 1, 1, tzinfo=timezone.utc), "version": 1},
+        ])
+        tags = [await list_etag(db.bookings, query, 20)]
+        tags.append(await list_etag(db.bookings, query, 20))
+        tags.append(await list_etag(db.bookings, query, 50))
+        await db.bookings.update_one({"id": "b1"}, stamp({"$set": {"status": "cancelled"}}))
+        tags.append(await list_etag(db.bookings, query, 20))
+        await db.bookings.delete_one({"id": "b1"})
+        tags.append(await list_etag(db.bookings, query, 20))
+        return tags
+
+    unchanged, same, other_page, written, deleted = run_db(test)
+    assert unchanged == same
+    assert len({unchanged, other_page, written, deleted}) == 4
+
+
+def test_releasing_a_slot_changes_the_etag(run_db):
+    async def test(db):
+        await db.bookings.insert_one({"id": "b1", "user_id": "u1", "service_date": "2030-01-07", "service_time": "09:00",
+                                      "service_area": "default", "slot_reserved": True,
+                                      "updated_at": datetime(2030, 1, 1, tzinfo=timezone.utc), "version": 1})
+        before = await list_etag(db.bookings, {"user_id": "u1"})
+        await slots.release_booking(db, "b1")
+        released = await list_etag(db.bookings, {"user_id": "u1"})
+        # updated_at is stored to the millisecond
+        await asyncio.sleep(0.01)
+        await slots.reclaim_booking(db, "b1")
+        reclaimed = await list_etag(db.bookings, {"user_id": "u1"})
+        return before, released, reclaimed, await db.bookings.find_one({"id": "b1"})
+
+    before, released, reclaimed, booking = run_db(test)
+    assert len({before, released, reclaimed}) == 3
+    assert booking["version"] == 3
+
+
+@pytest.mark.parametrize("role, path", [("user", "/api/bookings"), ("technician", "/api/field/jobs"),
+                                        ("user", "/api/auth/me")])
+def test_conditional_get(client, auth, role, path):
+    first = client.get(path, headers=auth[role])
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == etags.CACHE_CONTROL
+
+    cached = client.get(path, headers={**auth[role], "If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["ETag"] == etag
+    assert not cached.content
+
+    assert client.get(path, headers={**auth[role], "If-None-Match": 'W/"stale"'}).status_code == 200
+
+
+def test_slot_release_invalidates_the_list(app, client, auth, dataset):
+    headers = auth["user"]
+    etag = client.get("/api/bookings", headers=headers).headers["ETag"]
+    client.portal.call(slots.release_booking, app.db, dataset["assign"])
+    try:
+        response = client.get("/api/bookings", headers={**headers, "If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+    finally:
+        client.portal.call(slots.reclaim_booking, app.db, dataset["assign"])
@@ -0,0 +1,151 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import idempotency
+from db_indexes import INDEX_MANIFEST
+from idempotency import STALE_AFTER, KeyReused, StillInFlight, fingerprint
+
+SCOPE = "bookings:u1"
+
+
+class Handler:
+    def __init__(self, delay: float = 0, error: Exception = None):
+        self.calls = 0
+        self.delay = delay
+        self.error = error
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return {"id": f"booking-{self.calls}", "at": datetime(2030, 1, 1, tzinfo=timezone.utc)}
+
+
+def claim(payload: str, age: timedelta) -> dict:
+    return {"_id": f"{SCOPE}:k1", "status": "in_progress", "request_hash": fingerprint(payload),
+            "created_at": datetime.now(timezone.utc) - age}
+
+
+def test_replay_returns_the_stored_response(run_db):
+    handler = Handler()
+
+    async def test(db):
+        first = await idempotency.run(db, SCOPE, "k1", "{}", handler)
+        second = await idempotency.run(db, SCOPE, "k1", "{}", handler)
+        return first, second
+
+    first, second = run_db(test)
+    assert first == ({"id": "booking-1", "at": "2030-01-01T00:00:00+00:00"}, False)
+    assert second == (first[0], True)
+    assert handler.calls == 1
+
+
+def test_scopes_do_not_share_keys(run_db):
+    handler = Handler()
+
+    async def test(db):
+        await idempotency.run(db, SCOPE, "k1", "{}", handler)
+        return await idempotency.run(db, "bookings:u2", "k1", "{}", handler)
+
+    assert run_db(test)[1] is False
+    assert handler.calls == 2
+
+
+def test_key_reused_with_another_body(run_db):
+    handler = Handler()
+
+    async def test(db):
+        await idempotency.run(db, SCOPE, "k1", '{"a": 1}', handler)
+        with pytest.raises(KeyReused):
+            await idempotency.run(db, SCOPE, "k1", '{"a": 2}', handler)
+
+    run_db(test)
+    assert handler.calls == 1
+
+
+def test_duplicate_waits_for_the_first(run_db):
+    handler = Handler(delay=0.2)
+
+    async def test(db):
+        return await asyncio.gather(*(idempotency.run(db, SCOPE, "k1", "{}", handler) for _ in range(3)))
+
+    results = run_db(test)
+    assert handler.calls == 1
+    assert sorted(replayed for _, replayed in results) == [False, True, True]
+    assert len({response["id"] for response, _ in results}) == 1
+
+
+def test_in_flight_duplicate_with_another_body_is_rejected_at_once(run_db):
+    handler = Handler()
+
+    async def test(db):
+        await db.idempotency.insert_one(claim('{"a": 1}', timedelta(0)))
+        with pytest.raises(KeyReused):
+            await idempotency.run(db, SCOPE, "k1", '{"a": 2}', handler, wait_timeout=5)
+
+    run_db(test)
+    assert handler.calls == 0
+
+
+def test_wait_times_out(run_db):
+    async def test(db):
+        await db.idempotency.insert_one(claim("{}", timedelta(0)))
+        with pytest.raises(StillInFlight):
+            await idempotency.run(db, SCOPE, "k1", "{}", Handler(), wait_timeout=0.1)
+
+    run_db(test)
+
+
+def test_failure_releases_the_key(run_db):
+    failing = Handler(error=RuntimeError("gateway down"))
+    handler = Handler()
+
+    async def test(db):
+        with pytest.raises(RuntimeError):
+            await idempotency.run(db, SCOPE, "k1", "{}", failing)
+        return await idempotency.run(db, SCOPE, "k1", "{}", handler)
+
+    assert run_db(test)[1] is False
+    assert handler.calls == 1
+
+
+def test_stale_claim_is_taken_over_by_the_same_request(run_db):
+    handler = Handler()
+
+    async def test(db):
+        await db.idempotency.insert_one(claim("{}", STALE_AFTER * 2))
+        result = await idempotency.run(db, SCOPE, "k1", "{}", handler, wait_timeout=0.1)
+        return result, await db.idempotency.find_one({"_id": f"{SCOPE}:k1"})
+
+    (response, replayed), record = run_db(test)
+    assert not replayed and handler.calls == 1
+    assert record["status"] == "done" and record["request_hash"] == fingerprint("{}")
+
+
+def test_stale_claim_keeps_its_body(run_db):
+    handler = Handler()
+
+    async def test(db):
+        await db.idempotency.insert_one(claim('{"a": 1}', STALE_AFTER * 2))
+        with pytest.raises(KeyReused):
+            await idempotency.run(db, SCOPE, "k1", '{"a": 2}', handler, wait_timeout=0.1)
+        return await db.idempotency.find_one({"_id": f"{SCOPE}:k1"})
+
+    assert run_db(test)["request_hash"] == fingerprint('{"a": 1}')
+    assert handler.calls == 0
+
+
+def test_records_expire_by_ttl(run_db):
+    async def test(db):
+        await db.idempotency.create_indexes(INDEX_MANIFEST["idempotency"])
+        await idempotency.run(db, SCOPE, "k1", "{}", Handler())
+        return await db.idempotency.index_information(), await db.idempotency.find_one({"_id": f"{SCOPE}:k1"})
+
+    indexes, record = run_db(test)
+    assert list(indexes["created_ttl"]["key"]) == [("created_at", 1)]
+    assert indexes["created_ttl"]["expireAfterSeconds"] == 86400
+    # The TTL monitor ignores anything but BSON dates
+    assert isinstance(record["created_at"], datetime)
@@ -0,0 +1,140 @@
+import asyncio
+import io
+
+import pytest
+from PIL import Image
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from image_pipeline import (ImagePipeline, InvalidImage, UploadLimitMiddleware, UploadTooLarge, _normalize,
+                            read_capped, thumbnail_url, with_thumbnails)
+
+MEDIA = "/api/media/" + "a" * 64
+
+
+def photo(size=(400, 300), orientation=None, mode="RGB", image_format="JPEG") -> bytes:
+    image = Image.new(mode, size, (200, 30, 30, 255)[:len(mode)])
+    exif = Image.Exif()
+    exif[0x0112] = orientation or 1
+    exif[0x8825] = {2: (12.0, 58.0, 18.0)}  # GPS latitude
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+def opened(data: bytes) -> Image.Image:
+    return Image.open(io.BytesIO(data))
+
+
+def test_normalize_downsizes_and_thumbnails():
+    image = _normalize(photo((400, 300)), 200, 50, "WEBP", 80)
+    assert image.content_type == "image/webp"
+    assert (image.width, image.height) == (200, 150)
+    assert opened(image.data).format == "WEBP"
+    assert max(opened(image.thumbnail).size) == 50
+
+
+def test_normalize_applies_orientation_and_drops_exif():
+    # Orientation 6: stored landscape, displayed portrait
+    image = _normalize(photo((400, 300), orientation=6), 2048, 320, "JPEG", 80)
+    assert (image.width, image.height) == (300, 400)
+    assert not opened(image.data).getexif()
+
+
+def test_normalize_converts_transparency_for_jpeg():
+    image = _normalize(photo((40, 30), mode="RGBA", image_format="PNG"), 2048, 320, "JPEG", 80)
+    assert opened(image.data).mode == "RGB"
+
+
+def test_normalize_rejects_non_images():
+    with pytest.raises(InvalidImage):
+        _normalize(b"not an image", 2048, 320, "WEBP", 80)
+
+
+def test_pipeline_runs_in_worker_processes():
+    pipeline = ImagePipeline(max_workers=1)
+    try:
+        image = asyncio.run(pipeline.normalize(photo()))
+    finally:
+        pipeline.shutdown()
+    assert (image.width, image.height) == (400, 300)
+
+
+class Upload:
+    def __init__(self, data: bytes):
+        self.file = io.BytesIO(data)
+
+    async def read(self, size: int) -> bytes:
+        return self.file.read(size)
+
+
+def test_read_capped():
+    assert asyncio.run(read_capped(Upload(b"x" * 100_000), limit=100_000)) == b"x" * 100_000
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(read_capped(Upload(b"x" * 100_001), limit=100_000))
+
+
+@pytest.fixture
+def limited():
+    app = FastAPI()
+
+    @app.post("/upload")
+    @app.post("/other")
+    async def upload(file: UploadFile = File(...)):
+        return {"size": len(await file.read())}
+
+    app.add_middleware(UploadLimitMiddleware, paths=["/upload"], limit=1000)
+    with TestClient(app) as client:
+        yield client
+
+
+def form(size: int) -> dict:
+    return {"files": {"file": ("tank.jpg", b"x" * size, "image/jpeg")}}
+
+
+def test_upload_limit_from_content_length(limited):
+    assert limited.post("/upload", **form(500)).json() == {"size": 500}
+    response = limited.post("/upload", **form(1000))
+    assert response.status_code == 413
+    assert response.json() == {"detail": "Image too large"}
+
+
+def test_upload_limit_while_streaming(limited):
+    request = limited.build_request("POST", "/upload", **form(1000))
+    body, content_type = request.read(), request.headers["content-type"]
+
+    def chunks():
+        for start in range(0, len(body), 300):
+            yield body[start:start + 300]
+
+    # No Content-Length: the limit applies as the body arrives
+    response = limited.post("/upload", content=chunks(), headers={"Content-Type": content_type})
+    assert response.status_code == 413
+    assert response.json() == {"detail": "Image too large"}
+
+
+def test_other_paths_are_not_limited(limited):
+    assert limited.post("/other", **form(5000)).json() == {"size": 5000}
+
+
+def test_thumbnail_url():
+    assert thumbnail_url(MEDIA) == MEDIA + "/thumbnail"
+    assert thumbnail_url("https://res.cloudinary.com/demo/image/upload/v1/tank.jpg") == \
+        "https://res.cloudinary.com/demo/image/upload/c_limit,w_320,h_320/v1/tank.jpg"
+    assert thumbnail_url("https://example.com/tank.jpg") == "https://example.com/tank.jpg"
+    assert thumbnail_url(None) is None
+
+
+def test_with_thumbnails_rewrites_every_photo():
+    booking = with_thumbnails({
+        "tank_photo_url": MEDIA,
+        "before_photos": [MEDIA],
+        "after_photos": [MEDIA],
+        "checklist": {"steps": {"arrival": {"photos": [MEDIA]}, "pre_inspection": {"photos": []}}},
+        "incident_reports": [{"photo_urls": [MEDIA]}],
+    })
+    thumb = MEDIA + "/thumbnail"
+    assert booking["tank_photo_url"] == thumb
+    assert booking["before_photos"] == booking["after_photos"] == [thumb]
+    assert booking["checklist"]["steps"]["arrival"]["photos"] == [thumb]
+    assert booking["incident_reports"][0]["photo_urls"] == [thumb]
@@ -0,0 +1,41 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_filter
+
+
+@pytest.mark.parametrize("value", [
+    datetime(2025, 3, 1, 9, 30, 15, 123000, tzinfo=timezone.utc),
+    "2025-03-01",
+    42,
+    None,
+])
+def test_cursor_roundtrip(value):
+    cursor = encode_cursor(value, "b1")
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (value, "b1")
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", "", encode_cursor("x", "b1")[:-3], "WzFd"])
+def test_invalid_cursor(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
+
+
+def test_keyset_filter_without_cursor_is_the_query():
+    assert keyset_filter({"user_id": "u1"}, "created_at", -1, None) == {"user_id": "u1"}
+
+
+def test_keyset_filter_descending():
+    at = datetime(2025, 3, 1, tzinfo=timezone.utc)
+    assert keyset_filter({"user_id": "u1"}, "created_at", -1, encode_cursor(at, "b1")) == {"$and": [
+        {"user_id": "u1"},
+        {"$or": [{"created_at": {"$lt": at}}, {"created_at": at, "id": {"$lt": "b1"}}]},
+    ]}
+
+
+def test_keyset_filter_ascending_on_empty_query():
+    assert keyset_filter({}, "service_date", 1, encode_cursor("2025-03-01", "b1")) == {
+        "$or": [{"service_date": {"$gt": "2025-03-01"}}, {"service_date": "2025-03-01", "id": {"$gt": "b1"}}],
+    }
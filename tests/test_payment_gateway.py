@@ -0,0 +1,116 @@
+import asyncio
+import time
+
+import pytest
+
+from payment_gateway import CircuitBreaker, GatewayError, GatewayUnavailable, RazorpayGateway
+
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_half_open_lets_one_trial_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_failed_trial_reopens():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+
+def test_successful_trial_closes():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def gateway(request, threshold=1):
+    client = RazorpayGateway("key", "secret", breaker=CircuitBreaker(threshold, reset_timeout=0.01), max_retries=0)
+    client._request = request
+    return client
+
+
+def test_unexpected_error_settles_trial():
+    def malformed(method, path, payload):
+        raise ValueError("not JSON")
+
+    client = gateway(malformed)
+    client.breaker.record_failure()
+    time.sleep(0.02)
+    with pytest.raises(ValueError):
+        asyncio.run(client.fetch_order("order_1"))
+    time.sleep(0.02)
+    assert client.breaker.allow()
+    client.shutdown()
+
+
+def test_cancelled_trial_does_not_block_the_next():
+    def slow(method, path, payload):
+        time.sleep(0.2)
+        return {}
+
+    async def cancel_trial(client):
+        call = asyncio.create_task(client.fetch_order("order_1"))
+        await asyncio.sleep(0.05)
+        call.cancel()
+        await asyncio.gather(call, return_exceptions=True)
+
+    client = gateway(slow)
+    client.breaker.record_failure()
+    time.sleep(0.02)
+    asyncio.run(cancel_trial(client))
+    assert client.breaker.state == "half-open"
+    assert client.breaker.allow()
+    client.shutdown()
+
+
+def test_client_errors_do_not_trip_the_breaker():
+    def rejected(method, path, payload):
+        raise GatewayError("400")
+
+    client = gateway(rejected)
+    for _ in range(3):
+        with pytest.raises(GatewayError):
+            asyncio.run(client.fetch_order("order_1"))
+    assert client.breaker.state == "closed"
+    client.shutdown()
+
+
+def test_open_circuit_fails_fast():
+    def unavailable(method, path, payload):
+        raise GatewayUnavailable("503")
+
+    client = gateway(unavailable)
+    with pytest.raises(GatewayUnavailable):
+        asyncio.run(client.fetch_order("order_1"))
+    with pytest.raises(GatewayUnavailable, match="circuit is open"):
+        asyncio.run(client.fetch_order("order_1"))
+    assert client.metrics["rejected"] == 1
+    client.shutdown()
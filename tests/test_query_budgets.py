@@ -0,0 +1,40 @@
+"""Mongo command budgets for the list endpoints.
+
+A page costs a fixed number of commands however many rows it holds, so these
+fail as soon as an endpoint goes back to querying once per row (N+1).
+"""
+import pytest
+
+from query_monitor import query_budget
+
+# Under the driver's first batch of 101, so a page needs no getMore
+PAGE = 50
+
+
+@pytest.mark.parametrize("role, path, params, budget", [
+    # admin lookup, page, one booking count aggregation
+    ("admin", "/api/admin/customers", {"limit": PAGE}, 3),
+    ("admin", "/api/admin/field-teams", {"limit": PAGE}, 3),
+    # admin lookup, page, customers + technicians + addresses
+    ("admin", "/api/admin/bookings", {"limit": PAGE}, 5),
+    ("admin", "/api/admin/bookings", {"limit": PAGE, "status": "confirmed"}, 5),
+    ("admin", "/api/admin/incidents", {"limit": PAGE}, 2),
+    # list ETag (newest + count), page
+    ("user", "/api/bookings", {"limit": PAGE}, 3),
+    ("technician", "/api/field/jobs", {"limit": PAGE}, 3),
+    ("user", "/api/addresses", {}, 1),
+])
+def test_list_endpoint_budget(client, auth, role, path, params, budget):
+    with query_budget(budget, route=path):
+        response = client.get(path, params=params, headers=auth[role])
+    assert response.status_code == 200
+    assert response.json()
+
+
+@pytest.mark.parametrize("path", ["/api/admin/customers", "/api/admin/field-teams"])
+def test_page_size_does_not_change_query_count(client, auth, path):
+    with query_budget(3, route=path) as finished:
+        small = client.get(path, params={"limit": 2}, headers=auth["admin"])
+        full = client.get(path, params={"limit": PAGE}, headers=auth["admin"])
+    assert len(small.json()) == 2 and len(full.json()) > 2
+    assert finished[0].queries.count == finished[1].queries.count
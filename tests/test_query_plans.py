@@ -0,0 +1,292 @@
+"""Query plans of every API route.
+
+Each test calls one group of routes against the seeded database (see
+conftest.py) and explains every distinct query they issue, including their
+background tasks. It fails if any query:
+
+- uses a COLLSCAN (including inside $lookup), or
+- examines more than MAX_EXAMINED_RATIO times the documents it returns (or,
+  for counts and writes, the documents it counts or matches)
+
+``test_every_route_is_checked`` fails if a route has no case here, so a new
+handler cannot ship without its queries being checked. Deliberate scans are
+listed in ALLOWED_SCANS with the reason they are acceptable.
+"""
+import hashlib
+import hmac
+import io
+import json
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from pymongo import monitoring
+
+import query_monitor
+import slow_queries
+from tests.conftest import CENTER, PASSWORD
+
+MAX_EXAMINED_RATIO = 10
+
+# (route, collection, command) -> why a full scan is acceptable there.
+# The unfiltered first pages of /api/admin/customers and /api/admin/field-teams
+# are not scans: their created_id index provides the sort, so the planner walks
+# it and stops at the page limit (examined == returned).
+ALLOWED_SCANS = {
+    ("/api/admin/dashboard-stats", "bookings", "aggregate"):
+        "all booking figures in one $facet pass, cached for DASHBOARD_CACHE_TTL",
+    ("/api/admin/slow-queries", "slow_queries", "aggregate"):
+        "capped collection, bounded by SLOW_QUERY_LOG_MB",
+}
+
+# Routes that are not called, and why
+EXEMPT_ROUTES = {
+    ("GET", "/api/events/bookings"): "long-lived event stream; only authenticates",
+    ("GET", "/api/events/field"): "long-lived event stream; only authenticates",
+    ("GET", "/api/events/admin"): "long-lived event stream; its admin lookup is checked via /api/admin/me",
+}
+
+
+class PlanCapture(monitoring.CommandListener):
+    """Collects explainable commands issued while handling a request"""
+
+    def __init__(self, database: str):
+        self.database = database
+        self.captured = []
+
+    def started(self, event):
+        queries = query_monitor.current.get()
+        if queries is None or event.database_name != self.database or event.command_name not in slow_queries.SHAPE_FIELDS:
+            return
+        self.captured.append((queries.route, event.command_name, query_monitor.collection_of(event), event.command))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+# Global listeners only reach clients created after registration
+assert "server" not in sys.modules, "server was imported before the plan capture was registered"
+capture = PlanCapture(os.environ["DB_NAME"])
+monitoring.register(capture)
+
+
+class PlanChecker:
+    def __init__(self, http, db):
+        self.http = http
+        self.db = db
+        self.exercised = set()
+        self.seen = set()
+        self.failures = []
+        self.allowed = []
+        self.groups = set()
+
+    def call(self, method: str, template: str, headers=None, params=None, json=None, files=None,
+             content=None, **path_params):
+        response = self.http.request(method, template.format(**path_params), params=params, json=json,
+                                     files=files, headers=headers, content=content)
+        self.exercised.add((method, template))
+        if response.status_code >= 400:
+            # The handler did not get as far as its queries
+            self.failures.append(f"{method} {template} returned {response.status_code}: {response.text[:200]}")
+        self.check_plans()
+        return response
+
+    def check_plans(self):
+        while capture.captured:
+            route, name, collection, command = capture.captured.pop(0)
+            key = (route, collection, name, slow_queries.command_shape(name, command))
+            if key in self.seen:
+                continue
+            self.seen.add(key)
+
+            explain = self.db.command({"explain": slow_queries.explainable(name, command), "verbosity": "executionStats"})
+            plan = slow_queries.summarize_plan(explain)
+
+            problems = []
+            if plan["collscan"]:
+                problems.append("COLLSCAN")
+            examined, returned = plan["docs_examined"] or 0, plan["returned"] or 0
+            if examined > MAX_EXAMINED_RATIO * max(returned, 1):
+                problems.append(f"examined {examined} documents for {returned}")
+            if not problems:
+                continue
+
+            description = f"{route}: {name} on {collection} {key[3]} ({', '.join(problems)}; stages {plan['stages']})"
+            reason = ALLOWED_SCANS.get((route, collection, name))
+            if reason:
+                self.allowed.append(f"{description} - allowed: {reason}")
+            else:
+                self.failures.append(description)
+
+    def assert_clean(self):
+        failures, self.failures = self.failures, []
+        assert not failures, "\n".join(failures)
+
+
+@pytest.fixture(scope="module")
+def plans(client, mongo_db):
+    # Drop whatever other modules' requests left behind
+    capture.captured.clear()
+    return PlanChecker(client, mongo_db)
+
+
+@pytest.fixture
+def check(plans, request):
+    yield plans
+    plans.groups.add(request.node.name)
+
+
+def sample_jpeg() -> bytes:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 48), (30, 120, 200)).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+def signature(payload: bytes) -> str:
+    return hmac.new(os.environ["RAZORPAY_KEY_SECRET"].encode(), payload, hashlib.sha256).hexdigest()
+
+
+def today():
+    return datetime.now(timezone.utc).date()
+
+
+def test_customer_auth(check, dataset, auth):
+    email = dataset["user"]["email"]
+    check.call("POST", "/api/auth/register", json={"email": "new@example.com", "password": PASSWORD,
+                                                   "name": "New", "phone": "9000000002"})
+    check.call("POST", "/api/auth/login", json={"email": email, "password": PASSWORD})
+    otp = check.call("POST", "/api/auth/send-otp", json={"email": email}).json()["otp"]
+    check.call("POST", "/api/auth/verify-otp", json={"email": email, "otp": otp})
+    check.call("GET", "/api/auth/me", auth["user"])
+    check.call("POST", "/api/events/token", auth["user"])
+    check.assert_clean()
+
+
+def test_addresses(check, auth):
+    user = auth["user"]
+    address = check.call("POST", "/api/addresses", user, json={"name": "Office", "address_line": "1 Test Park",
+                                                              "lat": CENTER[0], "lng": CENTER[1]}).json()
+    check.call("GET", "/api/addresses", user)
+    check.call("PUT", "/api/addresses/{address_id}", user, json={"name": "Office", "address_line": "2 Test Park"},
+               address_id=address["id"])
+    check.call("DELETE", "/api/addresses/{address_id}", user, address_id=address["id"])
+    check.assert_clean()
+
+
+def test_bookings_and_payments(check, dataset, auth):
+    user = auth["user"]
+    address_id = dataset["address"]["id"]
+    check.call("GET", "/api/slots/availability", user, params={
+        "from": today().isoformat(), "to": (today() + timedelta(days=6)).isoformat(), "address_id": address_id})
+    booking = check.call("POST", "/api/bookings", user, json={
+        "address_id": address_id, "tank_type": "overhead", "tank_capacity": "1000",
+        "service_date": (today() + timedelta(days=4)).isoformat(), "service_time": "09:00",
+        "package_type": "manual", "payment_method": "cod"}).json()
+    check.call("GET", "/api/bookings", user)
+    check.call("GET", "/api/bookings", user, params={"view": "summary", "limit": 3})
+    check.call("GET", "/api/bookings/{booking_id}", user, booking_id=booking["id"])
+    check.call("PUT", "/api/bookings/{booking_id}/reschedule", user, params={
+        "service_date": (today() + timedelta(days=5)).isoformat(), "service_time": "12:00"}, booking_id=booking["id"])
+    check.call("POST", "/api/payments/create-order", user, json={"booking_id": booking["id"]})
+    check.call("POST", "/api/payments/verify", user, json={
+        "razorpay_order_id": "order_test", "razorpay_payment_id": "pay_test",
+        "razorpay_signature": signature(b"order_test|pay_test"), "booking_id": dataset["verify"]})
+    body = json.dumps({"event": "payment.captured",
+                       "payload": {"payment": {"entity": {"order_id": "order_test"}}}}).encode()
+    check.call("POST", "/api/payments/webhook", content=body, headers={
+        "Content-Type": "application/json", "X-Razorpay-Event-Id": "evt_test",
+        "X-Razorpay-Signature": signature(body)})
+    check.call("DELETE", "/api/bookings/{booking_id}", user, booking_id=booking["id"])
+    check.assert_clean()
+
+
+def test_field_team(check, dataset, auth):
+    tech = auth["technician"]
+    job_id = dataset["job"]
+    check.call("POST", "/api/field/register", json={
+        "email": "newtech@example.com", "password": PASSWORD, "name": "New Tech", "phone": "9000000003",
+        "employee_id": "EMP999", "base_lat": CENTER[0], "base_lng": CENTER[1]})
+    check.call("POST", "/api/field/login", json={"email": dataset["technician"]["email"], "password": PASSWORD})
+    check.call("GET", "/api/field/me", tech)
+    check.call("GET", "/api/field/jobs", tech)
+    check.call("GET", "/api/field/jobs/route", tech, params={"service_date": today().isoformat()})
+    check.call("GET", "/api/field/jobs/{job_id}", tech, job_id=job_id)
+    check.call("GET", "/api/field/stats", tech)
+    check.call("POST", "/api/field/jobs/{job_id}/start", tech, job_id=job_id)
+    check.call("PUT", "/api/field/jobs/{job_id}/checklist", tech, json={"step_name": "arrival", "status": "completed"},
+               job_id=job_id)
+    check.call("POST", "/api/field/jobs/{job_id}/checklist/batch", tech, json={"updates": [
+        {"step_name": "customer_verification", "status": "completed"},
+        {"step_name": "pre_inspection", "status": "completed"}]}, job_id=job_id)
+    check.call("POST", "/api/field/jobs/{job_id}/incident", tech, json={"description": "Hairline crack", "severity": "low"},
+               job_id=job_id)
+    photo = check.call("POST", "/api/field/upload-image", tech,
+                       files={"file": ("tank.jpg", sample_jpeg(), "image/jpeg")}).json()
+    blob_hash = photo["url"].rsplit("/", 1)[-1]
+    check.call("GET", "/api/media/{blob_hash}", blob_hash=blob_hash)
+    check.call("GET", "/api/media/{blob_hash}/thumbnail", blob_hash=blob_hash)
+    check.call("POST", "/api/field/jobs/{job_id}/complete", tech, json={
+        "before_photo_urls": [photo["url"]], "after_photo_urls": [photo["url"]],
+        "customer_signature": "signed"}, job_id=job_id)
+    check.assert_clean()
+
+
+def test_admin(check, app, dataset, auth):
+    admin = auth["admin"]
+    check.call("POST", "/api/admin/register", json={"email": "newadmin@example.com", "password": PASSWORD,
+                                                    "name": "New Admin"})
+    check.call("POST", "/api/admin/login", json={"email": dataset["admin"]["email"], "password": PASSWORD})
+    check.call("GET", "/api/admin/me", admin)
+    check.call("GET", "/api/admin/slow-queries", admin)
+    check.call("GET", "/api/admin/dashboard-stats", admin)
+    check.call("GET", "/api/admin/bookings", admin)
+    check.call("GET", "/api/admin/bookings", admin, params={"status": "confirmed"})
+    check.call("GET", "/api/admin/customers", admin)
+    check.call("GET", "/api/admin/field-teams", admin)
+    check.call("GET", "/api/admin/incidents", admin)
+    check.call("GET", "/api/admin/analytics", admin)
+    check.call("PUT", "/api/admin/bookings/{booking_id}/assign", admin,
+               json={"technician_id": dataset["technician"]["id"]}, booking_id=dataset["assign"])
+    check.call("PUT", "/api/admin/bookings/{booking_id}/status", admin, json={"status": "confirmed"},
+               booking_id=dataset["status"])
+    check.call("PUT", "/api/admin/bookings/{booking_id}/reschedule", admin, params={
+        "service_date": (today() + timedelta(days=6)).isoformat(), "service_time": "15:00"},
+        booking_id=dataset["reschedule"])
+    created = check.call("POST", "/api/admin/bookings/create", admin, params={"user_id": dataset["user"]["id"]}, json={
+        "address_id": dataset["address"]["id"], "tank_type": "underground", "tank_capacity": "2000",
+        "service_date": (today() + timedelta(days=7)).isoformat(), "service_time": "15:00",
+        "package_type": "automated", "payment_method": "cod"}).json()
+    check.call("DELETE", "/api/admin/bookings/{booking_id}", admin, booking_id=created["id"])
+    check.call("PUT", "/api/admin/field-teams/{team_id}/profile", admin, json={"max_jobs_per_day": 7},
+               team_id=dataset["technician"]["id"])
+    check.call("POST", "/api/admin/assignments/auto", admin,
+               params={"service_date": (today() + timedelta(days=1)).isoformat()})
+    check.call("PUT", "/api/admin/slots/capacity", admin, json={
+        "service_date": (today() + timedelta(days=8)).isoformat(), "service_time": "09:00",
+        "area": app.slots.service_area(dataset["address"]), "capacity": 3})
+    check.assert_clean()
+
+
+def test_metrics(check, auth):
+    for name in ("password-hashing", "payment-gateway", "events", "slow-queries"):
+        check.call("GET", f"/api/admin/metrics/{name}", auth["admin"])
+    check.call("GET", "/metrics")
+    check.assert_clean()
+
+
+def test_every_route_is_checked(plans, app):
+    from fastapi.routing import APIRoute
+
+    groups = {name for name, value in globals().items()
+              if name.startswith("test_") and callable(value) and name != "test_every_route_is_checked"}
+    if plans.groups != groups:
+        pytest.skip(f"not every route group ran: {sorted(groups - plans.groups)}")
+    routes = {(method, route.path) for route in app.app.routes if isinstance(route, APIRoute) for method in route.methods}
+    uncovered = sorted(routes - plans.exercised - set(EXEMPT_ROUTES))
+    assert not uncovered, "no case for " + ", ".join(f"{method} {path}" for method, path in uncovered)
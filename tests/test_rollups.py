@@ -0,0 +1,31 @@
+import pytest
+
+from rollups import bucket_of, summarize
+
+
+@pytest.mark.parametrize("day, bucket, expected", [
+    ("2025-03-05", "day", "2025-03-05"),
+    ("2025-03-05", "month", "2025-03"),
+    ("2025-03-05", "week", "2025-03-03"),  # a Wednesday; weeks start on Monday
+    ("2025-03-03", "week", "2025-03-03"),
+    ("2025-01-01", "week", "2024-12-30"),  # across a year boundary
+])
+def test_bucket_of(day, bucket, expected):
+    assert bucket_of(day, bucket) == expected
+
+
+def test_summarize_counts_only_paid_revenue():
+    rows = [
+        {"day": "2025-03-03", "package_type": "manual", "status": "completed", "payment_status": "completed", "count": 2, "amount": 300},
+        {"day": "2025-03-05", "package_type": "automated", "status": "confirmed", "payment_status": "completed", "count": 1, "amount": 500},
+        {"day": "2025-03-10", "package_type": "manual", "status": "pending", "payment_status": "pending", "count": 4, "amount": 600},
+    ]
+    summary = summarize(rows, "week")
+    assert summary["total_bookings"] == 7
+    assert summary["completed_bookings"] == 3
+    assert summary["revenue_by_package"] == {"manual": 300, "automated": 500}
+    assert summary["average_booking_value"] == 800 / 3
+    assert summary["series"] == [
+        {"period": "2025-03-03", "bookings": 3, "revenue": 800},
+        {"period": "2025-03-10", "bookings": 4, "revenue": 0},
+    ]
@@ -0,0 +1,49 @@
+from routing import JOB_DURATION_MINUTES, plan_route, slot_start_minutes
+
+ORIGIN = (12.97, 77.59)
+
+
+def stop(booking_id, service_time, lat=None, lng=None):
+    return {"booking_id": booking_id, "service_time": service_time, "lat": lat, "lng": lng}
+
+
+def order(stops):
+    return [s["booking_id"] for s in stops]
+
+
+def test_slots_are_visited_in_time_order():
+    stops = [stop("late", "14:00", 12.98, 77.60), stop("early", "08:00", 13.10, 77.70), stop("odd", "whenever", 12.97, 77.59)]
+    assert order(plan_route(ORIGIN, stops)) == ["early", "late", "odd"]
+
+
+def test_stops_in_a_slot_follow_the_shortest_path():
+    stops = [stop("far", "08:00", 13.00, 77.59), stop("near", "08:00", 12.98, 77.59), stop("mid", "08:00", 12.99, 77.59)]
+    assert order(plan_route(ORIGIN, stops)) == ["near", "mid", "far"]
+
+
+def test_unlocated_stops_go_last_in_their_slot():
+    stops = [stop("nowhere", "08:00"), stop("a", "08:00", 12.98, 77.59), stop("next", "11:00", 12.99, 77.59)]
+    planned = plan_route(ORIGIN, stops)
+    assert order(planned) == ["a", "nowhere", "next"]
+    assert planned[1]["distance_km"] is None
+
+
+def test_reoptimize_keeps_other_slots_in_place():
+    stops = [stop("far", "08:00", 13.00, 77.59), stop("near", "08:00", 12.98, 77.59),
+             stop("far2", "11:00", 13.00, 77.59), stop("near2", "11:00", 12.98, 77.59)]
+    assert order(plan_route(ORIGIN, stops, reoptimize={"11:00"})) == ["far", "near", "near2", "far2"]
+
+
+def test_etas_never_precede_the_slot_and_include_the_previous_job():
+    stops = [stop("a", "08:00", 12.98, 77.59), stop("b", "08:00", 12.99, 77.59), stop("c", "14:00", 13.00, 77.59)]
+    planned = plan_route(ORIGIN, stops)
+    assert [s["order"] for s in planned] == [1, 2, 3]
+    assert planned[0]["eta"] == "08:00"
+    assert slot_start_minutes(planned[1]["eta"]) >= 8 * 60 + JOB_DURATION_MINUTES + planned[1]["travel_minutes"] - 1
+    assert planned[2]["eta"] == "14:00"
+    assert not any(s["late"] for s in planned)
+
+
+def test_overbooked_slot_is_marked_late():
+    stops = [stop(f"b{i}", "08:00", 12.98 + i * 0.001, 77.59) for i in range(3)]
+    assert [s["late"] for s in plan_route(ORIGIN, stops)] == [False, False, True]
@@ -0,0 +1,111 @@
+import asyncio
+from datetime import date
+
+import pytest
+
+import slots
+from slots import SLOT_CAPACITY, SlotFull, slot_id
+
+SLOT = ("2030-01-07", "09:00", "12.75,77.50")
+
+
+async def counter(db):
+    return await db.slots.find_one({"_id": slot_id(*SLOT)}, {"_id": 0, "capacity": 1, "reserved": 1})
+
+
+def test_first_reservation_creates_the_counter(run_db):
+    async def test(db):
+        await slots.reserve(db, *SLOT)
+        return await db.slots.find_one({"_id": slot_id(*SLOT)})
+
+    assert run_db(test) == {"_id": slot_id(*SLOT), "service_date": SLOT[0], "service_time": SLOT[1],
+                            "area": SLOT[2], "capacity": SLOT_CAPACITY, "reserved": 1}
+
+
+def test_full_slot(run_db):
+    async def test(db):
+        await slots.set_capacity(db, *SLOT, 2)
+        await slots.reserve(db, *SLOT)
+        await slots.reserve(db, *SLOT)
+        with pytest.raises(SlotFull):
+            await slots.reserve(db, *SLOT)
+        return await counter(db)
+
+    assert run_db(test) == {"capacity": 2, "reserved": 2}
+
+
+def test_concurrent_first_reservations_respect_capacity(run_db):
+    async def test(db):
+        results = await asyncio.gather(*(slots.reserve(db, *SLOT) for _ in range(SLOT_CAPACITY + 3)),
+                                       return_exceptions=True)
+        return results, await counter(db)
+
+    results, after = run_db(test)
+    assert sum(isinstance(r, SlotFull) for r in results) == 3
+    assert not [r for r in results if r is not None and not isinstance(r, SlotFull)]
+    assert after == {"capacity": SLOT_CAPACITY, "reserved": SLOT_CAPACITY}
+
+
+def test_force_overbooks(run_db):
+    async def test(db):
+        await slots.set_capacity(db, *SLOT, 1)
+        await slots.reserve(db, *SLOT)
+        await slots.reserve(db, *SLOT, force=True)
+        first = await counter(db)
+        await slots.reserve(db, "2030-01-08", "09:00", SLOT[2], force=True)
+        created = await db.slots.find_one({"_id": slot_id("2030-01-08", "09:00", SLOT[2])}, {"_id": 0, "reserved": 1})
+        return first, created
+
+    assert run_db(test) == ({"capacity": 1, "reserved": 2}, {"reserved": 1})
+
+
+def test_unreserve_stops_at_zero(run_db):
+    async def test(db):
+        await slots.reserve(db, *SLOT)
+        await slots.unreserve(db, *SLOT)
+        await slots.unreserve(db, *SLOT)
+        return await counter(db)
+
+    assert run_db(test)["reserved"] == 0
+
+
+def test_set_capacity_keeps_reservations(run_db):
+    async def test(db):
+        await slots.set_capacity(db, *SLOT, 3)
+        created = await counter(db)
+        await slots.reserve(db, *SLOT)
+        await slots.set_capacity(db, *SLOT, 1)
+        return created, await counter(db)
+
+    assert run_db(test) == ({"capacity": 3, "reserved": 0}, {"capacity": 1, "reserved": 1})
+
+
+def test_release_and_reclaim_are_idempotent(run_db):
+    async def test(db):
+        await slots.set_capacity(db, *SLOT, 1)
+        await slots.reserve(db, *SLOT)
+        await db.bookings.insert_one({"id": "b1", "service_date": SLOT[0], "service_time": SLOT[1],
+                                      "service_area": SLOT[2], "slot_reserved": True})
+        await slots.release_booking(db, "b1")
+        await slots.release_booking(db, "b1")
+        released = await counter(db)
+        await slots.reserve(db, *SLOT)
+        # Reopening takes the place back even though the slot filled up meanwhile
+        await slots.reclaim_booking(db, "b1")
+        await slots.reclaim_booking(db, "b1")
+        booking = await db.bookings.find_one({"id": "b1"}, {"_id": 0, "slot_reserved": 1})
+        return released, await counter(db), booking
+
+    assert run_db(test) == ({"capacity": 1, "reserved": 0}, {"capacity": 1, "reserved": 2}, {"slot_reserved": True})
+
+
+def test_availability_defaults_missing_counters(run_db):
+    async def test(db):
+        await slots.set_capacity(db, *SLOT, 2)
+        await slots.reserve(db, *SLOT)
+        return await slots.availability(db, SLOT[2], date(2030, 1, 7), date(2030, 1, 8))
+
+    days = run_db(test)
+    assert len(days) == 2 * len(slots.SERVICE_SLOTS)
+    assert days[0] == {"service_date": SLOT[0], "service_time": SLOT[1], "capacity": 2, "reserved": 1, "available": 1}
+    assert all(d["available"] == SLOT_CAPACITY for d in days[1:])
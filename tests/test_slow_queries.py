@@ -0,0 +1,62 @@
+import json
+
+from slow_queries import command_shape, shape_of, summarize_plan
+
+
+def test_shape_of_drops_values():
+    assert shape_of({"user_id": "u1", "created_at": {"$gte": 5}}) == {"user_id": 1, "created_at": {"$gte": 1}}
+
+
+def test_shape_of_collapses_like_list_items():
+    assert shape_of({"id": {"$in": ["a", "b", "c"]}}) == {"id": {"$in": [1]}}
+    assert shape_of([{"a": 1}, {"b": 2}, {"a": 3}]) == [{"a": 1}, {"b": 1}]
+
+
+def test_command_shape_uses_only_query_fields():
+    find = {"find": "bookings", "filter": {"user_id": "u1"}, "sort": {"created_at": -1}, "limit": 20}
+    assert json.loads(command_shape("find", find)) == {"filter": {"user_id": 1}, "sort": {"created_at": 1}}
+    update = {"update": "bookings", "updates": [{"q": {"id": "b1"}, "u": {"$set": {"status": "x"}}}]}
+    assert json.loads(command_shape("update", update)) == {"q": {"id": 1}}
+
+
+def explain(winning_plan, **stats):
+    return {"queryPlanner": {"winningPlan": winning_plan, "rejectedPlans": [{"stage": "COLLSCAN"}]},
+            "executionStats": stats}
+
+
+def test_summarize_index_scan():
+    plan = explain(
+        {"stage": "LIMIT", "inputStage": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "user_id_1"}}},
+        nReturned=20, totalDocsExamined=20, totalKeysExamined=20, executionStages={"stage": "LIMIT"},
+    )
+    assert summarize_plan(plan) == {
+        "stages": ["LIMIT", "FETCH", "IXSCAN"], "indexes": ["user_id_1"], "collscan": False,
+        "docs_examined": 20, "keys_examined": 20, "returned": 20,
+    }
+
+
+def test_summarize_collection_scan():
+    plan = explain({"stage": "COLLSCAN"}, nReturned=1, totalDocsExamined=5000, totalKeysExamined=0)
+    summary = summarize_plan(plan)
+    assert summary["collscan"] is True
+    assert summary["docs_examined"] == 5000
+
+
+def test_summarize_counts_and_writes_report_matched_documents():
+    count = explain({"stage": "COUNT_SCAN", "indexName": "status_1"}, nReturned=0,
+                    executionStages={"stage": "COUNT", "nCounted": 42})
+    assert summarize_plan(count)["returned"] == 42
+    update = explain({"stage": "UPDATE", "inputStage": {"stage": "IXSCAN", "indexName": "id_1"}}, nReturned=0,
+                     executionStages={"stage": "UPDATE", "nMatched": 1})
+    assert summarize_plan(update)["returned"] == 1
+
+
+def test_summarize_aggregate_with_lookup_scan():
+    # Aggregations nest the plan under the $cursor stage
+    plan = {"stages": [
+        {"$cursor": explain({"stage": "IXSCAN", "indexName": "status_1"}, nReturned=10)},
+        {"$lookup": {"from": "users"}, "collectionScans": 10},
+    ]}
+    summary = summarize_plan(plan)
+    assert summary["indexes"] == ["status_1"]
+    assert summary["collscan"] is True